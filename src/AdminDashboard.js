@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import { Card, Col, Row, Tabs, Calendar, Button, Drawer, Typography, Spin } from "antd"; // Import Spin
 import dayjs from "dayjs";
 import { toast } from "sonner";
@@ -8,13 +8,17 @@ const { TabPane } = Tabs;
 const { Title, Text } = Typography;
 
 // Component to display heatmap - you'll need to create this
-// Based on previous discussion, this will take heatmap_data (list of points)
-// and video_dimensions to draw on a court image.
+// It takes heatmapGrid (a res x res grid of counts from the /heatmap endpoint; older
+// results give heatmap_data, a list of points, instead) and video_dimensions to draw
+// on a court image.
 import HeatmapDisplay from './HeatmapDisplay'; // <--- CREATE THIS COMPONENT
 
 // Base URL for your Flask backend
 const API_BASE_URL = 'http://127.0.0.1:5000/api'; // Adjust if your Flask app runs on a different port/host
 
+const ANALYSIS_POLL_INTERVAL_MS = 2000; // How often to check on a queued/running analysis
+const HEATMAP_RESOLUTION = 64; // Heatmap cells per side; the backend serves 16, 32, 64 or 128
+
 const COURTS = ["Court 1", "Court 2"];
 
 // Define mock data structure - adjust based on your backend's /api/courts response
@@ -54,6 +58,9 @@ const AdminDashboard = () => {
   const [analysisData, setAnalysisData] = useState(null);
   const [analysisError, setAnalysisError] = useState(null);
   const [isAnalyzing, setIsAnalyzing] = useState({}); // State to track if analysis is pending for a session_id {session_id: true/false}
+  const [liveData, setLiveData] = useState(null); // Latest rolling snapshot of a live session
+  const liveSourceRef = useRef(null); // EventSource of the live session shown in the drawer
+  const [backfillLoading, setBackfillLoading] = useState(false);
 
 
   const fetchCourts = async () => {
@@ -97,15 +104,31 @@ const AdminDashboard = () => {
 
       try {
           // --- Step 1: Trigger Analysis on Backend ---
-          // The backend endpoint will run the script and save results.
-          // We configured the backend to wait for the script to finish before responding.
+          // The backend queues the job and answers 202 right away; a worker runs the script.
           const triggerResponse = await axios.post(`${API_BASE_URL}/analyze_booking/${slot.session_id}`);
           toast.success(triggerResponse.data.message || "Analysis triggered successfully.");
 
-          // --- Step 2: Fetch Results from Backend ---
-          // Since backend waits, results should be available immediately after trigger success.
-          const resultsResponse = await axios.get(`${API_BASE_URL}/analysis_results/${slot.session_id}`);
-          setAnalysisData(resultsResponse.data); // Set the fetched analysis data
+          // --- Step 2: Poll for Results ---
+          // The results endpoint answers 202 (with progress) until the job has finished.
+          let resultsResponse = await axios.get(`${API_BASE_URL}/analysis_results/${slot.session_id}`);
+          while (resultsResponse.status === 202) {
+              await new Promise(resolve => setTimeout(resolve, ANALYSIS_POLL_INTERVAL_MS));
+              resultsResponse = await axios.get(`${API_BASE_URL}/analysis_results/${slot.session_id}`);
+          }
+          const analysisSummary = resultsResponse.data;
+
+          // --- Step 3: Fetch the heatmap grid ---
+          // The backend bins player positions during analysis and serves a fixed-size grid,
+          // so this download doesn't grow with the match length.
+          // (Results saved by older versions include the raw points as heatmap_data instead.)
+          if (!analysisSummary.heatmap_data && analysisSummary.columns?.player_detections) {
+              const heatmapResponse = await axios.get(
+                  `${API_BASE_URL}/analysis_results/${slot.session_id}/heatmap`,
+                  { params: { res: HEATMAP_RESOLUTION } }
+              );
+              analysisSummary.heatmap_grid = heatmapResponse.data;
+          }
+          setAnalysisData(analysisSummary); // Set the fetched analysis data
 
 
       } catch (err) {
@@ -120,6 +143,82 @@ const AdminDashboard = () => {
   };
 
 
+  // Queue every past session of the selected date that has no results yet. The backend picks
+  // each session's analysis mode so the whole batch is done by its deadline (next morning by default).
+  const handleBackfill = async () => {
+      setBackfillLoading(true);
+      try {
+          const date = selectedDate.format("YYYY-MM-DD");
+          const response = await axios.post(`${API_BASE_URL}/backfill`, { from: date, to: date });
+          const { queued, fits, estimated_seconds, deadline } = response.data;
+          const minutes = Math.ceil(estimated_seconds / 60);
+          if (queued === 0) {
+              toast("No past sessions without results.");
+          } else if (fits) {
+              toast.success(`${queued} session(s) queued, done in about ${minutes} min (deadline ${deadline}).`);
+          } else {
+              toast.warning(`${queued} session(s) queued, but they need about ${minutes} min and may miss the ${deadline} deadline.`);
+          }
+      } catch (err) {
+          console.error("Error scheduling backfill:", err);
+          toast.error(`Backfill failed: ${err.response?.data?.error || err.message}`);
+      } finally {
+          setBackfillLoading(false);
+      }
+  };
+
+
+  const stopLiveUpdates = () => {
+      if (liveSourceRef.current) {
+          liveSourceRef.current.close();
+          liveSourceRef.current = null;
+      }
+  };
+
+  // Close the live stream if the dashboard unmounts while it is open
+  useEffect(() => stopLiveUpdates, []);
+
+  const handleWatchLive = async (slot) => {
+      stopLiveUpdates();
+      setAnalysisSessionId(slot.session_id);
+      setAnalysisDrawerOpen(true);
+      setAnalysisData(null);
+      setAnalysisError(null);
+      setLiveData({ status: "starting" });
+
+      try {
+          // --- Step 1: Start (or join) live analysis on the backend ---
+          await axios.post(`${API_BASE_URL}/live/${slot.session_id}`);
+
+          // --- Step 2: Subscribe to rolling results ---
+          // The backend pushes a snapshot (shots, rallies, recent heatmap) about once a second
+          // over Server-Sent Events, so there is nothing to poll.
+          const source = new EventSource(`${API_BASE_URL}/live/${slot.session_id}/events`);
+          source.onmessage = (event) => {
+              const snapshot = JSON.parse(event.data);
+              setLiveData(snapshot);
+              if (snapshot.status === "finished" || snapshot.status === "failed") {
+                  stopLiveUpdates(); // Otherwise EventSource reconnects when the stream ends
+              }
+          };
+          source.onerror = () => {
+              // EventSource retries by itself; only give up once the stream is closed for good
+              if (source.readyState === EventSource.CLOSED) {
+                  setAnalysisError("Lost the connection to the live analysis.");
+                  stopLiveUpdates();
+              }
+          };
+          liveSourceRef.current = source;
+      } catch (err) {
+          console.error("Error starting live analysis:", err);
+          const errorMessage = err.response?.data?.error || err.message || "Could not start live analysis.";
+          setLiveData(null);
+          setAnalysisError(errorMessage);
+          toast.error(`Live analysis failed: ${errorMessage}`);
+      }
+  };
+
+
   const handleCardClick = (index, slot) => {
       // Expand/collapse card
       const newExpandedIndex = index === expandedSlotIndex ? null : index;
@@ -137,6 +236,8 @@ const AdminDashboard = () => {
   };
 
   const handleDrawerClose = () => {
+      stopLiveUpdates(); // The backend keeps analysing; reopening the drawer rejoins it
+      setLiveData(null);
       setAnalysisDrawerOpen(false);
       setAnalysisSessionId(null); // Clear session ID when closing drawer
       setAnalysisData(null); // Clear analysis data
@@ -151,6 +252,9 @@ const AdminDashboard = () => {
   return (
     <div style={{ padding: 24 }}>
       <Title level={2}>Admin Dashboard</Title>
+      <Button onClick={handleBackfill} loading={backfillLoading} style={{ marginBottom: 16 }}>
+        Analyze All Past Sessions
+      </Button>
       {/* Use court ID or a stable key if possible for Tabs */}
       <Tabs activeKey={selectedCourtKey} onChange={setSelectedCourtKey} style={{ marginBottom: 16 }}>
         {courts.map(court => (
@@ -168,6 +272,7 @@ const AdminDashboard = () => {
                .map((slot, index) => {
               // Determine if analyze button should show
               const showAnalyzeButton = slot.status === "Booked" && slot.is_past && slot.session_id;
+              const showLiveButton = slot.status === "Booked" && !slot.is_past && slot.session_id;
               const isExpanded = expandedSlotIndex === index;
               // Simple check if the start time is before the current hour
               const slotStartTime = dayjs(selectedDate).hour(slot.startHour).minute(0).second(0);
@@ -220,7 +325,19 @@ const AdminDashboard = () => {
                     {isExpanded && slot.status === "Booked" && slot.is_past && !showAnalyzeButton && (
                          <Text type="secondary" style={{ marginTop: 12, display: 'block' }}>Analysis unavailable or not applicable.</Text>
                     )}
-                     {isExpanded && slot.status === "Booked" && !slot.is_past && (
+                    {isExpanded && showLiveButton && (
+                      <Button
+                        block
+                        style={{ marginTop: 12 }}
+                        onClick={(e) => {
+                            e.stopPropagation(); // Prevent card click from collapsing when button is clicked
+                            handleWatchLive(slot);
+                        }}
+                      >
+                       Watch Live
+                      </Button>
+                    )}
+                     {isExpanded && slot.status === "Booked" && !slot.is_past && !showLiveButton && (
                           <Text type="secondary" style={{ marginTop: 12, display: 'block' }}>Ongoing or Upcoming Booking.</Text>
                      )}
                   </Card>
@@ -243,7 +360,44 @@ const AdminDashboard = () => {
         width={720} // Adjust drawer width
         destroyOnClose={true} // Clean up components inside on close
       >
-        {analysisLoading ? (
+        {liveData && !analysisError ? (
+            <div>
+                <Title level={4}>Live Analysis for Session {analysisSessionId}</Title>
+                {liveData.status === "starting" ? (
+                    <div style={{ textAlign: 'center', padding: '20px' }}>
+                       <Spin size="large" />
+                       <Title level={4} style={{marginTop: 16}}>Connecting to the court camera...</Title>
+                    </div>
+                ) : (
+                    <>
+                        <Card style={{marginBottom: 24}}>
+                            <Title level={5}>
+                                {liveData.status === "running" ? "Live" : liveData.status === "failed" ? "Live analysis stopped" : "Session ended"}
+                                {liveData.video_time !== undefined && ` - ${Math.floor(liveData.video_time / 60)}:${String(Math.floor(liveData.video_time % 60)).padStart(2, "0")}`}
+                            </Title>
+                            <p>Total Shots Detected: <Text strong>{liveData.total_shots}</Text></p>
+                            <p>Rallies: <Text strong>{liveData.rallies}</Text>{liveData.rally_in_progress && <Text type="secondary"> (rally in progress)</Text>}</p>
+                            {/* Frames skipped to stay within the latency budget, and how far behind the camera the analysis is */}
+                            <Text type="secondary">
+                                Frames dropped: {liveData.frames_dropped ?? 0} - Latency: {(liveData.latency_seconds ?? 0).toFixed(2)}s
+                            </Text>
+                        </Card>
+
+                        <Card>
+                             <Title level={5}>Player Positions (last {Math.round(liveData.heatmap?.window_seconds ?? 0)}s)</Title>
+                             {liveData.heatmap && liveData.video_dimensions ? (
+                                 <HeatmapDisplay
+                                     heatmapGrid={liveData.heatmap} // {res, total, max, grid} over the recent window
+                                     videoDimensions={liveData.video_dimensions} // {width, height}
+                                 />
+                             ) : (
+                                 <Text type="secondary">No player position data yet.</Text>
+                             )}
+                        </Card>
+                    </>
+                )}
+            </div>
+        ) : analysisLoading ? (
             <div style={{ textAlign: 'center', padding: '20px' }}>
                <Spin size="large" />
                <Title level={4} style={{marginTop: 16}}>Analyzing video...</Title>
@@ -262,15 +416,17 @@ const AdminDashboard = () => {
                 <Card style={{marginBottom: 24}}>
                     <Title level={5}>Summary</Title>
                     <p>Total Shots Detected: <Text strong>{analysisData.total_shots}</Text></p>
+                    {analysisData.rallies && <p>Rallies: <Text strong>{analysisData.rallies.length}</Text></p>}
                     {/* Add other summary stats here if available */}
                 </Card>
 
                 <Card>
                      <Title level={5}>Player Position Heatmap</Title>
-                     {/* Pass heatmap_data and video_dimensions to HeatmapDisplay */}
-                     {analysisData.heatmap_data && analysisData.video_dimensions ? (
+                     {/* Pass the heatmap grid (or raw heatmap_data from older results) and video_dimensions to HeatmapDisplay */}
+                     {(analysisData.heatmap_grid || analysisData.heatmap_data) && analysisData.video_dimensions ? (
                          <HeatmapDisplay
-                             playerPositions={analysisData.heatmap_data} // List of {x, y, conf}
+                             heatmapGrid={analysisData.heatmap_grid} // {res, total, max, grid: res x res counts}
+                             playerPositions={analysisData.heatmap_data} // List of {x, y, conf}, older results only
                              videoDimensions={analysisData.video_dimensions} // {width, height}
                          />
                      ) : (
@@ -3,147 +3,436 @@ import cv2
 import numpy as np
 import pandas as pd
 # import matplotlib.pyplot as plt # We won't use matplotlib for the final output
-from ultralytics import YOLO
-from collections import defaultdict
+import importlib
+import os
 import sys
 import json # Import json library
+import argparse
+import time
+from video_pipeline import FrameBatchReader, new_stage_stats, record_stage, run_pipelined, run_serial
+from checkpoints import DEFAULT_CHECKPOINT_FRAMES
+from frame_sampling import AdaptiveSampler, frame_ranges, interpolate_player_columns
+from player_tracking import track_players
+from ball_tracking import detect_rallies
+from box_postprocessing import DetectionColumns, collect_batch_detections
+from heatmap import heatmap_summary, heatmaps_from_columns
+from profiling import peak_rss_bytes, reset_peak_rss, timed
+from result_store import save_results, to_json_compatible
 
-# Load models outside the processing function if possible, or handle reloading
-# In a simple script run via subprocess, loading here is fine.
-try:
-    # Adjust paths as necessary
-    player_model = YOLO("yolov8n.pt")
-    ball_model = YOLO("models/ball_detect/best.pt")
-    models_loaded = True
-except Exception as e:
-    print(json.dumps({"error": f"Failed to load models: {e}"}), file=sys.stderr)
-    sys.exit(1) # Exit if models can't load
-
-def analyze_pickleball_video(video_path):
+# Adjust paths as necessary (relative to this script's directory)
+PLAYER_MODEL_PATH = "yolov8n.pt"
+BALL_MODEL_PATH = "models/ball_detect/best.pt"
+
+# Models are loaded once per process and reused for every video analysed by it.
+# A one-shot CLI run loads them once; model_server.py keeps a process (and so the
+# loaded models) alive across many videos.
+_loaded_models = None
+
+# Environment variable naming an alternative model loader, see get_models
+MODEL_LOADER_ENV = "ANALYSIS_MODEL_LOADER"
+
+def load_models(player_model_path=PLAYER_MODEL_PATH, ball_model_path=BALL_MODEL_PATH):
+    """
+    Loads the player and ball YOLO models, run by the backend ANALYSIS_MODEL_BACKEND selects:
+    the PyTorch weights by default, or their cached ONNX/OpenVINO export (see model_backends.py).
+
+    Returns:
+        tuple: (player_model, ball_model)
+    """
+    # Imported here so that importing this module (e.g. from app.py) doesn't pay for torch
+    from model_backends import BACKEND_PYTORCH, backend_config, load_backend_models
+    config = backend_config() or {"backend": BACKEND_PYTORCH, "int8": False}
+    return load_backend_models(player_model_path, ball_model_path, config["backend"], config["int8"])
+
+def get_models():
+    """
+    Returns the process-wide (player_model, ball_model) pair, loading it on first use.
+
+    If MODEL_LOADER_ENV is set to "module:function", that function is called instead of
+    load_models (e.g. "benchmark:load_stub_models"). It is read from the environment so the
+    segment processes of a parallel analysis, which inherit it, load the same models.
+    """
+    global _loaded_models
+    if _loaded_models is None:
+        loader = os.environ.get(MODEL_LOADER_ENV)
+        if loader:
+            module_name, function_name = loader.split(":")
+            _loaded_models = getattr(importlib.import_module(module_name), function_name)()
+        else:
+            _loaded_models = load_models()
+    return _loaded_models
+
+class AnalysisCancelled(Exception):
+    """Raised by a progress callback to stop an analysis part-way through."""
+
+# How often (in frames) progress is reported while analysing
+PROGRESS_EVERY_N_FRAMES = 30
+
+# Frames per model call, see the README for the throughput/latency trade-off
+DEFAULT_BATCH_SIZE = 1
+
+# Capacity (in batches) of each queue between pipeline stages in pipelined mode
+DEFAULT_PIPELINE_QUEUE_SIZE = 4
+
+# Frame sampling modes: None = run the models on every frame
+SAMPLING_ADAPTIVE = "adaptive"
+
+def report_progress_to_stderr(frames_done, frames_total):
+    """Progress callback for CLI runs; job_queue.py parses these lines."""
+    print(f"PROGRESS {frames_done} {frames_total}", file=sys.stderr, flush=True)
+
+def analyze_pickleball_video(video_path, player_model=None, ball_model=None, progress_callback=None,
+                             batch_size=DEFAULT_BATCH_SIZE, pipelined=False,
+                             pipeline_queue_size=DEFAULT_PIPELINE_QUEUE_SIZE, sampling=None, workers=1,
+                             checkpoint_dir=None, checkpoint_frames=DEFAULT_CHECKPOINT_FRAMES, profile=False):
     """
     Analyzes a pickleball video to detect shots and player positions.
 
     Args:
         video_path (str): Path to the video file.
+        player_model, ball_model (optional): Already loaded YOLO models. Defaults to the
+              process-wide models from get_models().
+        progress_callback (callable, optional): Called as progress_callback(frames_done, frames_total)
+              every PROGRESS_EVERY_N_FRAMES frames and once at the end. It may raise
+              AnalysisCancelled to abort the analysis.
+        batch_size (int): Number of frames decoded and sent to each model per predict() call.
+              1 is the original frame-at-a-time path. Larger batches amortize per-call overhead
+              and use more CPU threads/SIMD lanes per call, at the cost of batch_size decoded
+              frames of memory and results arriving batch_size frames later.
+        pipelined (bool): Run decoding, inference and aggregation on separate threads joined
+              by bounded queues (see video_pipeline.py). Results are identical to the serial path.
+        pipeline_queue_size (int): Batches each queue between pipeline stages can hold.
+        sampling (str, optional): None runs the models on every frame. "adaptive" runs them
+              only on frames picked by frame_sampling.AdaptiveSampler (dense during rallies,
+              sparse when the court is idle) and interpolates player positions in between.
+        workers (int): Values above 1 split the video into keyframe-aligned time segments
+              analysed by a pool of that many processes, each with its own models (see
+              parallel_analysis.py). player_model/ball_model are not used in that case.
+        checkpoint_dir (str, optional): Save the detections of every checkpoint_frames frames
+              in this directory as they finish, and resume from them on a later run with the
+              same directory (see checkpoints.py). This also extends the analysis of a recording
+              that has grown since the last run, analysing only the new footage.
+        checkpoint_frames (int): Frames per checkpoint segment.
+        profile (bool): Add a "profile" block to the results: wall time, overall frames per
+              second, time spent in each post-processing step and peak RSS (see build_profile).
+              Per-stage pipeline timings are always in "stage_stats".
 
     Returns:
-        dict: Dictionary containing analysis results (e.g., total_shots, player_positions).
+        dict: Dictionary containing analysis results (e.g., total_shots, rallies, per-player
+              movement stats in "players" (see player_tracking.py), and the
+              player_detections/ball_detections columns described in result_store.py).
               Returns None or raises exception on failure.
     """
+    options = {
+        "batch_size": batch_size,
+        "pipelined": pipelined,
+        "pipeline_queue_size": pipeline_queue_size,
+        "sampling": sampling,
+    }
+    started = time.perf_counter()
+    if profile:
+        reset_peak_rss() # Report this analysis's peak, not the process's (e.g. a resident model server)
+    # Size when the analysis started, so a caller can tell whether a recording has grown since
+    video_size_bytes = os.path.getsize(video_path) if os.path.exists(video_path) else None
+    if checkpoint_dir is not None:
+        from checkpoints import detect_with_checkpoints
+        detections = detect_with_checkpoints(
+            video_path, checkpoint_dir, segment_frames=checkpoint_frames, workers=workers,
+            player_model=player_model, ball_model=ball_model, progress_callback=progress_callback, **options
+        )
+    elif workers > 1:
+        from parallel_analysis import detect_video_in_segments
+        detections = detect_video_in_segments(video_path, workers, progress_callback=progress_callback, **options)
+    else:
+        if player_model is None or ball_model is None:
+            default_player_model, default_ball_model = get_models()
+            if player_model is None:
+                player_model = default_player_model
+            if ball_model is None:
+                ball_model = default_ball_model
+        detections = detect_video_range(
+            video_path, player_model, ball_model, progress_callback=progress_callback, **options
+        )
+
+    if "error" in detections:
+        return detections
+
+    if progress_callback is not None:
+        progress_callback(detections["frames_read"], detections["frames_read"])
+
+    timings = {}
+    results = build_results(detections, sampling, timings=timings)
+    results["video_size_bytes"] = video_size_bytes
+    if profile:
+        results["profile"] = build_profile(detections, timings, time.perf_counter() - started)
+    return results
+
+def open_video_at(video_path, start_frame=0):
+    """
+    Opens a video positioned so the next read() returns frame `start_frame` (0-based).
+
+    Returns:
+        cv2.VideoCapture: The opened capture, or None if the file can't be opened.
+    """
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
+        return None
+    if start_frame > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != start_frame:
+            # The container can't seek exactly; fall back to skipping frames from the start
+            cap.release()
+            cap = cv2.VideoCapture(video_path)
+            for _ in range(start_frame):
+                if not cap.grab():
+                    break
+    return cap
+
+def detect_video_range(video_path, player_model, ball_model, start_frame=0, max_frames=None,
+                       progress_callback=None, batch_size=DEFAULT_BATCH_SIZE, pipelined=False,
+                       pipeline_queue_size=DEFAULT_PIPELINE_QUEUE_SIZE, sampling=None):
+    """
+    Runs both models over a range of a video and returns the raw detections.
+
+    Frame numbers in the output are global (1-based from the start of the video) whatever
+    start_frame is, so detections from several ranges can be merged directly.
+
+    Args:
+        start_frame (int): 0-based index of the first frame to analyse.
+        max_frames (int, optional): Number of frames to analyse (default: up to the end).
+        progress_callback (callable, optional): Called as progress_callback(frames_done, frames_total)
+              with counts relative to this range.
+        Other arguments as for analyze_pickleball_video.
+
+    Returns:
+        dict: player_detections and ball_detections (frame, x, y, conf columns in frame order,
+              see box_postprocessing.py), inferred_frames, frames_read, stage_stats, fps,
+              video_dimensions and total_frames; or {"error": ...}.
+    """
+    cap = open_video_at(video_path, start_frame)
+    if cap is None:
         return {"error": f"Could not open video file: {video_path}"}
 
     fps = cap.get(cv2.CAP_PROP_FPS)
     frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) # Container estimate, may be 0 for some formats
+    range_frames = max_frames if max_frames is not None else max(total_frames - start_frame, 0)
 
-    player_positions = defaultdict(list)
-    ball_positions_list = [] # Store ball positions as a list of (frame, x, y)
-    frame_idx = 0
-    total_shots = 0 # Let's refine this based on ball hits/bounces later if needed
+    # Player and ball centres, appended a batch at a time to growable NumPy columns
+    player_columns = DetectionColumns("player_detections")
+    ball_columns = DetectionColumns("ball_detections")
 
-    # Note: The current ball detection logic mostly just tells you a ball was seen,
-    # not necessarily a 'shot'. Detecting actual shots (hits) is more complex.
-    # For now, let's count instances where a ball is detected for simplicity.
-    # A better approach would involve tracking the ball and detecting changes in velocity/direction.
+    # Ball detections are only positions; shots, bounces and rallies are derived from them
+    # in build_results by ball_tracking.detect_rallies.
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    # Frames are decoded straight into preallocated (batch_size, H, W, 3) buffers and each
+    # model runs once per batch; result i of a batch belongs to frame batch_start + i.
+    reader = FrameBatchReader(cap, batch_size, start_frame=start_frame, max_frames=max_frames)
 
-        frame_idx += 1
+    # Adaptive sampling: a cheap motion score decides which frames the models run on
+    sampler = AdaptiveSampler() if sampling == SAMPLING_ADAPTIVE else None
+    inferred_frames = []
 
-        # Process every Nth frame to speed things up if needed
-        # if frame_idx % 5 != 0:
-        #     continue
+    # Pipeline stage timings, plus the model calls and box conversion inside them
+    stage_stats = new_stage_stats()
 
+    def infer_batch(batch_start, frames):
+        offsets = range(len(frames))
+        if sampler is not None:
+            offsets = [offset for offset in offsets if sampler.should_infer(batch_start + offset, frames[offset])]
+            if not offsets:
+                return None
+        # Views into the batch buffer, no copies
+        frame_list = [frames[offset] for offset in offsets]
         try:
-            # Player detection
-            player_results = player_model.predict(frame, verbose=False)[0] # verbose=False to reduce subprocess noise
-            if player_results.boxes is not None:
-                for box in player_results.boxes.data:
-                    x1, y1, x2, y2, conf, cls = box.cpu().numpy()
-                    if int(cls) == 0: # Assuming class 0 is 'person' in yolov8n
-                        cx = int((x1 + x2) / 2)
-                        cy = int((y1 + y2) / 2)
-                        # Store relative positions (0-1) for flexibility, or raw pixels
-                        # Let's stick to raw pixels for now, but note this is screen-resolution dependent
-                        player_positions[frame_idx].append({"x": cx, "y": cy, "conf": float(conf)}) # Store as dict for JSON
-
-
-            # Ball detection
-            ball_results = ball_model.predict(frame, verbose=False)[0]
-            if ball_results.boxes is not None:
-                for box in ball_results.boxes.data:
-                    x1_ball, y1_ball, x2_ball, y2_ball, conf_ball, cls_ball = box.cpu().numpy()
-                    if int(cls_ball) == 0: # Assuming class 0 is 'ball' in your custom model
-                        ball_cx = int((x1_ball + x2_ball) / 2)
-                        ball_cy = int((y1_ball + y2_ball) / 2)
-                        ball_positions_list.append({"frame": frame_idx, "x": ball_cx, "y": ball_cy, "conf": float(conf_ball)})
-                        # Simple shot count: increment each time a ball is detected with high confidence?
-                        # Or maybe when ball changes direction significantly? This needs proper tracking.
-                        # For now, let's count detections in separate frames above a threshold.
-                        if float(conf_ball) > 0.5: # Example confidence threshold
-                             total_shots += 1 # This is a very crude shot count
-
-                        break # Assume only one ball per frame
-
+            started = time.perf_counter()
+            player_results_batch = player_model.predict(frame_list, verbose=False) # verbose=False to reduce subprocess noise
+            record_stage(stage_stats["player_model"], len(frame_list), started)
+            started = time.perf_counter()
+            ball_results_batch = ball_model.predict(frame_list, verbose=False)
+            record_stage(stage_stats["ball_model"], len(frame_list), started)
         except Exception as e:
-             # Log frame-specific errors but continue processing if possible
-             print(f"Error processing frame {frame_idx}: {e}", file=sys.stderr)
+             # Log batch errors but continue processing if possible
+             print(f"Error processing frames {batch_start}-{batch_start + len(frames) - 1}: {e}", file=sys.stderr)
+             return None
+        return offsets, player_results_batch, ball_results_batch
 
+    def aggregate_batch(batch_start, count, output):
+        if output is not None:
+            started = time.perf_counter()
+            offsets, player_results_batch, ball_results_batch = output
+            frame_numbers = [batch_start + offset for offset in offsets]
+            inferred_frames.extend(frame_numbers)
+            try:
+                # One host copy of each model's boxes per batch, then array filtering and centres
+                collect_batch_detections(
+                    frame_numbers, player_results_batch, ball_results_batch, player_columns, ball_columns
+                )
+            except Exception as e:
+                 # Log batch errors but continue processing if possible
+                 print(f"Error processing detections of frames {frame_numbers[0]}-{frame_numbers[-1]}: {e}",
+                       file=sys.stderr)
+            record_stage(stage_stats["box_conversion"], len(offsets), started)
 
-    cap.release()
+        if progress_callback is not None:
+            frames_before = batch_start - 1 - start_frame
+            frames_done = frames_before + count
+            if (frames_done // PROGRESS_EVERY_N_FRAMES) > (frames_before // PROGRESS_EVERY_N_FRAMES):
+                progress_callback(frames_done, max(range_frames, frames_done))
 
-    # --- Data Aggregation and Formatting ---
+    try:
+        if pipelined:
+            run_pipelined(reader, infer_batch, aggregate_batch, stage_stats, queue_size=pipeline_queue_size)
+        else:
+            run_serial(reader, infer_batch, aggregate_batch, stage_stats)
+    finally:
+        cap.release()
+
+    return {
+        "player_detections": player_columns.columns(),
+        "ball_detections": ball_columns.columns(),
+        "inferred_frames": inferred_frames,
+        "frames_read": reader.frames_read,
+        "stage_stats": stage_stats,
+        "fps": fps,
+        "video_dimensions": {"width": frame_width, "height": frame_height},
+        "total_frames": total_frames,
+    }
+
+def build_results(detections, sampling=None, timings=None):
+    """
+    Turns raw detections (from detect_video_range, or merged segments) into the results dict.
 
-    # Aggregate player positions from defaultdict to a list of all points for heatmap
-    all_player_points = []
-    # Sort frames for chronological order if needed, though not strictly necessary for simple heatmap
-    # for frame_id in sorted(player_positions.keys()):
-    #     for pos in player_positions[frame_id]:
-    #         all_player_points.append({"frame": frame_id, "x": pos[0], "y": pos[1]})
+    Everything that looks across frames (interpolation, ball tracking) happens here, on the
+    whole video's detections, so segment boundaries don't split or double-count anything.
 
-    # Simple list of all player center points detected across all frames
-    for frame_id, points in player_positions.items():
-         for point in points:
-              all_player_points.append(point) # Already dictionaries from earlier
+    Args:
+        timings (dict, optional): Filled with the seconds spent in each step, see build_profile.
+    """
+    timings = {} if timings is None else timings
+    # Every player and ball centre point, in frame order, as columns (see result_store.py)
+    # rather than one dict per point
+    player_detections = detections["player_detections"]
+    ball_detections = detections["ball_detections"]
+    inferred_frames = detections["inferred_frames"]
+    stage_stats = detections["stage_stats"]
+    frame_idx = detections["frames_read"]
 
+    # Stable player ids across frames, and each player's distance, speed and zone times,
+    # in one pass over the detections (see player_tracking.py)
+    with timed(timings, "tracking"):
+        player_detections, players = track_players(
+            player_detections, detections["fps"], detections["video_dimensions"],
+        )
 
-    # Note: The simple 'total_shots' based on ball detections is unreliable.
-    # A more accurate 'shot count' requires ball tracking and event detection.
-    # Let's return the number of ball detections as a proxy for now,
-    # or perhaps refine the ball detection to count unique 'events'.
-    # For a proper shot count, you'd need to analyze `ball_positions_list` for velocity/bounce patterns.
-    # Let's just return total ball detections for now.
+    if sampling == SAMPLING_ADAPTIVE:
+        # Fill in player positions for the frames the sampler skipped, along each track
+        with timed(timings, "interpolation"):
+            player_detections = interpolate_player_columns(player_detections, inferred_frames)
+
+    # --- Data Aggregation and Formatting ---
 
-    # Let's return total *unique* ball detections per frame above a threshold
-    unique_ball_frames = set(p['frame'] for p in ball_positions_list if p['conf'] > 0.5) # Count frames with ball detection
-    actual_shot_count_proxy = len(unique_ball_frames) # A slightly better proxy
+    # Shots come from tracking the ball across frames and detecting hits/bounces from
+    # changes of velocity and direction (see ball_tracking.py), grouped into rallies.
+    with timed(timings, "ball_tracking"):
+        ball_events = detect_rallies(ball_detections, detections["fps"])
+
+    # The heatmap is binned here, at several resolutions, so the dashboard only ever
+    # downloads a fixed-size grid (see heatmap.py)
+    with timed(timings, "heatmaps"):
+        heatmap_grids = heatmaps_from_columns(player_detections, detections["video_dimensions"])
 
     # Prepare results dictionary
     results = {
-        # "total_shots": total_shots, # The very crude initial count
-        "total_shots": actual_shot_count_proxy, # Proxy count
-        "heatmap_data": all_player_points, # List of all detected player center points
-        "video_dimensions": {"width": frame_width, "height": frame_height} # Useful for frontend scaling
-        # You could add more here, like rally counts if you refine that logic
+        "total_shots": ball_events["total_shots"], # Serves + hits over all rallies
+        "rallies": ball_events["rallies"], # [{start/end frame and time, shots, bounces}]
+        "events": ball_events["events"], # [{type: serve/hit/bounce, frame, time, x, y}]
+        "player_detections": player_detections, # Every player center point, as columns
+        "players": players, # Per tracked player: distance, speeds, time per court zone
+        "heatmaps": heatmap_summary(heatmap_grids), # Available grid resolutions and players
+        "heatmap_grids": heatmap_grids, # Player position counts per grid cell
+        "ball_detections": ball_detections,
+        "video_dimensions": detections["video_dimensions"], # Useful for frontend scaling
+        "stage_stats": {name: stats.as_dict() for name, stats in stage_stats.items()}, # Per-stage throughput
+        "sampling": {
+            "mode": sampling or "full",
+            "frames_total": frame_idx,
+            "frames_inferred": len(inferred_frames),
+            # Inclusive [start, end] ranges of the frames the models actually ran on
+            "inferred_frame_ranges": frame_ranges(inferred_frames),
+        },
     }
+    if "segments" in detections:
+        results["segments"] = detections["segments"]
+    if "resumed_from_frame" in detections:
+        results["resumed_from_frame"] = detections["resumed_from_frame"] # Frames restored from checkpoints
 
     return results
 
+def build_profile(detections, timings, wall_seconds):
+    """
+    The optional "profile" block of the results.
+
+    Args:
+        detections (dict): What build_results was given.
+        timings (dict): build_results's step timings.
+        wall_seconds (float): Time the whole analysis took.
+
+    Returns:
+        dict: wall_seconds, frames_per_second (frames read per wall-clock second), the seconds of
+              each post-processing step, and peak_rss_bytes of this process, plus
+              segment_peak_rss_bytes (largest peak among segment processes) with workers > 1.
+    """
+    profile = {
+        "wall_seconds": round(wall_seconds, 4),
+        "frames_per_second": round(detections["frames_read"] / wall_seconds, 2) if wall_seconds > 0 else None,
+        "post_processing_seconds": {name: round(seconds, 4) for name, seconds in timings.items()},
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+    if detections.get("segment_peak_rss_bytes") is not None:
+        profile["segment_peak_rss_bytes"] = detections["segment_peak_rss_bytes"]
+    return profile
+
+def build_arg_parser():
+    """Command-line options; every option maps to a keyword of analyze_pickleball_video."""
+    parser = argparse.ArgumentParser(description="Analyze a pickleball video and print the results as JSON.")
+    parser.add_argument("video_filepath", help="Path to the video file")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Frames per model call (default: %(default)s)")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="Decode, infer and aggregate on separate threads")
+    parser.add_argument("--pipeline-queue-size", type=int, default=DEFAULT_PIPELINE_QUEUE_SIZE,
+                        help="Batches buffered between pipeline stages (default: %(default)s)")
+    parser.add_argument("--sampling", choices=[SAMPLING_ADAPTIVE], default=None,
+                        help="Run the models only on frames picked by motion-gated adaptive sampling")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Analyse time segments of the video in this many processes (default: %(default)s)")
+    parser.add_argument("--checkpoint-dir", default=None,
+                        help="Checkpoint progress in this directory and resume from it (see checkpoints.py)")
+    parser.add_argument("--checkpoint-frames", type=int, default=DEFAULT_CHECKPOINT_FRAMES,
+                        help="Frames per checkpoint segment (default: %(default)s)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Add a \"profile\" block (wall time, fps, post-processing times, peak RSS) to the results")
+    parser.add_argument("--output", default=None,
+                        help="Write the results to OUTPUT.json (summary) and OUTPUT.npz (detection columns) "
+                             "and print only the summary")
+    return parser
+
 if __name__ == "__main__":
-    # Check if video path is provided as a command-line argument
-    if len(sys.argv) < 2:
-        print(json.dumps({"error": "Usage: python analyze_video.py <video_filepath>"}), file=sys.stderr)
-        sys.exit(1)
+    args = vars(build_arg_parser().parse_args())
+    video_filepath = args.pop("video_filepath")
+    output_base = args.pop("output")
 
-    video_filepath = sys.argv[1]
+    # Load models up front so a missing weights file is reported as a clean JSON error
+    try:
+        get_models()
+    except Exception as e:
+        print(json.dumps({"error": f"Failed to load models: {e}"}), file=sys.stderr)
+        sys.exit(1) # Exit if models can't load
 
     # Perform analysis
-    analysis_results = analyze_pickleball_video(video_filepath)
+    analysis_results = analyze_pickleball_video(video_filepath, progress_callback=report_progress_to_stderr, **args)
 
     # Check for errors during analysis
     if "error" in analysis_results:
@@ -151,4 +440,7 @@ if __name__ == "__main__":
          sys.exit(1)
 
     # Output results as JSON to standard output
-    print(json.dumps(analysis_results))
\ No newline at end of file
+    if output_base:
+        print(json.dumps(save_results(analysis_results, output_base)))
+    else:
+        print(json.dumps(to_json_compatible(analysis_results)))
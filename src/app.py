@@ -1,10 +1,25 @@
 # Save this as app.py (or backend_app.py)
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS # Import CORS
-import subprocess
+import atexit
+import datetime
+import hmac
 import json
 import os
-import uuid # To generate unique IDs for analysis jobs/results
+import functools
+import sys
+import tempfile
+import time
+import numpy as np
+import batch_scheduler
+from checkpoints import DEFAULT_CHECKPOINT_MAX_AGE_SECONDS, DEFAULT_CHECKPOINT_MAX_BYTES
+from job_queue import AnalysisJobQueue, LeaseLost, JOB_QUEUED, JOB_RUNNING, JOB_FAILED, JOB_CANCELLED
+from live_analysis import LiveSessionManager
+from metrics import MetricsRegistry
+from profiling import peak_rss_bytes
+from result_cache import ResultCache
+from result_store import COLUMN_DTYPES, load_columns, load_summary
+from heatmap import DEFAULT_HEATMAP_RESOLUTION, HEATMAP_RESOLUTIONS, grid_name, heatmaps_from_columns
 
 app = Flask(__name__, static_folder='../pickleball-frontend/build') # Configure static folder for React build
 CORS(app) # Enable CORS for development, adjust origins for production
@@ -33,9 +48,160 @@ MOCK_SESSION_VIDEO_MAP = {
     # Add more mappings as needed for your mock/test data
 }
 
-# Dictionary to store analysis status (useful for async processing)
-# For this simple example, our subprocess call waits, so status is either pending/completed/failed.
-ANALYSIS_STATUS = {} # {session_id: "pending" | "completed" | "failed"}
+# Courts and today's time slots, as /api/courts returns them
+MOCK_COURTS = [
+  {
+    "id": "court_1",
+    "name": "Court 1",
+    "time_slots": [
+      {"id": "slot_c1_8am", "time": "08:00", "status": "available", "is_past": False},
+      # Ensure these session_ids match keys in MOCK_SESSION_VIDEO_MAP
+      {"id": "slot_c1_9am", "time": "09:00", "status": "booked", "session_id": "sess_xyz_mock_court1_9am", "is_past": True, "bookedBy": "John Doe", "cost": 10, "startHour": 9}, # Add other mock data fields
+      {"id": "slot_c1_10am", "time": "10:00", "status": "booked", "session_id": "sess_abc_mock_court1_10am", "is_past": True, "bookedBy": "Jane Smith", "cost": 10, "startHour": 10},
+      {"id": "slot_c1_11am", "time": "11:00", "status": "booked", "session_id": "sess_def_mock_court1_11am", "is_past": False, "bookedBy": "Alice King", "cost": 10, "startHour": 11}, # Example future booking
+      {"id": "slot_c1_12pm", "time": "12:00", "status": "available", "is_past": False},
+      # ... other slots
+    ]
+  },
+  {
+    "id": "court_2",
+    "name": "Court 2",
+    "time_slots": [
+       # Add mock slots for court 2 similarly, ensuring some are past/booked with session_ids
+        {"id": "slot_c2_9am", "time": "09:00", "status": "booked", "session_id": "sess_ghi_mock_court2_9am", "is_past": True, "bookedBy": "Bob Lee", "cost": 10, "startHour": 9},
+        {"id": "slot_c2_10am", "time": "10:00", "status": "available", "is_past": False},
+       # ...
+    ]
+  }
+]
+
+def fetch_court_schedule(date):
+    """
+    Courts and time slots booked on `date`, in the /api/courts structure.
+    In a real app, fetch the bookings of that date from the Huddle API; the mock only has today's.
+    """
+    return MOCK_COURTS if date == datetime.date.today() else []
+
+def session_court(session_id):
+    """Court id of a booked session in today's schedule, or None."""
+    for court in MOCK_COURTS:
+        if any(slot.get("session_id") == session_id for slot in court["time_slots"]):
+            return court["id"]
+    return None
+
+# --- Analysis Job Queue ---
+# Analysis runs asynchronously: POST /api/analyze_booking queues a job and returns 202,
+# a pool of worker threads runs the jobs, and status/progress live in SQLite so they
+# survive a restart of this server.
+ANALYSIS_JOBS_DB = os.environ.get("ANALYSIS_JOBS_DB", os.path.join(ANALYSIS_RESULTS_DIR, "jobs.sqlite3"))
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", "2")) # Number of videos analysed concurrently
+# Cap on videos decoded at once on this host; a job with N segment workers decodes N
+ANALYSIS_MAX_DECODES = int(os.environ.get("ANALYSIS_MAX_DECODES", "0")) or None # Default: ANALYSIS_WORKERS
+# "subprocess" starts analyze_video.py per job; "resident" keeps one model_server.py
+# process per worker with the YOLO models already loaded (see model_server.py)
+ANALYSIS_BACKEND = os.environ.get("ANALYSIS_BACKEND", "resident")
+# Options passed to analyze_pickleball_video for every job
+ANALYSIS_OPTIONS = {
+    "batch_size": int(os.environ.get("ANALYSIS_BATCH_SIZE", "8")), # Frames per model call
+    "pipelined": os.environ.get("ANALYSIS_PIPELINED", "1") == "1", # Overlap decode and inference
+    "sampling": os.environ.get("ANALYSIS_SAMPLING") or None, # "adaptive" = motion-gated inference
+    "workers": int(os.environ.get("ANALYSIS_SEGMENT_WORKERS", "1")), # Processes per video (time segments)
+    # Frames per checkpoint segment (0 = off); jobs resume from checkpoints (see checkpoints.py)
+    "checkpoint_frames": int(os.environ.get("ANALYSIS_CHECKPOINT_FRAMES", "1800")),
+    # Add a "profile" block (wall time, fps, post-processing times, peak RSS) to every result
+    "profile": os.environ.get("ANALYSIS_PROFILE", "1") == "1",
+}
+
+# Results shared across sessions, keyed by video content, model weights and options (see result_cache.py)
+ANALYSIS_CACHE_ENABLED = os.environ.get("ANALYSIS_CACHE", "1") == "1"
+ANALYSIS_CACHE_DIR = os.environ.get("ANALYSIS_CACHE_DIR", os.path.join(ANALYSIS_RESULTS_DIR, "cache"))
+ANALYSIS_CACHE_MAX_BYTES = int(os.environ.get("ANALYSIS_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+result_cache = ResultCache(ANALYSIS_CACHE_DIR, ANALYSIS_CACHE_MAX_BYTES) if ANALYSIS_CACHE_ENABLED else None
+
+# Per-stage timings, throughput, queue depth and memory, served by GET /metrics (see metrics.py)
+metrics = MetricsRegistry()
+
+job_queue = AnalysisJobQueue(
+    ANALYSIS_JOBS_DB, ANALYSIS_RESULTS_DIR, num_workers=ANALYSIS_WORKERS, backend=ANALYSIS_BACKEND,
+    analysis_options=ANALYSIS_OPTIONS, result_cache=result_cache, metrics=metrics,
+    max_decodes=ANALYSIS_MAX_DECODES, remote_lease_seconds=float(os.environ.get("ANALYSIS_WORKER_LEASE", "120")),
+    # Checkpoints duplicate each session's detections; older or excess ones are deleted (see checkpoints.py)
+    checkpoint_max_bytes=int(os.environ.get("ANALYSIS_CHECKPOINT_MAX_BYTES", str(DEFAULT_CHECKPOINT_MAX_BYTES))),
+    checkpoint_max_age_seconds=float(os.environ.get("ANALYSIS_CHECKPOINT_MAX_AGE",
+                                                    str(DEFAULT_CHECKPOINT_MAX_AGE_SECONDS))),
+)
+
+# --- Backfill and remote workers ---
+# POST /api/backfill queues every past booked session without results (see batch_scheduler.py).
+# Other hosts can run queued jobs with remote_worker.py; they authenticate with this token
+# (the /api/workers endpoints are off while it is unset) and need the recordings at the same
+# paths, or mapped with remote_worker.py --path-map.
+ANALYSIS_WORKER_TOKEN = os.environ.get("ANALYSIS_WORKER_TOKEN", "")
+# Largest .npz columns upload accepted from a worker (bytes); a 2-hour session is well under 100 MB
+ANALYSIS_MAX_UPLOAD_BYTES = int(os.environ.get("ANALYSIS_MAX_UPLOAD_BYTES", str(512 * 1024 ** 2)))
+BACKFILL_DEADLINE = os.environ.get("ANALYSIS_BACKFILL_DEADLINE", "07:00") # Default: the next 7am
+BACKFILL_PRIORITY = -1 # Below the default 0, so sessions opened from the dashboard go first
+
+# --- Live Analysis ---
+# In-progress sessions can be analysed live (see live_analysis.py): POST /api/live/<session_id>
+# starts it and GET /api/live/<session_id>/events streams rolling results as Server-Sent Events.
+# Live sources per session: an RTSP/HTTP stream URL or a recording that is still being written.
+MOCK_SESSION_LIVE_SOURCES = {
+    "sess_def_mock_court1_11am": os.environ.get("ANALYSIS_LIVE_SOURCE_COURT1", "rtsp://127.0.0.1:8554/court1"),
+}
+LIVE_MAX_SESSIONS = int(os.environ.get("ANALYSIS_LIVE_SESSIONS", "2")) # Each live session holds its own models
+LIVE_OPTIONS = {
+    "latency_budget": float(os.environ.get("ANALYSIS_LIVE_LATENCY_BUDGET", "1.0")), # Seconds; later frames are dropped
+    "publish_interval": float(os.environ.get("ANALYSIS_LIVE_PUBLISH_INTERVAL", "1.0")), # Seconds between updates
+    "heatmap_window_seconds": float(os.environ.get("ANALYSIS_LIVE_HEATMAP_WINDOW", "60")), # Seconds of play in the heatmap
+    "realtime": os.environ.get("ANALYSIS_LIVE_REALTIME", "0") == "1", # Read local files at their frame rate (testing)
+}
+LIVE_KEEPALIVE_SECONDS = 15 # Comment line sent when there is no update, so proxies keep the stream open
+
+live_sessions = LiveSessionManager(max_sessions=LIVE_MAX_SESSIONS, options=LIVE_OPTIONS)
+atexit.register(live_sessions.stop_all) # Don't leave live analysis processes running
+
+
+def collect_server_metrics(registry):
+    """Metrics read when /metrics is scraped rather than recorded as they happen."""
+    counts = job_queue.status_counts()
+    for status in (JOB_QUEUED, JOB_RUNNING):
+        registry.set("analysis_queue_jobs", counts.get(status, 0), status=status)
+    if result_cache is not None:
+        cache_stats = result_cache.stats()
+        for event in ("hits", "misses", "stores", "evictions"):
+            registry.set("analysis_cache_events_total", cache_stats[event], event=event)
+        registry.set("analysis_cache_size_bytes", cache_stats["size_bytes"])
+    registry.set("live_sessions", len(live_sessions.running_sessions()))
+    server_peak_rss = peak_rss_bytes()
+    if server_peak_rss is not None:
+        registry.set("server_peak_rss_bytes", server_peak_rss)
+
+metrics.add_collector(collect_server_metrics)
+
+def job_status_payload(job):
+    """Subset of a job row that is safe and useful to return to the dashboard."""
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "priority": job["priority"],
+        "frames_done": job["frames_done"],
+        "frames_total": job["frames_total"],
+        "progress": job["progress"],
+        "error": job["error"],
+    }
+
+def recording_has_grown(results_file, video_path):
+    """True if the video is larger than when its saved results were produced (a recording still in progress)."""
+    if not video_path or not os.path.exists(video_path):
+        return False
+    try:
+        with open(results_file, 'r') as f:
+            analysed_size = json.load(f).get("video_size_bytes")
+    except (OSError, ValueError) as e:
+        print(f"Error reading analysis results file {results_file}: {e}", file=sys.stderr)
+        return False
+    return analysed_size is not None and os.path.getsize(video_path) > analysed_size
 
 # --- API Endpoints ---
 
@@ -56,114 +222,73 @@ def serve(path):
 def get_courts():
     # In a real app, fetch from Huddle API
     # Integrate the mockData structure, adding session_id and is_past
-    mock_data_with_sessions = [
-      {
-        "id": "court_1",
-        "name": "Court 1",
-        "time_slots": [
-          {"id": "slot_c1_8am", "time": "08:00", "status": "available", "is_past": False},
-          # Ensure these session_ids match keys in MOCK_SESSION_VIDEO_MAP
-          {"id": "slot_c1_9am", "time": "09:00", "status": "booked", "session_id": "sess_xyz_mock_court1_9am", "is_past": True, "bookedBy": "John Doe", "cost": 10, "startHour": 9}, # Add other mock data fields
-          {"id": "slot_c1_10am", "time": "10:00", "status": "booked", "session_id": "sess_abc_mock_court1_10am", "is_past": True, "bookedBy": "Jane Smith", "cost": 10, "startHour": 10},
-          {"id": "slot_c1_11am", "time": "11:00", "status": "booked", "session_id": "sess_def_mock_court1_11am", "is_past": False, "bookedBy": "Alice King", "cost": 10, "startHour": 11}, # Example future booking
-          {"id": "slot_c1_12pm", "time": "12:00", "status": "available", "is_past": False},
-          # ... other slots
-        ]
-      },
-      {
-        "id": "court_2",
-        "name": "Court 2",
-        "time_slots": [
-           # Add mock slots for court 2 similarly, ensuring some are past/booked with session_ids
-            {"id": "slot_c2_9am", "time": "09:00", "status": "booked", "session_id": "sess_ghi_mock_court2_9am", "is_past": True, "bookedBy": "Bob Lee", "cost": 10, "startHour": 9},
-            {"id": "slot_c2_10am", "time": "10:00", "status": "available", "is_past": False},
-           # ...
-        ]
-      }
-    ]
-    return jsonify(mock_data_with_sessions)
+    return jsonify(MOCK_COURTS)
 
 
 # Endpoint to trigger the analysis
+# Queues a job and returns 202 right away. Optional JSON body: {"priority": <int>},
+# higher priorities are picked up first.
 @app.route('/api/analyze_booking/<session_id>', methods=['POST'])
 def trigger_analysis(session_id):
-    # Check if analysis is already running or completed
-    status = ANALYSIS_STATUS.get(session_id)
-    if status == "completed":
-        return jsonify({"message": "Analysis already completed for this session."}), 200
-    if status == "pending":
-         return jsonify({"message": "Analysis is already in progress."}), 202 # Accepted, processing
-
-    # Find the video path for the session ID
-    video_path = MOCK_SESSION_VIDEO_MAP.get(session_id)
-    if not video_path or not os.path.exists(video_path):
-        return jsonify({"error": f"Video not found for session ID: {session_id}. Path: {video_path}"}), 404
-
-    # Define where to save the results for this session
+    started = time.perf_counter()
+    response, status = _trigger_analysis(session_id)
+    metrics.inc("trigger_analysis_requests_total", status=status)
+    metrics.observe("trigger_analysis_seconds", time.perf_counter() - started)
+    return response, status
+
+def _trigger_analysis(session_id):
+    # Define where the results for this session are saved by the worker
     results_file = os.path.join(ANALYSIS_RESULTS_DIR, f"{session_id}.json")
 
+    video_path = MOCK_SESSION_VIDEO_MAP.get(session_id)
+
     # If analysis file already exists from a previous run, return completed status
-    if os.path.exists(results_file):
-         ANALYSIS_STATUS[session_id] = "completed"
-         return jsonify({"message": "Analysis previously completed and results found."}), 200
-
-
-    # --- Run the analysis script as a subprocess ---
-    try:
-        ANALYSIS_STATUS[session_id] = "pending"
-        # IMPORTANT: Adjust the path to your analyze_video.py script
-        script_path = "path/to/your/analyze_video.py" # <--- UPDATE THIS PATH
-
-        # Run the script, capture stdout and stderr
-        # text=True decodes output as text
-        process = subprocess.run(
-            ["python", script_path, video_path],
-            capture_output=True,
-            text=True,
-            check=False # Don't raise exception immediately on non-zero exit code
-        )
-
-        # Check the exit code
-        if process.returncode != 0:
-            # Log the error output from the script
-            print(f"Analysis script failed for {session_id}. Stderr:\n{process.stderr}", file=sys.stderr)
-            ANALYSIS_STATUS[session_id] = "failed"
-            # Attempt to parse stderr if it was intended to be JSON error
-            try:
-                 error_output = json.loads(process.stderr.strip())
-                 error_message = error_output.get("error", "Unknown script error")
-            except json.JSONDecodeError:
-                 error_message = process.stderr.strip() or "Script execution failed"
+    # (unless the recording has grown since, in which case a job extends the results)
+    if os.path.exists(results_file) and not recording_has_grown(results_file, video_path):
+         return jsonify({"message": "Analysis previously completed and results found.", "status": "completed"}), 200
 
-            return jsonify({"error": f"Analysis failed: {error_message}"}), 500 # Internal Server Error
+    # Check if analysis is already queued or running
+    job = job_queue.get_job(session_id)
+    if job and job["status"] in (JOB_QUEUED, JOB_RUNNING):
+         return jsonify({"message": "Analysis is already in progress.", "session_id": session_id, **job_status_payload(job)}), 202 # Accepted, processing
 
+    # Check the video path for the session ID
+    if not video_path or not os.path.exists(video_path):
+        return jsonify({"error": f"Video not found for session ID: {session_id}. Path: {video_path}"}), 404
 
-        # Parse the JSON output from the script's stdout
+    # Same footage already analysed with the current models and options (e.g. under another session)
+    if result_cache is not None:
         try:
-            analysis_results = json.loads(process.stdout.strip())
-        except json.JSONDecodeError:
-             print(f"Analysis script for {session_id} returned invalid JSON. Stdout:\n{process.stdout}", file=sys.stderr)
-             ANALYSIS_STATUS[session_id] = "failed"
-             return jsonify({"error": "Analysis script returned invalid data."}), 500
+            cache_key = result_cache.key_for(video_path, ANALYSIS_OPTIONS)
+            # A miss is counted by the job, which checks the cache again before analysing
+            if result_cache.restore(cache_key, os.path.join(ANALYSIS_RESULTS_DIR, session_id), count_miss=False):
+                return jsonify({"message": "Analysis results found in the cache.", "status": "completed"}), 200
+        except Exception as e:
+            print(f"Result cache lookup failed for {session_id}: {e}", file=sys.stderr)
+
+    body = request.get_json(silent=True) or {}
+    try:
+        priority = int(body.get("priority", 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "priority must be an integer"}), 400
 
+    try:
+        job, created = job_queue.submit(session_id, video_path, priority=priority, court_id=session_court(session_id))
+    except Exception as e:
+        print(f"Failed to queue analysis for {session_id}: {e}", file=sys.stderr)
+        return jsonify({"error": f"Failed to queue analysis: {e}"}), 500
 
-        # Save the results
-        with open(results_file, 'w') as f:
-            json.dump(analysis_results, f)
+    message = "Analysis queued." if created else "Analysis is already in progress."
+    return jsonify({"message": message, "session_id": session_id, **job_status_payload(job)}), 202 # Accepted, processing
 
-        ANALYSIS_STATUS[session_id] = "completed"
-        return jsonify({"message": "Analysis completed successfully", "session_id": session_id}), 200 # OK
 
-    except FileNotFoundError:
-         # This happens if the 'python' command or the script_path is not found
-         print(f"Error: Python interpreter or script not found. Make sure 'python' is in PATH and script_path is correct.", file=sys.stderr)
-         ANALYSIS_STATUS[session_id] = "failed"
-         return jsonify({"error": "Server configuration error: Analysis script not found."}), 500
-    except Exception as e:
-        # Catch any other unexpected errors during subprocess handling
-        print(f"An unexpected error occurred during analysis for {session_id}: {e}", file=sys.stderr)
-        ANALYSIS_STATUS[session_id] = "failed"
-        return jsonify({"error": f"An unexpected server error occurred: {e}"}), 500
+# Endpoint to cancel a queued or running analysis
+@app.route('/api/analyze_booking/<session_id>', methods=['DELETE'])
+def cancel_analysis(session_id):
+    job = job_queue.cancel(session_id)
+    if job is None:
+        return jsonify({"error": "No queued or running analysis for this session."}), 404
+    return jsonify({"message": "Analysis cancellation requested.", "session_id": session_id, **job_status_payload(job)}), 200
 
 
 # Endpoint to get analysis results
@@ -172,17 +297,23 @@ def get_analysis_results(session_id):
     results_file = os.path.join(ANALYSIS_RESULTS_DIR, f"{session_id}.json")
 
     if not os.path.exists(results_file):
-        # Check if analysis is pending
-        status = ANALYSIS_STATUS.get(session_id)
-        if status == "pending":
-             return jsonify({"status": "pending", "message": "Analysis is still in progress."}), 202 # Accepted, processing
-        elif status == "failed":
-             return jsonify({"status": "failed", "message": "Analysis failed previously."}), 500
+        # Report the state of the latest job for this session
+        job = job_queue.get_job(session_id)
+        if job is None:
+            # Not started, and file doesn't exist
+            return jsonify({"status": "not_found", "message": "Analysis results not found for this session."}), 404
+        if job["status"] in (JOB_QUEUED, JOB_RUNNING):
+             return jsonify({"message": "Analysis is still in progress.", **job_status_payload(job)}), 202 # Accepted, processing
+        elif job["status"] == JOB_FAILED:
+             return jsonify({"message": "Analysis failed previously.", **job_status_payload(job)}), 500
+        elif job["status"] == JOB_CANCELLED:
+             return jsonify({"message": "Analysis was cancelled.", **job_status_payload(job)}), 409
         else:
-            # Status is unknown or not started, and file doesn't exist
+            # Completed job whose results file has since been removed
             return jsonify({"status": "not_found", "message": "Analysis results not found for this session."}), 404
 
     try:
+        # Only the small JSON summary; per-detection columns are served by get_analysis_detections
         with open(results_file, 'r') as f:
             analysis_data = json.load(f)
         # Include status for clarity, although client got 200
@@ -192,6 +323,364 @@ def get_analysis_results(session_id):
         print(f"Error reading analysis results file for {session_id}: {e}", file=sys.stderr)
         return jsonify({"error": "Failed to read analysis results."}), 500
 
+# Endpoint to start live analysis of an in-progress session
+@app.route('/api/live/<session_id>', methods=['POST'])
+def start_live_analysis(session_id):
+    source = MOCK_SESSION_LIVE_SOURCES.get(session_id) or MOCK_SESSION_VIDEO_MAP.get(session_id)
+    if not source:
+        return jsonify({"error": f"No live source for session ID: {session_id}"}), 404
+    if not live_sessions.start(session_id, source):
+        return jsonify({"error": "Too many live sessions are running."}), 503
+    return jsonify({"message": "Live analysis started.", "session_id": session_id,
+                    "events_url": f"/api/live/{session_id}/events"}), 202
+
+# Endpoint to stop live analysis
+@app.route('/api/live/<session_id>', methods=['DELETE'])
+def stop_live_analysis(session_id):
+    if not live_sessions.stop(session_id):
+        return jsonify({"error": "No live analysis running for this session."}), 404
+    return jsonify({"message": "Live analysis stopped.", "session_id": session_id}), 200
+
+# Server-Sent Events stream of live snapshots: one "data: {json}" event per update, ending after
+# the final ("finished"/"failed") snapshot. The dashboard subscribes with EventSource instead of polling.
+@app.route('/api/live/<session_id>/events', methods=['GET'])
+def live_analysis_events(session_id):
+    if live_sessions.wait_for_update(session_id, timeout=0) is None:
+        return jsonify({"error": "No live analysis for this session. Start it with POST first."}), 404
+
+    def stream():
+        version = 0
+        while True:
+            new_version, snapshot = live_sessions.wait_for_update(session_id, version, timeout=LIVE_KEEPALIVE_SECONDS)
+            if new_version == version:
+                yield ": keep-alive\n\n"
+                continue
+            version = new_version
+            yield f"data: {json.dumps(snapshot)}\n\n"
+            if snapshot.get("status") in ("finished", "failed"):
+                return
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def parse_deadline(value, now):
+    """A deadline given as an ISO date and time, or as "HH:MM" (the next time it is that time)."""
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        deadline = datetime.datetime.combine(now.date(), datetime.time.fromisoformat(value))
+        return deadline if deadline > now else deadline + datetime.timedelta(days=1)
+
+# Endpoint to analyse all past sessions without results, e.g. nightly. Optional JSON body:
+# {"from": "2026-10-01", "to": "2026-10-16", "courts": ["court_1"], "deadline": "07:00", "dry_run": true}
+# Dates default to today, the deadline to ANALYSIS_BACKFILL_DEADLINE. Each session gets the best
+# analysis mode that still lets the whole batch finish by the deadline; with "dry_run" the plan is
+# returned without queuing anything.
+@app.route('/api/backfill', methods=['POST'])
+def schedule_backfill():
+    body = request.get_json(silent=True) or {}
+    now = datetime.datetime.now()
+    try:
+        first_date = datetime.date.fromisoformat(body.get("from") or now.date().isoformat())
+        last_date = datetime.date.fromisoformat(body.get("to") or first_date.isoformat())
+        deadline = parse_deadline(body.get("deadline") or BACKFILL_DEADLINE, now)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid date or deadline: {e}"}), 400
+    if last_date < first_date:
+        return jsonify({"error": "'to' is before 'from'"}), 400
+
+    schedules = {}
+    date = first_date
+    while date <= last_date:
+        schedules[date] = fetch_court_schedule(date)
+        date += datetime.timedelta(days=1)
+
+    active_sessions = {job["session_id"] for job in job_queue.active_jobs()}
+    skipped = {"has_results": [], "in_progress": [], "no_video": [], "cached": []}
+    sessions = []
+    for session in batch_scheduler.past_booked_sessions(schedules, now, body.get("courts")):
+        session_id = session["session_id"]
+        video_path = MOCK_SESSION_VIDEO_MAP.get(session_id)
+        results_file = os.path.join(ANALYSIS_RESULTS_DIR, f"{session_id}.json")
+        if os.path.exists(results_file) and not recording_has_grown(results_file, video_path):
+            skipped["has_results"].append(session_id)
+        elif session_id in active_sessions:
+            skipped["in_progress"].append(session_id)
+        elif not video_path or not os.path.exists(video_path):
+            skipped["no_video"].append(session_id)
+        else:
+            sessions.append({**session, "video_path": video_path, "frames": batch_scheduler.video_frame_count(video_path)})
+
+    mode_fps = batch_scheduler.throughput_by_mode(job_queue.recent_completed_jobs())
+    plan = batch_scheduler.plan_backfill(
+        sessions, (deadline - now).total_seconds(), job_queue.worker_slots(), mode_fps,
+        backlog=batch_scheduler.backlog_seconds(job_queue.active_jobs(), mode_fps),
+    )
+
+    queued = 0
+    for job in plan["jobs"]:
+        options = batch_scheduler.MODES[job["mode"]]
+        if body.get("dry_run"):
+            continue
+        # Sessions whose footage was already analysed the same way complete from the result cache
+        if result_cache is not None:
+            try:
+                cache_key = result_cache.key_for(job["video_path"], {**ANALYSIS_OPTIONS, **options})
+                if result_cache.restore(cache_key, os.path.join(ANALYSIS_RESULTS_DIR, job["session_id"]), count_miss=False):
+                    skipped["cached"].append(job["session_id"])
+                    continue
+            except Exception as e:
+                print(f"Result cache lookup failed for {job['session_id']}: {e}", file=sys.stderr)
+        try:
+            job_queue.submit(job["session_id"], job["video_path"], priority=BACKFILL_PRIORITY,
+                             court_id=job["court_id"], options=options, deadline=deadline.timestamp())
+            queued += 1
+        except Exception as e:
+            print(f"Failed to queue backfill analysis for {job['session_id']}: {e}", file=sys.stderr)
+            return jsonify({"error": f"Failed to queue analysis: {e}", "queued": queued}), 500
+
+    return jsonify({
+        "queued": queued,
+        "dry_run": bool(body.get("dry_run")),
+        "deadline": deadline.isoformat(timespec="minutes"),
+        "estimated_seconds": plan["estimated_seconds"],
+        "fits": plan["fits"],
+        "worker_slots": job_queue.worker_slots(),
+        "mode_fps": {mode: round(fps, 1) for mode, fps in mode_fps.items()},
+        "jobs": [
+            {"session_id": job["session_id"], "court_id": job["court_id"], "start": job["start"].isoformat(timespec="minutes"),
+             "frames": job["frames"], "mode": job["mode"], "estimated_seconds": round(job["estimated_seconds"], 1)}
+            for job in plan["jobs"] if job["session_id"] not in skipped["cached"]
+        ],
+        "skipped": skipped,
+    }), 202 if queued else 200
+
+
+# --- Remote worker endpoints (used by remote_worker.py) ---
+# Every request carries "Authorization: Bearer <ANALYSIS_WORKER_TOKEN>" and "X-Worker-Host: <name>".
+
+def worker_endpoint(view):
+    """Checks the worker token and passes the worker's host name to the view."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ANALYSIS_WORKER_TOKEN:
+            return jsonify({"error": "Remote workers are disabled; set ANALYSIS_WORKER_TOKEN."}), 403
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {ANALYSIS_WORKER_TOKEN}"):
+            return jsonify({"error": "Invalid worker token."}), 401
+        host = request.headers.get("X-Worker-Host", "").strip()
+        if not host:
+            return jsonify({"error": "X-Worker-Host header is required."}), 400
+        try:
+            return view(host, *args, **kwargs)
+        except LeaseLost as e:
+            return jsonify({"error": str(e)}), 409 # The worker should drop the job
+    return wrapper
+
+# Claim the next job; JSON body {"slots": <jobs the host runs at once>, "max_decodes": <its decode cap>}.
+# Answers 204 when there is nothing the host can run now.
+@app.route('/api/workers/claim', methods=['POST'])
+@worker_endpoint
+def claim_worker_job(host):
+    body = request.get_json(silent=True) or {}
+    try:
+        job = job_queue.claim_remote(host, slots=int(body.get("slots", 1)), max_decodes=int(body.get("max_decodes", 1)))
+    except (TypeError, ValueError):
+        return jsonify({"error": "slots and max_decodes must be integers"}), 400
+    if job is None:
+        return "", 204
+    return jsonify({
+        "job_id": job["id"], "session_id": job["session_id"], "video_path": job["video_path"],
+        "options": job["analysis_options"], "lease_seconds": job_queue.remote_lease_seconds,
+    }), 200
+
+# Progress report, which also renews the lease; answers {"cancel_requested": bool}
+@app.route('/api/workers/jobs/<job_id>/progress', methods=['POST'])
+@worker_endpoint
+def report_worker_progress(host, job_id):
+    body = request.get_json(silent=True) or {}
+    cancel_requested = job_queue.report_remote(job_id, host, body.get("frames_done"), body.get("frames_total"))
+    return jsonify({"cancel_requested": cancel_requested}), 200
+
+# Upload of the results' .npz columns (raw body), before /complete.
+# Answers 413 above ANALYSIS_MAX_UPLOAD_BYTES and 409 when the host doesn't hold the job.
+@app.route('/api/workers/jobs/<job_id>/columns', methods=['PUT'])
+@worker_endpoint
+def upload_worker_columns(host, job_id):
+    too_large = jsonify({"error": f"The columns upload is over {ANALYSIS_MAX_UPLOAD_BYTES} bytes."}), 413
+    if request.content_length is not None and request.content_length > ANALYSIS_MAX_UPLOAD_BYTES:
+        return too_large
+    upload_path = job_queue.uploaded_columns_path(job_id, host) # Raises LeaseLost before anything is written
+    # Streamed to a file of this request's own and moved into place once complete, so a host
+    # whose lease ran out mid-upload can't overwrite or truncate the upload of the job's new host
+    fd, part_path = tempfile.mkstemp(dir=os.path.dirname(upload_path), suffix=".part")
+    try:
+        received = 0
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = request.stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                received += len(chunk)
+                if received > ANALYSIS_MAX_UPLOAD_BYTES: # No (or a wrong) Content-Length
+                    return too_large
+                f.write(chunk)
+        # Checked again: the lease may have run out, and the job moved on, while the body arrived
+        os.replace(part_path, job_queue.uploaded_columns_path(job_id, host))
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    return jsonify({"message": "Columns received."}), 200
+
+# Completion with the results summary as the JSON body
+@app.route('/api/workers/jobs/<job_id>/complete', methods=['POST'])
+@worker_endpoint
+def complete_worker_job(host, job_id):
+    summary = request.get_json(silent=True)
+    if not isinstance(summary, dict):
+        return jsonify({"error": "The results summary is required."}), 400
+    try:
+        job_queue.complete_remote(job_id, host, summary)
+    except FileNotFoundError:
+        return jsonify({"error": "Upload the columns first."}), 400
+    except ValueError as e:
+        return jsonify({"error": f"Invalid results: {e}"}), 400
+    return jsonify({"message": "Results saved."}), 200
+
+# Failure, or stop after a cancel request; JSON body {"error": "...", "cancelled": bool}
+@app.route('/api/workers/jobs/<job_id>/fail', methods=['POST'])
+@worker_endpoint
+def fail_worker_job(host, job_id):
+    body = request.get_json(silent=True) or {}
+    job_queue.fail_remote(job_id, host, body.get("error") or "Unknown worker error", cancelled=bool(body.get("cancelled")))
+    return jsonify({"message": "Job updated."}), 200
+
+# Prometheus metrics: per-stage analysis timings, throughput, queue depths and peak memory
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Endpoint to get result cache counters (hits, misses, stores, evictions, size)
+@app.route('/api/analysis_cache', methods=['GET'])
+def get_analysis_cache_stats():
+    if result_cache is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **result_cache.stats()}), 200
+
+# Endpoint to get per-detection columns of completed results, e.g.
+# /api/analysis_results/<session_id>/detections?table=player_detections&fields=x,y,conf&start_frame=1&end_frame=900
+# Answers {"table", "rows", "columns": {field: [values...]}}; the columns are memory-mapped,
+# so only the requested fields and frame range are read from disk.
+@app.route('/api/analysis_results/<session_id>/detections', methods=['GET'])
+def get_analysis_detections(session_id):
+    results_base = os.path.join(ANALYSIS_RESULTS_DIR, os.path.basename(session_id))
+    if not os.path.exists(f"{results_base}.npz"):
+        return jsonify({"status": "not_found", "message": "Analysis detections not found for this session."}), 404
+
+    table = request.args.get("table", "player_detections")
+    if table not in COLUMN_DTYPES:
+        return jsonify({"error": f"Unknown table {table!r}, expected one of {sorted(COLUMN_DTYPES)}"}), 400
+    fields = request.args.get("fields")
+    fields = fields.split(",") if fields else None # Default: every field in the file
+    try:
+        start_frame = int(request.args.get("start_frame", 1))
+        end_frame = int(request.args["end_frame"]) if "end_frame" in request.args else None
+    except ValueError:
+        return jsonify({"error": "start_frame and end_frame must be integers"}), 400
+
+    try:
+        columns = load_columns(results_base, table, None if fields is None else sorted(set(fields) | {"frame"}))
+        fields = list(columns) if fields is None else fields
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 400
+    except Exception as e:
+        print(f"Error reading analysis detections for {session_id}: {e}", file=sys.stderr)
+        return jsonify({"error": "Failed to read analysis detections."}), 500
+
+    # Rows are in frame order, so a frame range is a slice
+    first = int(np.searchsorted(columns["frame"], start_frame, side="left"))
+    last = len(columns["frame"]) if end_frame is None else int(np.searchsorted(columns["frame"], end_frame, side="right"))
+    return jsonify({
+        "table": table,
+        "rows": max(0, last - first),
+        "columns": {field: columns[field][first:last].tolist() for field in fields},
+    }), 200
+
+# Endpoint to get the per-player movement summaries of completed results, e.g.
+# /api/analysis_results/<session_id>/players (all tracked players) or ?player=2 (one of them)
+# Answers {"players": [{track_id, tracked_seconds, distance_px, avg/max speed, zone_seconds, ...}]}.
+# They are computed while the video is analysed (see player_tracking.py), so this only reads the
+# small JSON summary, never the detections.
+@app.route('/api/analysis_results/<session_id>/players', methods=['GET'])
+def get_analysis_players(session_id):
+    results_base = os.path.join(ANALYSIS_RESULTS_DIR, os.path.basename(session_id))
+    if not os.path.exists(f"{results_base}.json"):
+        return jsonify({"status": "not_found", "message": "Analysis results not found for this session."}), 404
+    try:
+        player = int(request.args["player"]) if "player" in request.args else None
+    except ValueError:
+        return jsonify({"error": "player must be an integer"}), 400
+
+    try:
+        players = load_summary(results_base).get("players")
+    except Exception as e:
+        print(f"Error reading analysis players for {session_id}: {e}", file=sys.stderr)
+        return jsonify({"error": "Failed to read analysis results."}), 500
+    if players is None:
+        # Results from before players were tracked have no boxes to track them from
+        return jsonify({"error": "These results have no per-player stats; analyse the session again."}), 404
+
+    if player is not None:
+        players = [entry for entry in players if entry["track_id"] == player]
+        if not players:
+            return jsonify({"error": f"No tracked player {player} in this session."}), 404
+    return jsonify({"players": players}), 200
+
+@functools.lru_cache(maxsize=32)
+def _heatmaps_for_old_results(results_base, modified_time):
+    """Heatmap grids for results saved before grids were stored with them, computed once per file version."""
+    video_dimensions = load_summary(results_base)["video_dimensions"]
+    return heatmaps_from_columns(load_columns(results_base, "player_detections", ["x", "y", "track_id"]), video_dimensions)
+
+# Endpoint to get a pre-aggregated player position heatmap, e.g.
+# /api/analysis_results/<session_id>/heatmap?res=64 (whole session) or ?res=64&player=2 (one tracked player)
+# Answers {"res", "player", "total", "max", "grid": [[count, ...], ...]} with res x res cells
+# (rows are y, columns are x, spanning video_dimensions), so its size doesn't depend on the video length.
+@app.route('/api/analysis_results/<session_id>/heatmap', methods=['GET'])
+def get_analysis_heatmap(session_id):
+    results_base = os.path.join(ANALYSIS_RESULTS_DIR, os.path.basename(session_id))
+    columns_file = f"{results_base}.npz"
+    if not os.path.exists(columns_file):
+        return jsonify({"status": "not_found", "message": "Analysis heatmap not found for this session."}), 404
+
+    try:
+        resolution = int(request.args.get("res", DEFAULT_HEATMAP_RESOLUTION))
+        player = int(request.args["player"]) if "player" in request.args else None
+    except ValueError:
+        return jsonify({"error": "res and player must be integers"}), 400
+    if resolution not in HEATMAP_RESOLUTIONS:
+        return jsonify({"error": f"res must be one of {list(HEATMAP_RESOLUTIONS)}"}), 400
+
+    name = grid_name(resolution, player)
+    try:
+        try:
+            grid = load_columns(results_base, "heatmap_grids", [name])[name]
+        except KeyError:
+            grids = _heatmaps_for_old_results(results_base, os.path.getmtime(columns_file))
+            if name not in grids:
+                return jsonify({"error": f"No heatmap for player {player} in this session."}), 404
+            grid = grids[name]
+    except Exception as e:
+        print(f"Error reading analysis heatmap for {session_id}: {e}", file=sys.stderr)
+        return jsonify({"error": "Failed to read analysis heatmap."}), 500
+
+    return jsonify({
+        "res": resolution,
+        "player": player,
+        "total": float(grid.sum()),
+        "max": float(grid.max()),
+        "grid": grid.tolist(),
+    }), 200
+
 # Endpoint to get a specific analysis asset (e.g., heatmap image if you generated one)
 # Not strictly needed with the JSON heatmap data approach, but kept for completeness
 @app.route('/api/analysis_assets/<session_id>/<filename>', methods=['GET'])
@@ -215,7 +704,22 @@ def get_analysis_asset(session_id, filename):
         return jsonify({"error": "Failed to serve asset"}), 500
 
 
+def create_app():
+    """
+    Starts the analysis workers and returns the Flask app.
+
+    This is the entry point for WSGI servers, e.g. gunicorn 'app:create_app()'. Importing
+    this module (from tests or scripts) starts no worker threads or model processes.
+    """
+    job_queue.start()
+    return app
+
 if __name__ == '__main__':
     # Run the Flask app
     # In production, use a production-ready WSGI server like Gunicorn
-    app.run(debug=True) # Set debug=False in production
\ No newline at end of file
+    debug = True # Set debug=False in production
+    # The debug reloader imports this module in a watcher process too; only start
+    # the analysis workers in the process that actually serves requests.
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        create_app()
+    app.run(debug=debug)
\ No newline at end of file
@@ -0,0 +1,263 @@
+# Save this as ball_tracking.py (next to analyze_video.py)
+"""
+Ball tracking and rally/shot event detection over the ball_detections columns.
+
+1. Tracking: a constant-velocity Kalman filter follows the ball. A detection
+   joins the current track if it passes the Mahalanobis gate around the
+   prediction or, after a sudden change of direction such as a hit, if it is
+   within MAX_BALL_SPEED_PX_PER_FRAME of the last position. Detections outside
+   both gates are treated as false positives. A track ends after
+   MAX_MISSED_SECONDS without a matching detection. Frames without a detection
+   (skipped by sampling, or a missed ball) are predicted through, so the ball
+   model doesn't have to run on every frame.
+2. Events: along each track, the velocity over a few detections before and
+   after each point is compared. A sharp turn is a "bounce" if the ball was
+   falling and starts rising (image y down then up) without reversing
+   horizontally; any other sharp turn is a "hit".
+3. Rallies: tracks less than RALLY_GAP_SECONDS apart form one rally. Each rally
+   starts with a "serve", and its shots are the serve plus its hits.
+"""
+import copy
+import math
+
+import numpy as np
+
+# Detections below this confidence are ignored
+MIN_BALL_CONFIDENCE = 0.3
+# Kalman noise: process noise (px/frame^2) and measurement noise (px)
+PROCESS_NOISE = 4.0
+MEASUREMENT_NOISE = 6.0
+# Chi-square gate for 2 degrees of freedom (99%)
+GATE_CHI2 = 9.21
+# Fastest plausible ball movement between frames, used for the fallback gate
+MAX_BALL_SPEED_PX_PER_FRAME = 120
+# A track ends after this long without a matching detection
+MAX_MISSED_SECONDS = 0.5
+# Detections on each side used to measure the velocity before/after a point
+EVENT_WINDOW = 3
+# Minimum change of direction (degrees) for a hit or bounce
+EVENT_ANGLE_DEG = 45
+# Both velocities must be at least this fast (px/frame) for an event
+MIN_EVENT_SPEED = 2.0
+# Events closer together than this are merged (the sharpest turn wins)
+MIN_EVENT_GAP_SECONDS = 0.25
+# Tracks closer together than this belong to the same rally
+RALLY_GAP_SECONDS = 2.0
+# Rallies with fewer ball detections are treated as noise
+MIN_RALLY_DETECTIONS = 8
+
+# Used when the container doesn't report a frame rate
+FALLBACK_FPS = 30.0
+
+
+class BallKalmanFilter:
+    """Constant-velocity Kalman filter over the state [x, y, vx, vy] (pixels, pixels/frame)."""
+
+    def __init__(self, x, y):
+        self.state = np.array([x, y, 0.0, 0.0])
+        self.covariance = np.diag([MEASUREMENT_NOISE ** 2] * 2 + [MAX_BALL_SPEED_PX_PER_FRAME ** 2] * 2)
+        self._measurement_matrix = np.array([[1.0, 0, 0, 0], [0, 1.0, 0, 0]])
+        self._measurement_covariance = np.eye(2) * MEASUREMENT_NOISE ** 2
+
+    def predict(self, frames):
+        """Advances the state by `frames` frames (frames may be more than 1 after gaps)."""
+        transition = np.eye(4)
+        transition[0, 2] = transition[1, 3] = frames
+        # Discrete white-noise acceleration model
+        q = PROCESS_NOISE ** 2
+        dt2, dt3, dt4 = frames ** 2, frames ** 3 / 2, frames ** 4 / 4
+        process_covariance = q * np.array([
+            [dt4, 0, dt3, 0], [0, dt4, 0, dt3], [dt3, 0, dt2, 0], [0, dt3, 0, dt2],
+        ])
+        self.state = transition @ self.state
+        self.covariance = transition @ self.covariance @ transition.T + process_covariance
+
+    def predicted(self, frames):
+        """A copy of the filter advanced by `frames` frames; this one is left as it is."""
+        twin = copy.copy(self) # predict/update/reset_velocity replace the arrays, never modify them
+        twin.predict(frames)
+        return twin
+
+    def gate_distance(self, x, y):
+        """Squared Mahalanobis distance of a measurement from the predicted position."""
+        innovation = np.array([x, y]) - self._measurement_matrix @ self.state
+        innovation_covariance = self._innovation_covariance()
+        return float(innovation @ np.linalg.solve(innovation_covariance, innovation))
+
+    def update(self, x, y):
+        innovation = np.array([x, y]) - self._measurement_matrix @ self.state
+        gain = self.covariance @ self._measurement_matrix.T @ np.linalg.inv(self._innovation_covariance())
+        self.state = self.state + gain @ innovation
+        self.covariance = (np.eye(4) - gain @ self._measurement_matrix) @ self.covariance
+
+    def reset_velocity(self, x, y, vx, vy):
+        """Re-initialises the filter after a sudden change of direction."""
+        self.state = np.array([x, y, vx, vy], dtype=float)
+        self.covariance = np.diag([MEASUREMENT_NOISE ** 2] * 2 + [(MAX_BALL_SPEED_PX_PER_FRAME / 2) ** 2] * 2)
+
+    def _innovation_covariance(self):
+        return self._measurement_matrix @ self.covariance @ self._measurement_matrix.T + self._measurement_covariance
+
+
+def track_ball(ball_detections, fps):
+    """
+    Groups ball detections into tracks.
+
+    Args:
+        ball_detections (dict): Columns with "frame", "x", "y" and "conf" arrays (see
+            result_store.py), in any order.
+        fps (float): Video frame rate.
+
+    Returns:
+        list: One (n, 3) float array of [frame, x, y] per track, in time order.
+    """
+    max_missed_frames = max(1, int(round(MAX_MISSED_SECONDS * fps)))
+    confident = np.asarray(ball_detections["conf"]) >= MIN_BALL_CONFIDENCE
+    frames = np.asarray(ball_detections["frame"])[confident]
+    if not len(frames):
+        return []
+    # Stable, so detections of one frame keep their order (ties below go to the first)
+    order = np.argsort(frames, kind="stable")
+    frames = frames[order]
+    xs = np.asarray(ball_detections["x"])[confident][order].tolist()
+    ys = np.asarray(ball_detections["y"])[confident][order].tolist()
+    confs = np.asarray(ball_detections["conf"])[confident][order].tolist()
+    # [start, end) of each frame's run of detections
+    bounds = np.concatenate([[0], np.flatnonzero(np.diff(frames)) + 1, [len(frames)]]).tolist()
+    frames = frames.tolist()
+
+    tracks = []
+    current = None # (filter, [[frame, x, y], ...])
+    for run_start, run_end in zip(bounds, bounds[1:]):
+        frame = frames[run_start]
+        candidates = range(run_start, run_end)
+        if current is not None:
+            kalman, points = current
+            last_frame, last_x, last_y = points[-1]
+            gap = frame - last_frame
+            if gap > max_missed_frames:
+                tracks.append(np.array(points))
+                current = None
+            else:
+                # Predicted on a copy that replaces the filter only if a detection joins the track:
+                # the gap is measured from the last point, so a frame whose detections are all
+                # rejected must not advance the filter too
+                predicted = kalman.predicted(gap)
+                best = min(candidates, key=lambda i: predicted.gate_distance(xs[i], ys[i]))
+                if predicted.gate_distance(xs[best], ys[best]) <= GATE_CHI2:
+                    predicted.update(xs[best], ys[best])
+                    points.append([frame, xs[best], ys[best]])
+                    current = (predicted, points)
+                    continue
+                # Outside the prediction gate: a hit/bounce if physically reachable, else noise
+                nearest = min(candidates, key=lambda i: math.hypot(xs[i] - last_x, ys[i] - last_y))
+                if math.hypot(xs[nearest] - last_x, ys[nearest] - last_y) <= MAX_BALL_SPEED_PX_PER_FRAME * gap:
+                    predicted.reset_velocity(
+                        xs[nearest], ys[nearest], (xs[nearest] - last_x) / gap, (ys[nearest] - last_y) / gap
+                    )
+                    points.append([frame, xs[nearest], ys[nearest]])
+                    current = (predicted, points)
+                continue
+
+        best = max(candidates, key=lambda i: confs[i])
+        current = (BallKalmanFilter(xs[best], ys[best]), [[frame, xs[best], ys[best]]])
+
+    if current is not None:
+        tracks.append(np.array(current[1]))
+    return [track.astype(float) for track in tracks]
+
+
+def detect_track_events(track, fps):
+    """
+    Finds hits and bounces along one track from changes of velocity direction.
+
+    Returns:
+        list: {"type": "hit" | "bounce", "frame", "x", "y"} dicts in time order.
+    """
+    w = EVENT_WINDOW
+    if len(track) < 2 * w + 1:
+        return []
+    frames, xy = track[:, 0], track[:, 1:]
+    centre = np.arange(w, len(track) - w)
+    v_in = (xy[centre] - xy[centre - w]) / (frames[centre] - frames[centre - w])[:, None]
+    v_out = (xy[centre + w] - xy[centre]) / (frames[centre + w] - frames[centre])[:, None]
+    speed_in = np.linalg.norm(v_in, axis=1)
+    speed_out = np.linalg.norm(v_out, axis=1)
+    cosine = np.einsum("ij,ij->i", v_in, v_out) / np.maximum(speed_in * speed_out, 1e-9)
+    angle = np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+    is_candidate = (angle >= EVENT_ANGLE_DEG) & (speed_in >= MIN_EVENT_SPEED) & (speed_out >= MIN_EVENT_SPEED)
+
+    # Non-maximum suppression: keep the sharpest turn within MIN_EVENT_GAP_SECONDS
+    min_gap_frames = MIN_EVENT_GAP_SECONDS * fps
+    events = []
+    for k in np.argsort(-angle):
+        if not is_candidate[k]:
+            continue
+        frame = frames[centre[k]]
+        if any(abs(frame - event["frame"]) < min_gap_frames for event in events):
+            continue
+        falling_then_rising = v_in[k, 1] > 0 and v_out[k, 1] < 0
+        same_horizontal_direction = np.sign(v_in[k, 0]) == np.sign(v_out[k, 0]) or abs(v_out[k, 0]) < MIN_EVENT_SPEED
+        events.append({
+            "type": "bounce" if falling_then_rising and same_horizontal_direction else "hit",
+            "frame": int(frame),
+            "x": int(xy[centre[k], 0]),
+            "y": int(xy[centre[k], 1]),
+        })
+    return sorted(events, key=lambda event: event["frame"])
+
+
+def detect_rallies(ball_detections, fps):
+    """
+    Tracks the ball and groups events into rallies.
+
+    Args:
+        ball_detections (dict): Columns with "frame", "x", "y" and "conf" arrays, see track_ball.
+        fps (float): Video frame rate.
+
+    Returns:
+        dict: {"total_shots", "rallies": [...], "events": [...], "tracks": n} where every rally
+              and event carries frame numbers and timestamps in seconds.
+    """
+    fps = fps or FALLBACK_FPS
+    tracks = track_ball(ball_detections, fps)
+    rally_gap_frames = RALLY_GAP_SECONDS * fps
+
+    # Group consecutive tracks into rallies
+    grouped = []
+    for track in tracks:
+        if grouped and track[0, 0] - grouped[-1][-1][-1, 0] <= rally_gap_frames:
+            grouped[-1].append(track)
+        else:
+            grouped.append([track])
+
+    rallies = []
+    events = []
+    for group in grouped:
+        if sum(len(track) for track in group) < MIN_RALLY_DETECTIONS:
+            continue
+        first = group[0][0]
+        serve = {"type": "serve", "frame": int(first[0]), "x": int(first[1]), "y": int(first[2])}
+        rally_events = [serve]
+        for track in group:
+            rally_events.extend(detect_track_events(track, fps))
+        for event in rally_events:
+            event["time"] = round((event["frame"] - 1) / fps, 3) # Frame 1 is t=0
+        shots = sum(1 for event in rally_events if event["type"] in ("serve", "hit"))
+        start_frame, end_frame = int(group[0][0, 0]), int(group[-1][-1, 0])
+        rallies.append({
+            "start_frame": start_frame,
+            "end_frame": end_frame,
+            "start_time": round((start_frame - 1) / fps, 3),
+            "end_time": round((end_frame - 1) / fps, 3),
+            "shots": shots,
+            "bounces": sum(1 for event in rally_events if event["type"] == "bounce"),
+        })
+        events.extend(rally_events)
+
+    return {
+        "total_shots": sum(rally["shots"] for rally in rallies),
+        "rallies": rallies,
+        "events": events,
+        "tracks": len(tracks),
+    }
@@ -0,0 +1,174 @@
+# Save this as batch_scheduler.py (next to app.py)
+"""
+Backfill planning: finds every past booked session without results in a date
+range (optionally only some courts) and picks an analysis mode for each, so the
+whole batch is done before the results are needed.
+
+Modes trade accuracy for speed:
+    "full"    - every frame is analysed (the queue's usual options)
+    "sampled" - motion-gated inference (sampling="adaptive", see frame_sampling.py)
+
+The cost of each session is its frame count divided by the mode's throughput. The
+throughput comes from the jobs that recently completed, or from DEFAULT_MODE_FPS
+when there are too few of them. All sessions start in the fastest mode. Sessions
+are then upgraded to better modes, in court-fair order, for as long as the whole
+batch still fits in the time left. The time left is multiplied by the number of
+job slots (local workers plus remote worker hosts), after the work already queued.
+
+Fairness across courts and the decode cap are enforced when jobs are picked (see
+job_queue.py). This module only decides what to queue and in which mode.
+"""
+import datetime
+
+import cv2
+
+# Analysis modes, best results first, with the analyze_pickleball_video options they set
+MODES = {
+    "full": {"sampling": None},
+    "sampled": {"sampling": "adaptive"},
+}
+MODE_ORDER = ("full", "sampled")
+
+# Frames per second one job slot gets through in each mode, until enough jobs have been measured
+DEFAULT_MODE_FPS = {"full": 25.0, "sampled": 75.0}
+MIN_MEASURED_FRAMES = 10000 # Frames of completed jobs needed before a measured throughput is used
+
+# Share of the time left that is planned for, leaving room for estimation errors
+SAFETY_MARGIN = 0.8
+
+SLOT_DURATION = datetime.timedelta(hours=1) # Bookings are hourly slots
+ASSUMED_FRAMES_PER_SECOND = 30 # For recordings whose frame count can't be read
+
+
+def session_start(date, slot):
+    """Start time of a booked slot on `date` (its "startHour", or its "HH:MM" time)."""
+    if slot.get("startHour") is not None:
+        return datetime.datetime.combine(date, datetime.time(int(slot["startHour"])))
+    hour, minute = (int(part) for part in slot["time"].split(":"))
+    return datetime.datetime.combine(date, datetime.time(hour, minute))
+
+
+def past_booked_sessions(schedules, now, court_ids=None):
+    """
+    Booked sessions that have ended.
+
+    Args:
+        schedules (dict): {date: courts} where courts is the /api/courts structure for that date.
+        now (datetime.datetime): Current local time.
+        court_ids (iterable, optional): Only these courts.
+
+    Returns:
+        list: Dicts with session_id, court_id and start (datetime), by start time.
+    """
+    court_ids = set(court_ids) if court_ids else None
+    sessions = []
+    for date, courts in sorted(schedules.items()):
+        for court in courts:
+            if court_ids is not None and court["id"] not in court_ids:
+                continue
+            for slot in court.get("time_slots", []):
+                if slot.get("status") != "booked" or not slot.get("session_id"):
+                    continue
+                start = session_start(date, slot)
+                if start + SLOT_DURATION <= now:
+                    sessions.append({"session_id": slot["session_id"], "court_id": court["id"], "start": start})
+    sessions.sort(key=lambda session: session["start"])
+    return sessions
+
+
+def video_frame_count(video_path):
+    """Frames in a recording, from its container (or estimated from the slot length if unknown)."""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+    finally:
+        cap.release()
+    return frames if frames > 0 else int(SLOT_DURATION.total_seconds() * ASSUMED_FRAMES_PER_SECOND)
+
+
+def fair_order(sessions):
+    """Round-robin over courts (each court's sessions oldest first), so upgrades are shared evenly."""
+    per_court = {}
+    for session in sorted(sessions, key=lambda session: session["start"]):
+        per_court.setdefault(session["court_id"], []).append(session)
+    queues = list(per_court.values())
+    ordered = []
+    while queues:
+        ordered.extend(queue.pop(0) for queue in queues)
+        queues = [queue for queue in queues if queue]
+    return ordered
+
+
+def job_mode(options):
+    """The mode a job's own options select; jobs queued without one (e.g. from the dashboard) are "full"."""
+    for mode in MODE_ORDER:
+        if all(options.get(name) == value for name, value in MODES[mode].items()):
+            return mode
+    return "full"
+
+
+def throughput_by_mode(completed_jobs):
+    """
+    Frames per second per job slot in each mode, measured from completed jobs (see
+    AnalysisJobQueue.recent_completed_jobs) where there are enough of them, else the defaults.
+    """
+    frames = dict.fromkeys(MODES, 0)
+    seconds = dict.fromkeys(MODES, 0.0)
+    for job in completed_jobs:
+        mode = job_mode(job["options"])
+        if job["finished_at"] and job["finished_at"] > job["started_at"]:
+            frames[mode] += job["frames_total"]
+            seconds[mode] += job["finished_at"] - job["started_at"]
+    return {
+        mode: frames[mode] / seconds[mode] if frames[mode] >= MIN_MEASURED_FRAMES else DEFAULT_MODE_FPS[mode]
+        for mode in MODES
+    }
+
+
+def backlog_seconds(active_jobs, mode_fps, frame_count=video_frame_count):
+    """Job-slot seconds of work still ahead in the queued and running jobs."""
+    total = 0.0
+    for job in active_jobs:
+        frames = job["frames_total"] or frame_count(job["video_path"])
+        total += max(0, frames - job["frames_done"]) / mode_fps[job_mode(job["options"])]
+    return total
+
+
+def plan_backfill(sessions, seconds_left, slots, mode_fps, backlog=0.0):
+    """
+    Picks a mode per session so the batch fits in the time left.
+
+    Args:
+        sessions (list): Dicts with at least session_id, court_id, start and frames.
+        seconds_left (float): Seconds until the results are needed.
+        slots (int): Jobs that can run at once.
+        mode_fps (dict): Frames per second per job slot in each mode (see throughput_by_mode).
+        backlog (float): Job-slot seconds of work already queued ahead of the batch.
+
+    Returns:
+        dict: {"jobs": [session + mode + estimated_seconds, in court-fair order],
+               "estimated_seconds": wall-clock estimate for the batch and the backlog,
+               "fits": whether that is within the time left}
+    """
+    slots = max(1, int(slots))
+    budget = max(0.0, seconds_left) * slots * SAFETY_MARGIN - backlog
+    fastest = MODE_ORDER[-1]
+    jobs = [{**session, "mode": fastest, "estimated_seconds": session["frames"] / mode_fps[fastest]}
+            for session in fair_order(sessions)]
+    spent = sum(job["estimated_seconds"] for job in jobs)
+
+    # Upgrade one mode step at a time across all sessions, so every court gets better results
+    # before any session gets the best
+    for mode in reversed(MODE_ORDER[:-1]):
+        for job in jobs:
+            cost = job["frames"] / mode_fps[mode]
+            if spent - job["estimated_seconds"] + cost <= budget:
+                spent += cost - job["estimated_seconds"]
+                job.update(mode=mode, estimated_seconds=cost)
+
+    estimated_seconds = (spent + backlog) / slots
+    return {
+        "jobs": jobs,
+        "estimated_seconds": round(estimated_seconds, 1),
+        "fits": estimated_seconds <= max(0.0, seconds_left),
+    }
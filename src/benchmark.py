@@ -0,0 +1,519 @@
+# Save this as benchmark.py (next to analyze_video.py)
+"""
+Reproducible benchmark of the video analysis path.
+
+Runs analyze_pickleball_video in several modes (serial, batched, pipelined,
+sampled, parallel) over synthetic test videos, and reports per case:
+
+- fps: frames read per wall-clock second of the analysis;
+- latency_seconds: end to end, from the call to the result files on disk;
+- peak_rss_bytes: peak resident memory of the analysis (the largest segment
+  process too, in parallel mode);
+- output_bytes: size of the saved result files;
+- a few result counts (shots, detections, inferred frames), so a change that
+  alters the results, not only the speed, shows up too;
+- segments: the number of time segments the video was analysed in. A mode with
+  workers whose video was too short to split (see parallel_analysis.plan_segments)
+  is flagged "single_segment" and left out of --compare.
+
+The videos are generated deterministically (synthesize_video): moving player
+rectangles and a ball on a court-coloured background, alternating rallies with
+idle stretches so adaptive sampling has something to skip. By default the
+models are stubs (StubDetector) that find the players and the ball by colour
+and sleep for a configurable per-call and per-frame cost, so the benchmark runs
+offline on any CPU in a few minutes. It then measures everything around the
+models: decoding, batching, queues, post-processing and serialization. Use
+--models yolo to time the real weights instead.
+
+Results can be saved as a baseline and later runs compared against it:
+
+    python benchmark.py --save-baseline benchmark_baselines/main.json
+    python benchmark.py --compare benchmark_baselines/main.json
+
+--compare exits with status 1 if any case got slower, used more memory or
+produced different results beyond --tolerance. Baselines are only comparable
+on the same machine with the same settings, which are recorded in the file.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+# Bump when synthesize_video changes, so cached videos are regenerated
+SYNTHETIC_VIDEO_VERSION = 1
+
+DEFAULT_RESOLUTIONS = "640x360,1280x720"
+# At least 2 x parallel_analysis.MIN_SEGMENT_FRAMES at SYNTHETIC_FPS, so the parallel mode splits
+DEFAULT_SECONDS = "20,30"
+SYNTHETIC_FPS = 30
+
+# Synthetic scene timeline: a rally, then the players standing still with no ball
+RALLY_SECONDS = 6
+IDLE_SECONDS = 4
+# Frames the ball takes to cross the court
+BALL_FLIGHT_FRAMES = 30
+
+# Colours (BGR). The stub models detect players and the ball by these colours only.
+COURT_COLOR = (112, 128, 48)
+LINE_COLOR = (235, 235, 235)
+PLAYER_COLOR = (40, 40, 220)
+BALL_COLOR = (40, 230, 240)
+
+# Stub model cost in milliseconds: (per predict() call, per frame). Roughly the ratio of
+# call overhead to per-frame work of a small YOLO model on a CPU, scaled down.
+DEFAULT_STUB_COSTS = {"player": (2.0, 2.0), "ball": (1.5, 1.5)}
+STUB_COSTS_ENV = "BENCHMARK_STUB_MODEL_COSTS"
+
+# Analysis options of each benchmark mode (analyze_pickleball_video keywords)
+MODES = {
+    "serial": {"batch_size": 1},
+    "batched": {"batch_size": 8},
+    "pipelined": {"batch_size": 8, "pipelined": True},
+    "sampled": {"batch_size": 8, "pipelined": True, "sampling": "adaptive"},
+    "parallel": {"batch_size": 8, "pipelined": True, "workers": 2},
+}
+
+# Relative change beyond which --compare reports a regression (run-to-run noise of a single
+# run is often near 10%; use --repeat for tighter comparisons)
+DEFAULT_TOLERANCE = 0.15
+
+# Result counts that must match the baseline exactly
+RESULT_FIELDS = ("total_shots", "player_detections", "ball_detections", "frames_inferred")
+
+
+# --- Synthetic videos ---
+
+def _court_to_pixels(x, y, width, height):
+    """Court coordinates (0-1 across, 0-1 from the far baseline) to pixels."""
+    return int(x * width), int(y * height)
+
+
+def _draw_court(width, height):
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[:] = COURT_COLOR
+    thickness = max(1, height // 180)
+    for y in (0.1, 0.5, 0.9): # Far baseline, net, near baseline
+        cv2.line(frame, _court_to_pixels(0.1, y, width, height), _court_to_pixels(0.9, y, width, height),
+                 LINE_COLOR, thickness)
+    for x in (0.1, 0.5, 0.9):
+        cv2.line(frame, _court_to_pixels(x, 0.1, width, height), _court_to_pixels(x, 0.9, width, height),
+                 LINE_COLOR, thickness)
+    return frame
+
+
+def _scene_at(frame_index, fps):
+    """
+    Positions of the four players and the ball (None when out of play) at a frame, in court
+    coordinates. A pure function of the frame index, so every run draws the same video.
+    """
+    cycle_frames = (RALLY_SECONDS + IDLE_SECONDS) * fps
+    position = frame_index % cycle_frames
+    in_rally = position < RALLY_SECONDS * fps
+    # Players sway around their spots during a rally and stand still in between
+    t = position / fps if in_rally else RALLY_SECONDS
+    players = [
+        (0.3 + 0.08 * np.sin(t * 1.1), 0.15 + 0.03 * np.sin(t * 0.7)),
+        (0.7 + 0.08 * np.sin(t * 0.9 + 1.0), 0.15 + 0.03 * np.sin(t * 0.8 + 2.0)),
+        (0.3 + 0.08 * np.sin(t * 1.3 + 2.0), 0.85 + 0.03 * np.sin(t * 0.6 + 1.0)),
+        (0.7 + 0.08 * np.sin(t * 1.0 + 3.0), 0.85 + 0.03 * np.sin(t * 0.9 + 3.0)),
+    ]
+    if not in_rally:
+        return players, None
+
+    # The ball crosses from one side to the other every BALL_FLIGHT_FRAMES frames, from the
+    # hitting player to the next, dropping to bounce two thirds of the way across
+    shot, flight_position = divmod(position, BALL_FLIGHT_FRAMES)
+    progress = flight_position / BALL_FLIGHT_FRAMES
+    # Even shots go from a near player (2, 3) to a far one (0, 1), odd shots back; the
+    # receiver of one shot hits the next
+    near_to_far = shot % 2 == 0
+    hitter = players[(2 if near_to_far else 0) + (shot // 2) % 2]
+    receiver = players[(0 if near_to_far else 2) + ((shot + 1) // 2) % 2]
+    x = hitter[0] + (receiver[0] - hitter[0]) * progress
+    y = hitter[1] + (receiver[1] - hitter[1]) * progress
+    bounce_progress = 2 / 3
+    arc = progress / bounce_progress if progress < bounce_progress else (progress - bounce_progress) / (1 - bounce_progress)
+    y -= 0.12 * np.sin(np.pi * arc) * (1.0 if progress < bounce_progress else 0.5)
+    return players, (x, y)
+
+
+def synthesize_video(path, width, height, frames, fps=SYNTHETIC_FPS):
+    """
+    Writes a deterministic synthetic match video: four player rectangles and a ball on a
+    court, with RALLY_SECONDS of play then IDLE_SECONDS of standing still, repeated.
+
+    Args:
+        path (str): Output .mp4 path.
+        width, height (int): Frame size in pixels.
+        frames (int): Number of frames.
+        fps (int): Frame rate.
+    """
+    court = _draw_court(width, height)
+    player_size = (max(4, width // 40), max(8, height // 10))
+    ball_radius = max(2, height // 120)
+    temp_path = f"{path}.tmp.mp4"
+    writer = cv2.VideoWriter(temp_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not write {temp_path}: no mp4v encoder in this OpenCV build")
+    try:
+        for frame_index in range(frames):
+            frame = court.copy()
+            players, ball = _scene_at(frame_index, fps)
+            for x, y in players:
+                cx, cy = _court_to_pixels(x, y, width, height)
+                cv2.rectangle(frame, (cx - player_size[0] // 2, cy - player_size[1]),
+                              (cx + player_size[0] // 2, cy), PLAYER_COLOR, -1)
+            if ball is not None:
+                cv2.circle(frame, _court_to_pixels(*ball, width, height), ball_radius, BALL_COLOR, -1)
+            writer.write(frame)
+    finally:
+        writer.release()
+    os.replace(temp_path, path)
+
+
+def benchmark_videos(video_dir, resolutions, seconds_list, fps=SYNTHETIC_FPS):
+    """
+    Generates (or reuses) the benchmark videos.
+
+    Returns:
+        list: (name, path) for each resolution and length, e.g. ("640x360_10s", ".../...mp4").
+    """
+    os.makedirs(video_dir, exist_ok=True)
+    videos = []
+    for width, height in resolutions:
+        for seconds in seconds_list:
+            name = f"{width}x{height}_{seconds}s"
+            path = os.path.join(video_dir, f"synthetic_v{SYNTHETIC_VIDEO_VERSION}_{name}.mp4")
+            if not os.path.exists(path):
+                print(f"Generating {path}", file=sys.stderr)
+                synthesize_video(path, width, height, seconds * fps, fps)
+            videos.append((name, path))
+    return videos
+
+
+# --- Stub models ---
+
+class _StubTensor:
+    """The bits of a torch tensor's interface the analysis code uses on boxes."""
+
+    def __init__(self, array):
+        self._array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self._array
+
+    @property
+    def shape(self):
+        return self._array.shape
+
+    def __len__(self):
+        return len(self._array)
+
+    def __iter__(self):
+        return (_StubTensor(row) for row in self._array)
+
+
+class _StubBoxes:
+    def __init__(self, data):
+        self.data = _StubTensor(data)
+
+
+class _StubResult:
+    def __init__(self, data):
+        self.boxes = _StubBoxes(data)
+
+
+class StubDetector:
+    """
+    Stand-in for a YOLO model with the same predict() interface. It finds blobs of one
+    colour, returns their boxes as class 0 with a fixed confidence, then sleeps for the
+    configured cost so the model still dominates the time as it would for real.
+
+    Args:
+        color (tuple): BGR colour to detect.
+        call_ms (float): Simulated cost per predict() call.
+        frame_ms (float): Simulated cost per frame.
+        tolerance (int): Per-channel colour tolerance (video compression shifts colours).
+    """
+
+    def __init__(self, color, call_ms=0.0, frame_ms=0.0, tolerance=60):
+        self.lower = np.array([max(0, c - tolerance) for c in color], dtype=np.uint8)
+        self.upper = np.array([min(255, c + tolerance) for c in color], dtype=np.uint8)
+        self.call_seconds = call_ms / 1000
+        self.frame_seconds = frame_ms / 1000
+
+    def _detect(self, frame):
+        mask = cv2.inRange(frame, self.lower, self.upper)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        boxes = [
+            (x, y, x + w, y + h, 0.9, 0)
+            for x, y, w, h, area in stats[1:count].tolist() if area >= 4
+        ]
+        return _StubResult(np.array(boxes, dtype=np.float32).reshape(-1, 6))
+
+    def predict(self, source, verbose=False, **kwargs):
+        started = time.perf_counter()
+        frames = source if isinstance(source, list) else [source]
+        results = [self._detect(frame) for frame in frames]
+        cost = self.call_seconds + self.frame_seconds * len(frames)
+        remaining = cost - (time.perf_counter() - started)
+        if remaining > 0:
+            time.sleep(remaining)
+        return results
+
+
+def load_stub_models():
+    """
+    (player_model, ball_model) stubs, for analyze_video.get_models via its model loader
+    environment variable. Costs come from STUB_COSTS_ENV (JSON), set by this script.
+    """
+    costs = json.loads(os.environ.get(STUB_COSTS_ENV) or json.dumps(DEFAULT_STUB_COSTS))
+    return StubDetector(PLAYER_COLOR, *costs["player"]), StubDetector(BALL_COLOR, *costs["ball"])
+
+
+# --- Measurements ---
+
+def run_case(video_path, options, output_dir):
+    """
+    Analyses one video in one mode and saves the results.
+
+    Returns:
+        dict: The case's measurements, or {"error": ...}.
+    """
+    import analyze_video
+    from profiling import peak_rss_bytes, reset_peak_rss
+    from result_store import result_paths, save_results
+
+    output_base = os.path.join(output_dir, "results")
+    reset_peak_rss()
+    started = time.perf_counter()
+    results = analyze_video.analyze_pickleball_video(video_path, profile=True, **options)
+    if "error" in results:
+        return {"error": results["error"]}
+    save_results(results, output_base)
+    latency = time.perf_counter() - started
+
+    frames = results["sampling"]["frames_total"]
+    case = {
+        "fps": round(frames / latency, 2) if latency > 0 else None,
+        "latency_seconds": round(latency, 4),
+        "peak_rss_bytes": peak_rss_bytes(),
+        "output_bytes": sum(os.path.getsize(path) for path in result_paths(output_base)),
+        "frames": frames,
+        "total_shots": results["total_shots"],
+        "player_detections": int(len(results["player_detections"]["frame"])),
+        "ball_detections": int(len(results["ball_detections"]["frame"])),
+        "frames_inferred": results["sampling"]["frames_inferred"],
+        "stage_seconds": {name: stats["busy_seconds"] for name, stats in results["stage_stats"].items()},
+        # Only set by parallel analysis (workers > 1); everything else reads the video in one go
+        "segments": len(results.get("segments") or [None]),
+    }
+    if options.get("workers", 1) > 1 and case["segments"] == 1:
+        # Too short to split: the case measured a serial run, not the parallel path
+        case["single_segment"] = True
+    if results["profile"].get("segment_peak_rss_bytes") is not None:
+        case["segment_peak_rss_bytes"] = results["profile"]["segment_peak_rss_bytes"]
+    return case
+
+
+def _median_case(runs):
+    """Combines repeated runs of a case: median of the timings, results of the first run."""
+    case = dict(runs[0])
+    for field in ("fps", "latency_seconds"):
+        case[field] = round(statistics.median(run[field] for run in runs), 4)
+    case["peak_rss_bytes"] = max(run["peak_rss_bytes"] or 0 for run in runs) or None
+    return case
+
+
+def run_benchmark(videos, modes, repeat=1, warmup=True):
+    """
+    Runs every mode on every video.
+
+    Args:
+        videos (list): (name, path) pairs from benchmark_videos.
+        modes (list): Names from MODES.
+        repeat (int): Timed runs per case; timings are the median.
+        warmup (bool): Run each mode once on the first video before timing, so one-off costs
+            (model loading, starting the parallel process pool) aren't counted.
+
+    Returns:
+        dict: {"<video name>/<mode>": measurements}.
+    """
+    cases = {}
+    output_dir = tempfile.mkdtemp(prefix="pickleball_benchmark_results_")
+    try:
+        if warmup:
+            for mode in modes:
+                run_case(videos[0][1], MODES[mode], output_dir)
+        for name, path in videos:
+            for mode in modes:
+                runs = [run_case(path, MODES[mode], output_dir) for _ in range(max(1, repeat))]
+                errors = [run["error"] for run in runs if "error" in run]
+                cases[f"{name}/{mode}"] = {"error": errors[0]} if errors else _median_case(runs)
+                print(format_case(f"{name}/{mode}", cases[f"{name}/{mode}"]), file=sys.stderr)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return cases
+
+
+def environment_info(models, stub_costs):
+    """What the measurements depend on besides the code, saved with every baseline."""
+    from model_backends import backend_config
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "models": models,
+        "stub_costs": stub_costs if models == "stub" else None,
+        "model_backend": backend_config() if models == "yolo" else None,
+    }
+
+
+# --- Reporting ---
+
+def _megabytes(value):
+    return f"{value / 1024 ** 2:.1f}" if value else "-"
+
+
+def format_case(key, case):
+    if "error" in case:
+        return f"{key:<28} ERROR {case['error']}"
+    line = (f"{key:<28} {case['fps']:>9.1f} fps {case['latency_seconds']:>8.2f} s "
+            f"{_megabytes(case['peak_rss_bytes']):>8} MB RSS {case['output_bytes'] / 1024:>8.1f} KB out "
+            f"{case['total_shots']:>4} shots {case.get('segments', 1):>2} seg")
+    if case.get("single_segment"):
+        line += " (too short to split, ran serially)"
+    return line
+
+
+def compare(baseline, cases, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compares measurements with a saved baseline.
+
+    Returns:
+        tuple: (report lines, number of regressions). A regression is fps down, latency or
+               peak RSS up, by more than `tolerance` (relative), or different result counts.
+    """
+    lines = []
+    regressions = 0
+    for key, case in cases.items():
+        before = baseline["cases"].get(key)
+        if before is None or "error" in before or "error" in case:
+            lines.append(f"{key:<28} no baseline" if before is None else f"{key:<28} error, not compared")
+            continue
+        if before.get("single_segment") or case.get("single_segment"):
+            # A parallel case that ran as one segment says nothing about the parallel path
+            lines.append(f"{key:<28} single segment, not compared")
+            continue
+        problems = []
+        changes = []
+        for field, worse_when_higher in (("fps", False), ("latency_seconds", True), ("peak_rss_bytes", True)):
+            if not before.get(field) or not case.get(field):
+                continue
+            change = case[field] / before[field] - 1
+            changes.append(f"{field} {change:+.1%}")
+            if (change > tolerance) if worse_when_higher else (change < -tolerance):
+                problems.append(field)
+        for field in RESULT_FIELDS:
+            if before.get(field) != case.get(field):
+                problems.append(f"{field} {before.get(field)} -> {case.get(field)}")
+        if problems:
+            regressions += 1
+        status = "REGRESSION: " + ", ".join(problems) if problems else "ok"
+        lines.append(f"{key:<28} {', '.join(changes):<60} {status}")
+    return lines, regressions
+
+
+def _parse_resolutions(text):
+    resolutions = []
+    for item in text.split(","):
+        width, height = item.lower().split("x")
+        resolutions.append((int(width), int(height)))
+    return resolutions
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Benchmark analyze_video.py on synthetic videos.")
+    parser.add_argument("--resolutions", default=DEFAULT_RESOLUTIONS,
+                        help="Comma-separated WIDTHxHEIGHT video sizes (default: %(default)s)")
+    parser.add_argument("--seconds", default=DEFAULT_SECONDS,
+                        help="Comma-separated video lengths in seconds (default: %(default)s)")
+    parser.add_argument("--modes", default=",".join(MODES),
+                        help="Comma-separated modes to run, from: %(default)s")
+    parser.add_argument("--models", choices=["stub", "yolo"], default="stub",
+                        help="Stub models (offline, any CPU) or the real YOLO weights (default: %(default)s)")
+    parser.add_argument("--stub-costs", default=json.dumps(DEFAULT_STUB_COSTS),
+                        help="JSON {\"player\": [ms per call, ms per frame], \"ball\": [...]} (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per case (default: %(default)s)")
+    parser.add_argument("--no-warmup", action="store_true", help="Don't run each mode once before timing")
+    parser.add_argument("--video-dir", default=os.path.join(tempfile.gettempdir(), "pickleball_benchmark_videos"),
+                        help="Where the synthetic videos are generated and reused (default: %(default)s)")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Save the measurements as a baseline JSON file")
+    parser.add_argument("--compare", metavar="PATH", help="Compare with a saved baseline; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Relative change counted as a regression (default: %(default)s)")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    modes = [mode for mode in args.modes.split(",") if mode]
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        print(f"Unknown modes {unknown}, expected some of {list(MODES)}", file=sys.stderr)
+        sys.exit(2)
+
+    for path_argument in ("video_dir", "save_baseline", "compare"):
+        if getattr(args, path_argument):
+            setattr(args, path_argument, os.path.abspath(getattr(args, path_argument)))
+    # Model paths in analyze_video.py are relative to this directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    stub_costs = json.loads(args.stub_costs)
+    if args.models == "stub":
+        from analyze_video import MODEL_LOADER_ENV
+        # Environment variables reach the parallel mode's segment processes too
+        os.environ[MODEL_LOADER_ENV] = "benchmark:load_stub_models"
+        os.environ[STUB_COSTS_ENV] = json.dumps(stub_costs)
+
+    videos = benchmark_videos(
+        args.video_dir, _parse_resolutions(args.resolutions), [int(s) for s in args.seconds.split(",")]
+    )
+    cases = run_benchmark(videos, modes, repeat=args.repeat, warmup=not args.no_warmup)
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment_info(args.models, stub_costs),
+        "cases": cases,
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        if baseline.get("environment") != report["environment"]:
+            print("Warning: the baseline was recorded in a different environment or with other settings",
+                  file=sys.stderr)
+        lines, regressions = compare(baseline, cases, tolerance=args.tolerance)
+        print("\n".join(lines), file=sys.stderr)
+        if regressions:
+            print(f"{regressions} case(s) regressed", file=sys.stderr)
+            sys.exit(1)
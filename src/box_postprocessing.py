@@ -0,0 +1,191 @@
+# Save this as box_postprocessing.py (next to analyze_video.py)
+"""
+Vectorized post-processing of YOLO boxes into detection columns.
+
+A YOLO Results object holds its boxes as an (N, 6) tensor of
+x1, y1, x2, y2, conf, cls rows. Instead of iterating that tensor and calling
+box.cpu().numpy() on every row (a device-to-host copy and a handful of Python
+objects per box), the boxes of a whole batch of frames are copied to the host
+once, filtered by class and confidence with array masks, and turned into
+centres (and sizes) with array arithmetic. The resulting columns are appended to
+DetectionColumns, growable arrays with the result_store.py column layout, so
+nothing per box is ever a Python object.
+
+Used by analyze_video.py, live_analysis.py and models/new.py.
+"""
+import sys
+
+import numpy as np
+
+from result_store import COLUMN_DTYPES
+
+# Class id of a person in the COCO-trained player model, and of the ball in the ball model
+PLAYER_CLASS = 0
+BALL_CLASS = 0
+
+# Column indexes of a YOLO boxes.data row
+_X1, _Y1, _X2, _Y2, _CONF, _CLS = range(6)
+
+# Initial capacity (rows) of DetectionColumns; doubled whenever it fills up
+INITIAL_CAPACITY = 4096
+
+
+def boxes_array(results):
+    """One frame's Results boxes as an (N, 6) float32 array, with a single host copy."""
+    if results.boxes is None:
+        return np.empty((0, 6), dtype=np.float32)
+    return np.asarray(results.boxes.data.cpu().numpy(), dtype=np.float32).reshape(-1, 6)
+
+
+def batch_boxes_array(results_batch):
+    """
+    The boxes of a batch of frames' Results as one array.
+
+    When the boxes are torch tensors they are concatenated on their device first, so a
+    whole batch costs one device-to-host copy rather than one per frame (or per box).
+
+    Returns:
+        tuple: (boxes, frame_offsets) - an (N, 6) float32 array and, per row, the index
+               of its frame in `results_batch`.
+    """
+    tensors = [results.boxes.data for results in results_batch if results.boxes is not None]
+    offsets = [offset for offset, results in enumerate(results_batch) if results.boxes is not None]
+    counts = [len(tensor) for tensor in tensors]
+    frame_offsets = np.repeat(np.asarray(offsets, dtype=np.int32), counts)
+    if not tensors:
+        return np.empty((0, 6), dtype=np.float32), frame_offsets
+
+    # Tensors can only be torch tensors if torch is already loaded; never import it here
+    torch = sys.modules.get("torch")
+    if torch is not None and all(isinstance(tensor, torch.Tensor) for tensor in tensors):
+        data = torch.cat(tensors).cpu().numpy()
+    else:
+        data = np.concatenate([np.asarray(tensor.cpu().numpy()).reshape(-1, 6) for tensor in tensors])
+    return np.asarray(data, dtype=np.float32).reshape(-1, 6), frame_offsets
+
+
+def box_centers(boxes, target_class=0, min_conf=0.0):
+    """
+    Centres of the boxes of one class.
+
+    Args:
+        boxes (np.ndarray): (N, 6) boxes from boxes_array/batch_boxes_array.
+        target_class (int): Class id to keep.
+        min_conf (float): Lowest confidence to keep (YOLO's own threshold applies first).
+
+    Returns:
+        tuple: (keep, x, y, conf) - the boolean row mask and, for the kept rows, int32
+               centre coordinates (truncated, as int() would) and float32 confidences.
+    """
+    keep = (boxes[:, _CLS].astype(np.int64) == target_class) & (boxes[:, _CONF] >= min_conf)
+    kept = boxes[keep]
+    x = ((kept[:, _X1] + kept[:, _X2]) / 2).astype(np.int32)
+    y = ((kept[:, _Y1] + kept[:, _Y2]) / 2).astype(np.int32)
+    return keep, x, y, kept[:, _CONF].astype(np.float32)
+
+
+def box_sizes(boxes, keep):
+    """Widths and heights (int32, rounded) of the rows of `boxes` selected by `keep`."""
+    kept = boxes[keep]
+    w = np.rint(kept[:, _X2] - kept[:, _X1]).astype(np.int32)
+    h = np.rint(kept[:, _Y2] - kept[:, _Y1]).astype(np.int32)
+    return w, h
+
+
+def first_per_frame(frames):
+    """Mask keeping only the first row of each frame (rows grouped by frame, in model order)."""
+    keep = np.ones(len(frames), dtype=bool)
+    keep[1:] = frames[1:] != frames[:-1]
+    return keep
+
+
+class DetectionColumns:
+    """
+    Growable columns of one result_store table ("player_detections" or "ball_detections").
+
+    Rows are appended in bulk into preallocated arrays whose capacity doubles when full, so
+    appending is amortized O(rows) with no per-row Python objects.
+
+    Args:
+        table (str): A key of result_store.COLUMN_DTYPES.
+        capacity (int): Initial capacity in rows.
+    """
+
+    def __init__(self, table, capacity=INITIAL_CAPACITY):
+        self.table = table
+        self.dtypes = COLUMN_DTYPES[table]
+        self._arrays = {field: np.empty(max(1, capacity), dtype=dtype) for field, dtype in self.dtypes.items()}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, **columns):
+        """
+        Appends rows given as equal-length arrays per field, e.g. append(frame=..., x=..., y=...).
+        Missing fields get the column default (False, or -1 for track_id).
+        """
+        count = len(next(iter(columns.values())))
+        if count == 0:
+            return
+        needed = self._size + count
+        capacity = len(next(iter(self._arrays.values())))
+        if needed > capacity:
+            while capacity < needed:
+                capacity *= 2
+            for field, array in self._arrays.items():
+                grown = np.empty(capacity, dtype=array.dtype)
+                grown[:self._size] = array[:self._size]
+                self._arrays[field] = grown
+        for field, array in self._arrays.items():
+            if field in columns:
+                array[self._size:needed] = columns[field]
+            else:
+                array[self._size:needed] = -1 if field == "track_id" else 0
+        self._size = needed
+
+    def columns(self):
+        """The rows so far as {field: array}, trimmed copies (safe to keep after more appends)."""
+        return {field: array[:self._size].copy() for field, array in self._arrays.items()}
+
+
+def empty_columns(table):
+    """A table with no rows, as {field: empty array}."""
+    return {field: np.empty(0, dtype=dtype) for field, dtype in COLUMN_DTYPES[table].items()}
+
+
+def concatenate_columns(table, parts):
+    """Concatenates several {field: array} tables (e.g. one per segment) in order."""
+    if not parts:
+        return empty_columns(table)
+    return {
+        field: np.concatenate([part[field] for part in parts]).astype(dtype, copy=False)
+        for field, dtype in COLUMN_DTYPES[table].items()
+    }
+
+
+def collect_batch_detections(frame_numbers, player_results_batch, ball_results_batch, player_columns, ball_columns):
+    """
+    Appends a batch's player and ball detections to their DetectionColumns.
+
+    Every player box of class PLAYER_CLASS is kept, with its size (for tracking, see
+    player_tracking.py); for the ball, the first box of class BALL_CLASS in each frame
+    (one ball per frame).
+
+    Args:
+        frame_numbers (np.ndarray): Frame number of each entry of the results batches.
+        player_results_batch, ball_results_batch (list): The models' Results, one per frame.
+        player_columns, ball_columns (DetectionColumns): Where to append.
+    """
+    frame_numbers = np.asarray(frame_numbers, dtype=np.int32)
+
+    boxes, offsets = batch_boxes_array(player_results_batch)
+    keep, x, y, conf = box_centers(boxes, PLAYER_CLASS)
+    w, h = box_sizes(boxes, keep)
+    player_columns.append(frame=frame_numbers[offsets[keep]], x=x, y=y, w=w, h=h, conf=conf)
+
+    boxes, offsets = batch_boxes_array(ball_results_batch)
+    keep, x, y, conf = box_centers(boxes, BALL_CLASS)
+    frames = frame_numbers[offsets[keep]]
+    first = first_per_frame(frames)
+    ball_columns.append(frame=frames[first], x=x[first], y=y[first], conf=conf[first])
@@ -0,0 +1,315 @@
+# Save this as checkpoints.py (next to analyze_video.py)
+"""
+Resumable, incremental analysis through per-segment checkpoints.
+
+The video is analysed in consecutive segments of `segment_frames` frames. As
+soon as a segment's raw detections are ready they are saved in the checkpoint
+directory (one result_store file pair per segment). A later run with the same
+directory:
+
+- reuses every full segment from frame 0 onwards and only analyses the frames
+  after them, so an analysis that crashed, was killed or was cancelled resumes
+  from its last finished segment instead of frame 0;
+- redoes the last, partial segment and carries on to the new end of the file,
+  so a recording that is still being written can be re-analysed incrementally
+  as footage is appended.
+
+Checkpoints are only reused by a run with the same output-affecting options,
+the same model weights and a video with the same first frame (see
+CheckpointStore); otherwise they are discarded. Cross-frame work (interpolation,
+ball tracking) always runs on the merged detections, as in parallel_analysis.py.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+import cv2
+
+from result_store import load_columns, load_summary, result_paths, save_results
+
+# Frames per checkpoint segment (1 minute at 30 fps)
+DEFAULT_CHECKPOINT_FRAMES = 1800
+
+# Retention of checkpoint directories (see prune_checkpoints). A session's checkpoints hold its
+# raw detections, about 15 MB per hour of four-player video, on top of its results.
+DEFAULT_CHECKPOINT_MAX_BYTES = 1024 ** 3
+DEFAULT_CHECKPOINT_MAX_AGE_SECONDS = 2 * 24 * 3600
+# A recording that hasn't been written to for this long is final: its checkpoints can only
+# serve another run of the same analysis, so they are dropped once it completes
+RECORDING_FINAL_SECONDS = 600
+
+# Size of the first-frame thumbnail that identifies the video (see _first_frame_signature)
+SIGNATURE_THUMBNAIL_SIZE = 32
+
+MANIFEST_FILE = "manifest.json"
+
+
+def _first_frame_signature(video_path):
+    """
+    Hash of a grayscale thumbnail of the first decoded frame. Unlike a hash of the file's
+    first bytes, it survives a container rewriting its header as a recording grows.
+    """
+    cap = cv2.VideoCapture(video_path)
+    ret, frame = cap.read()
+    cap.release()
+    if not ret:
+        return None
+    thumbnail = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (SIGNATURE_THUMBNAIL_SIZE,) * 2,
+                           interpolation=cv2.INTER_AREA)
+    return hashlib.blake2b(thumbnail.tobytes(), digest_size=20).hexdigest()
+
+
+class CheckpointStore:
+    """
+    Checkpoint directory of one video.
+
+    Args:
+        directory (str): Where the checkpoints live (created if needed).
+        video_path (str): The video being analysed.
+        segment_frames (int): Frames per segment.
+        options (dict): Analysis options; those that change the output are part of the
+            checkpoints' identity, along with the model weights.
+    """
+
+    def __init__(self, directory, video_path, segment_frames, options=None):
+        from model_backends import backend_config
+        from result_cache import EXECUTION_OPTIONS, default_model_paths, model_loader, weights_digest
+        from result_store import COLUMN_DTYPES
+
+        self.directory = directory
+        self.segment_frames = max(1, int(segment_frames))
+        os.makedirs(directory, exist_ok=True)
+        self.identity = {
+            "first_frame": _first_frame_signature(video_path),
+            "segment_frames": self.segment_frames,
+            "weights": [weights_digest(path) for path in default_model_paths()],
+            "options": {
+                name: value for name, value in sorted((options or {}).items())
+                if name not in EXECUTION_OPTIONS and value is not None
+            },
+            # Checkpoints written with another column layout can't be merged with new segments
+            "columns": {table: list(fields) for table, fields in COLUMN_DTYPES.items()},
+        }
+        if model_loader() is not None:
+            self.identity["model_loader"] = model_loader()
+        if backend_config() is not None:
+            self.identity["model_backend"] = backend_config()
+
+        manifest_path = os.path.join(directory, MANIFEST_FILE)
+        try:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+        if manifest != self.identity:
+            if manifest is not None:
+                print(f"Discarding checkpoints in {directory}: video, models or options changed", file=sys.stderr)
+            self.clear()
+            with open(manifest_path, "w") as f:
+                json.dump(self.identity, f)
+
+    def _segment_base(self, start_frame):
+        return os.path.join(self.directory, f"segment_{start_frame:09d}")
+
+    def clear(self):
+        """Deletes all segment checkpoints."""
+        for name in os.listdir(self.directory):
+            if name.startswith("segment_"):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(self.directory, name))
+
+    def save(self, start_frame, detections):
+        """Saves one segment's detect_video_range output."""
+        save_results({
+            "start_frame": start_frame,
+            "frames_read": detections["frames_read"],
+            "inferred_frames": detections["inferred_frames"],
+            "fps": detections["fps"],
+            "video_dimensions": detections["video_dimensions"],
+            "total_frames": detections["total_frames"],
+            "player_detections": detections["player_detections"],
+            "ball_detections": detections["ball_detections"],
+        }, self._segment_base(start_frame))
+
+    def load_completed(self):
+        """
+        Loads the full segments from frame 0 up to the first missing or partial one.
+
+        Returns:
+            list: detect_video_range-style detections of each segment, in order.
+        """
+        from video_pipeline import new_stage_stats
+
+        completed = []
+        start_frame = 0
+        while os.path.exists(result_paths(self._segment_base(start_frame))[0]):
+            base = self._segment_base(start_frame)
+            summary = load_summary(base)
+            if summary["frames_read"] != self.segment_frames:
+                # The video ended inside this segment (or it was the open-ended last segment of a
+                # parallel run); redo it in case footage was appended
+                break
+            completed.append({
+                "player_detections": load_columns(base, "player_detections", mmap=False),
+                "ball_detections": load_columns(base, "ball_detections", mmap=False),
+                "inferred_frames": summary["inferred_frames"],
+                "frames_read": summary["frames_read"],
+                "stage_stats": new_stage_stats(), # Time spent by earlier runs isn't counted
+                "fps": summary["fps"],
+                "video_dimensions": summary["video_dimensions"],
+                "total_frames": summary["total_frames"],
+            })
+            start_frame += self.segment_frames
+        return completed
+
+
+def detect_with_checkpoints(video_path, checkpoint_dir, segment_frames=DEFAULT_CHECKPOINT_FRAMES, workers=1,
+                            player_model=None, ball_model=None, progress_callback=None, **options):
+    """
+    Checkpointed counterpart of analyze_video.detect_video_range over the whole video.
+
+    Args:
+        checkpoint_dir (str): Checkpoint directory of this video (see CheckpointStore).
+        segment_frames (int): Frames per checkpoint segment.
+        workers (int): Values above 1 analyse the remaining segments in the
+            parallel_analysis process pool; player_model/ball_model are not used then.
+        progress_callback (callable, optional): progress_callback(frames_done, frames_total)
+            over the whole video, counting the frames restored from checkpoints as done.
+        options: Passed to detect_video_range (batch_size, pipelined, sampling, ...).
+
+    Returns:
+        dict: Merged detections in the detect_video_range format, plus "segments" and
+              "resumed_from_frame"; or {"error": ...}.
+    """
+    import analyze_video
+    from parallel_analysis import merge_segments, run_segments
+
+    store = CheckpointStore(checkpoint_dir, video_path, segment_frames, options)
+    segment_frames = store.segment_frames
+    done = store.load_completed()
+    resume_frame = len(done) * segment_frames
+    if done:
+        print(f"Resuming {video_path} from frame {resume_frame + 1} ({len(done)} checkpointed segments)",
+              file=sys.stderr)
+
+    cap = analyze_video.open_video_at(video_path)
+    if cap is None:
+        return {"error": f"Could not open video file: {video_path}"}
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    def report(frames_done, frames_total):
+        if progress_callback is not None:
+            progress_callback(resume_frame + frames_done, max(total_frames, resume_frame + frames_total))
+
+    def save_segment(start_frame, detections):
+        if "error" not in detections and detections["frames_read"] > 0:
+            store.save(start_frame, detections)
+
+    new_segments = []
+    new_detections = []
+    if workers > 1:
+        # Every remaining segment is a pool task; the last one runs to the real end of the video
+        new_segments = [(start, segment_frames) for start in range(resume_frame, total_frames, segment_frames)]
+        if new_segments:
+            new_segments[-1] = (new_segments[-1][0], None)
+            new_detections = run_segments(
+                video_path, workers, new_segments, progress_callback=report,
+                frames_total=total_frames - resume_frame,
+                on_segment_done=lambda index, detections: save_segment(new_segments[index][0], detections),
+                **options,
+            )
+    if workers <= 1 or not new_segments:
+        if player_model is None or ball_model is None:
+            player_model, ball_model = analyze_video.get_models()
+        # One segment at a time until the video runs out (the container frame count is only an estimate)
+        start_frame = resume_frame
+        while True:
+            def report_segment(frames_done, frames_total, start_frame=start_frame):
+                report(start_frame - resume_frame + frames_done, max(total_frames - resume_frame, frames_total))
+
+            detections = analyze_video.detect_video_range(
+                video_path, player_model, ball_model, start_frame=start_frame, max_frames=segment_frames,
+                progress_callback=report_segment, **options
+            )
+            if "error" in detections:
+                return detections
+            save_segment(start_frame, detections)
+            new_segments.append((start_frame, segment_frames))
+            new_detections.append(detections)
+            if detections["frames_read"] < segment_frames:
+                break
+            start_frame += segment_frames
+
+    for detections in new_detections:
+        if "error" in detections:
+            return detections
+
+    segments = [(index * segment_frames, segment_frames) for index in range(len(done))] + new_segments
+    segment_detections = done + new_detections
+    # Drop segments past the end of the video (e.g. when the previous run ended on a segment boundary)
+    while len(segment_detections) > 1 and segment_detections[-1]["frames_read"] == 0:
+        segments.pop()
+        segment_detections.pop()
+    segments[-1] = (segments[-1][0], None)
+
+    merged = merge_segments(segments, segment_detections)
+    merged["resumed_from_frame"] = resume_frame
+    return merged
+
+
+def recording_is_final(video_path, final_after=RECORDING_FINAL_SECONDS, now=None):
+    """True if the recording hasn't changed for final_after seconds (or is gone)."""
+    now = time.time() if now is None else now
+    try:
+        return now - os.path.getmtime(video_path) >= final_after
+    except OSError:
+        return True
+
+
+def _directory_usage(directory):
+    """(total bytes, latest modification time) of the files in a checkpoint directory."""
+    total, latest = 0, os.path.getmtime(directory)
+    for entry in os.scandir(directory):
+        if entry.is_file():
+            stat = entry.stat()
+            total += stat.st_size
+            latest = max(latest, stat.st_mtime)
+    return total, latest
+
+
+def prune_checkpoints(root, max_bytes=DEFAULT_CHECKPOINT_MAX_BYTES, max_age_seconds=DEFAULT_CHECKPOINT_MAX_AGE_SECONDS,
+                      keep=(), now=None):
+    """
+    Deletes checkpoint directories under `root` (one per session) that are older than
+    max_age_seconds, then the least recently written ones until the rest fit in max_bytes.
+
+    Args:
+        keep (iterable): Directory names never to delete, e.g. sessions with an active job.
+
+    Returns:
+        list: Names of the deleted directories.
+    """
+    now = time.time() if now is None else now
+    keep = set(keep)
+    directories = []
+    with contextlib.suppress(FileNotFoundError):
+        for entry in os.scandir(root):
+            if entry.is_dir() and entry.name not in keep:
+                with contextlib.suppress(OSError):
+                    directories.append((entry.name, *_directory_usage(entry.path)))
+    directories.sort(key=lambda directory: directory[2]) # Least recently written first
+
+    total = sum(size for _, size, _ in directories)
+    removed = []
+    for name, size, latest in directories:
+        if now - latest <= max_age_seconds and total <= max_bytes:
+            break
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        removed.append(name)
+        total -= size
+    return removed
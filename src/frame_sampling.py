@@ -0,0 +1,246 @@
+# Save this as frame_sampling.py (next to analyze_video.py)
+"""
+Adaptive frame sampling: decides per frame whether the player and ball models
+need to run, based on a cheap motion score from downscaled grayscale frames.
+
+- While there is motion (a rally), frames are inferred every ACTIVE_STRIDE frames.
+- After RALLY_HOLD_FRAMES frames without motion the court counts as idle and
+  only every IDLE_STRIDE-th frame is inferred.
+- A motion spike ends an idle stretch immediately, so the first frames of a
+  rally are not skipped.
+
+Player positions for skipped frames are filled in afterwards by
+interpolate_player_columns, following each tracked player (see
+player_tracking.py). The frames that were actually inferred are kept
+as run-length ranges (see frame_ranges) so sampled runs can be compared
+against full-rate runs.
+"""
+import cv2
+import numpy as np
+
+from result_store import COLUMN_DTYPES
+
+# Width of the grayscale thumbnail the motion score is computed on
+MOTION_THUMBNAIL_WIDTH = 160
+# A thumbnail pixel counts as changed when it differs by more than this (0-255 scale),
+# which keeps compression noise out of the score
+PIXEL_CHANGE_THRESHOLD = 12
+# Fraction of changed thumbnail pixels that counts as motion
+MOTION_THRESHOLD = 0.001
+# Infer every Nth frame while a rally is on / while the court is idle
+ACTIVE_STRIDE = 1
+IDLE_STRIDE = 10
+# Frames without motion before the court counts as idle again
+RALLY_HOLD_FRAMES = 45
+# Longest gap (in frames) that player positions are interpolated across
+MAX_INTERPOLATION_GAP = 15
+# Furthest (in pixels) a player may move between two inferred frames and still be matched
+MAX_INTERPOLATION_DISTANCE = 80
+
+
+class AdaptiveSampler:
+    """
+    Stateful per-frame sampling decision. Frames must be offered in order.
+
+    Args:
+        motion_threshold (float): See MOTION_THRESHOLD.
+        active_stride (int): See ACTIVE_STRIDE.
+        idle_stride (int): See IDLE_STRIDE.
+        rally_hold_frames (int): See RALLY_HOLD_FRAMES.
+    """
+
+    def __init__(self, motion_threshold=MOTION_THRESHOLD, active_stride=ACTIVE_STRIDE,
+                 idle_stride=IDLE_STRIDE, rally_hold_frames=RALLY_HOLD_FRAMES):
+        self.motion_threshold = motion_threshold
+        self.active_stride = max(1, int(active_stride))
+        self.idle_stride = max(1, int(idle_stride))
+        self.rally_hold_frames = rally_hold_frames
+        self._previous_thumbnail = None
+        self._last_motion_frame = None
+        self._last_inferred_frame = None
+        self.frames_seen = 0
+        self.frames_inferred = 0
+
+    def motion_score(self, frame):
+        """Fraction of thumbnail pixels that changed since the previous frame."""
+        height, width = frame.shape[:2]
+        thumbnail_size = (MOTION_THUMBNAIL_WIDTH, max(1, round(height * MOTION_THUMBNAIL_WIDTH / width)))
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        thumbnail = cv2.resize(gray, thumbnail_size, interpolation=cv2.INTER_AREA)
+        previous, self._previous_thumbnail = self._previous_thumbnail, thumbnail
+        if previous is None:
+            return float("inf") # Always infer the first frame
+        return float(np.count_nonzero(cv2.absdiff(thumbnail, previous) > PIXEL_CHANGE_THRESHOLD)) / thumbnail.size
+
+    def should_infer(self, frame_idx, frame):
+        """Returns True if the models should run on this frame."""
+        self.frames_seen += 1
+        moving = self.motion_score(frame) >= self.motion_threshold
+        was_idle = not self.is_active(frame_idx)
+        if moving:
+            self._last_motion_frame = frame_idx
+
+        if self._last_inferred_frame is None or (moving and was_idle):
+            infer = True # First frame, or a rally starting after an idle stretch
+        else:
+            stride = self.active_stride if self.is_active(frame_idx) else self.idle_stride
+            infer = frame_idx - self._last_inferred_frame >= stride
+
+        if infer:
+            self._last_inferred_frame = frame_idx
+            self.frames_inferred += 1
+        return infer
+
+    def is_active(self, frame_idx):
+        """True while within rally_hold_frames of the last motion."""
+        return self._last_motion_frame is not None and frame_idx - self._last_motion_frame <= self.rally_hold_frames
+
+
+def frame_ranges(frames):
+    """[1, 2, 3, 7, 9, 10] -> [[1, 3], [7, 7], [9, 10]] (inclusive ranges, input sorted)."""
+    ranges = []
+    for frame in frames:
+        if ranges and frame == ranges[-1][1] + 1:
+            ranges[-1][1] = frame
+        else:
+            ranges.append([frame, frame])
+    return ranges
+
+
+def interpolate_player_columns(player_detections, inferred_frames, max_gap=MAX_INTERPOLATION_GAP,
+                               max_distance=MAX_INTERPOLATION_DISTANCE):
+    """
+    Fills player positions for frames skipped between consecutive inferred frames.
+
+    Players in the two inferred frames are paired by track id, and those without one (or
+    whose track doesn't continue) greedily by nearest distance (up to max_distance). Each
+    pair is interpolated linearly. Interpolated rows have interpolated=True, the lower
+    confidence of the pair and the pair's track id (-1 if the two differ). Gaps longer than
+    max_gap frames are left empty.
+
+    Works on the columns throughout: rows are grouped by track id with a sort, each row's
+    next inferred frame is found with np.searchsorted, the (rare) rows left unpaired by track
+    id are paired in one batch (see _nearest_pairs), and the blends are array arithmetic.
+
+    Args:
+        player_detections (dict): player_detections columns (see result_store.py).
+        inferred_frames (list): Sorted frame numbers the models ran on.
+
+    Returns:
+        dict: New columns with the interpolated rows added, in frame order.
+    """
+    dtypes = COLUMN_DTYPES["player_detections"]
+    count = len(player_detections["frame"])
+    columns = {
+        field: np.asarray(player_detections[field], dtype=dtype) if field in player_detections
+        else np.full(count, -1 if field == "track_id" else 0, dtype=dtype)
+        for field, dtype in dtypes.items()
+    }
+    inferred = np.asarray(inferred_frames, dtype=np.int64)
+    if count == 0 or len(inferred) < 2:
+        return columns
+    frames = columns["frame"].astype(np.int64)
+    track_ids = columns["track_id"]
+
+    # Each row's inferred frames before and after it, and whether the gaps to them are filled
+    slot = np.searchsorted(inferred, frames)
+    on_inferred = inferred[np.minimum(slot, len(inferred) - 1)] == frames
+    next_frame = inferred[np.minimum(slot + 1, len(inferred) - 1)]
+    previous_frame = inferred[np.maximum(slot - 1, 0)]
+    fills_next = on_inferred & (next_frame - frames > 1) & (next_frame - frames <= max_gap)
+    fills_previous = on_inferred & (slot > 0) & (frames - previous_frame > 1) & (frames - previous_frame <= max_gap)
+
+    # Pairs along each track: consecutive rows of a track id, one inferred frame apart
+    order = np.lexsort((frames, track_ids))
+    first, second = order[:-1], order[1:]
+    same_track = (track_ids[first] >= 0) & (track_ids[first] == track_ids[second])
+    tracked = same_track & fills_next[first] & (frames[second] == next_frame[first])
+    pairs_a, pairs_b = first[tracked], second[tracked]
+
+    # Everything else at either end of a filled gap is paired by distance, all gaps at once
+    unpaired_a = fills_next.copy()
+    unpaired_a[pairs_a] = False
+    unpaired_b = fills_previous.copy()
+    unpaired_b[pairs_b] = False
+    rows_a = np.flatnonzero(unpaired_a)
+    rows_b = np.flatnonzero(unpaired_b)
+    nearest_a, nearest_b = _nearest_pairs(columns["x"], columns["y"], rows_a, slot[rows_a], rows_b, slot[rows_b] - 1,
+                                          max_distance)
+    pairs_a = np.concatenate([pairs_a, nearest_a])
+    pairs_b = np.concatenate([pairs_b, nearest_b])
+    # Within an interpolated frame: track pairs in row order, then the distance pairs
+    pair_order = np.concatenate([pairs_a[:len(pairs_a) - len(nearest_a)], count + np.arange(len(nearest_a))])
+
+    # One new row per skipped frame of each pair, at fraction t of the way from a to b
+    steps = frames[pairs_b] - frames[pairs_a] - 1
+    rows_a = np.repeat(pairs_a, steps)
+    rows_b = np.repeat(pairs_b, steps)
+    offset = np.arange(int(steps.sum())) - np.repeat(np.cumsum(steps) - steps, steps) + 1
+    t = offset / (frames[rows_b] - frames[rows_a])
+
+    def blend(field):
+        a = columns[field][rows_a].astype(np.float64)
+        return np.rint(a + (columns[field][rows_b] - a) * t)
+
+    added = {
+        "frame": frames[rows_a] + offset,
+        "x": blend("x"),
+        "y": blend("y"),
+        "w": blend("w"),
+        "h": blend("h"),
+        "conf": np.minimum(columns["conf"][rows_a], columns["conf"][rows_b]),
+        "interpolated": np.ones(len(rows_a), dtype=bool),
+        "track_id": np.where(track_ids[rows_a] == track_ids[rows_b], track_ids[rows_a], -1),
+    }
+    # Original rows keep their order; the frames they are on never get interpolated rows
+    sort_key = np.concatenate([np.arange(count), np.repeat(pair_order, steps)])
+    merged_frames = np.concatenate([frames, added["frame"]])
+    merged_order = np.lexsort((sort_key, merged_frames))
+    return {
+        field: np.concatenate([columns[field], added[field].astype(dtype)])[merged_order]
+        for field, dtype in dtypes.items()
+    }
+
+
+def _nearest_pairs(xs, ys, rows_a, gaps_a, rows_b, gaps_b, max_distance):
+    """
+    Greedy nearest-neighbour pairing of rows_a with rows_b of the same gap, up to max_distance
+    apart: within each gap, the closest pair is taken first, then the closest of the rest, and
+    so on. Every gap is paired at once, one pair per gap and round, so the Python loop runs
+    once per player rather than once per gap.
+
+    Returns:
+        tuple: (pairs_a, pairs_b) row index arrays, by gap and then in the order they were taken.
+    """
+    # Every candidate pair within a gap (a handful of players on each side)
+    order_b = np.argsort(gaps_b, kind="stable")
+    start = np.searchsorted(gaps_b[order_b], gaps_a, side="left")
+    counts = np.searchsorted(gaps_b[order_b], gaps_a, side="right") - start
+    first_of_a = np.cumsum(counts) - counts
+    candidate_a = np.repeat(rows_a, counts)
+    candidate_b = rows_b[order_b[np.repeat(start - first_of_a, counts) + np.arange(int(counts.sum()))]]
+    candidate_gap = np.repeat(gaps_a, counts)
+    offsets = np.stack([xs[candidate_a] - xs[candidate_b], ys[candidate_a] - ys[candidate_b]], axis=1)
+    distances = np.linalg.norm(offsets.astype(np.float32), axis=1)
+    close = distances <= max_distance
+    order = np.lexsort((candidate_b[close], candidate_a[close], distances[close], candidate_gap[close]))
+    candidate_a, candidate_b, candidate_gap = (
+        candidate_a[close][order], candidate_b[close][order], candidate_gap[close][order],
+    )
+
+    pairs_a, pairs_b, pair_gaps, rounds = [], [], [], []
+    round_number = 0
+    while len(candidate_a):
+        # The closest remaining pair of every gap, then drop the candidates that reuse its rows
+        _, taken = np.unique(candidate_gap, return_index=True)
+        pairs_a.append(candidate_a[taken])
+        pairs_b.append(candidate_b[taken])
+        pair_gaps.append(candidate_gap[taken])
+        rounds.append(np.full(len(taken), round_number))
+        free = ~(np.isin(candidate_a, candidate_a[taken]) | np.isin(candidate_b, candidate_b[taken]))
+        candidate_a, candidate_b, candidate_gap = candidate_a[free], candidate_b[free], candidate_gap[free]
+        round_number += 1
+    if not pairs_a:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    order = np.lexsort((np.concatenate(rounds), np.concatenate(pair_gaps)))
+    return np.concatenate(pairs_a)[order].astype(np.int64), np.concatenate(pairs_b)[order].astype(np.int64)
@@ -0,0 +1,93 @@
+# Save this as heatmap.py (next to analyze_video.py)
+"""
+Player position heatmaps, pre-aggregated on the server.
+
+Player detections are binned into a grid over the video frame at the finest
+resolution in HEATMAP_RESOLUTIONS, in one vectorized pass (np.bincount over
+flat cell indices). Each coarser grid is made by summing blocks of the finer
+one, so every resolution holds exactly the same counts. The grids are made
+for the whole session and for each tracked player (track_id >= 0).
+
+The grids are computed while building the results and saved with them (see
+result_store.py), so the heatmap endpoint returns a fixed-size grid however
+long the video is.
+"""
+import numpy as np
+
+# Grid sizes (cells per side); each must divide the largest one
+HEATMAP_RESOLUTIONS = (16, 32, 64, 128)
+DEFAULT_HEATMAP_RESOLUTION = 64
+
+# Name of the whole-session grid; per-player grids are named "player_<track_id>"
+SESSION_GRID = "session"
+
+
+def grid_name(resolution, player=None):
+    """Key of one grid in the results' "heatmaps" table, e.g. "64.session" or "64.player_3"."""
+    return f"{resolution}.{SESSION_GRID if player is None else f'player_{player}'}"
+
+
+def compute_heatmaps(x, y, track_id, width, height, resolutions=HEATMAP_RESOLUTIONS):
+    """
+    Bins player positions into grids.
+
+    Args:
+        x, y (array): Player centre points in pixels.
+        track_id (array): Player track ids; -1 (untracked) points only count towards the session grid.
+        width, height (int): Video frame size the points are relative to.
+        resolutions (tuple): Grid sizes to produce.
+
+    Returns:
+        dict: {grid_name(resolution, player): (resolution, resolution) float32 array of counts},
+              rows are y and columns are x.
+    """
+    finest = max(resolutions)
+    if any(finest % resolution for resolution in resolutions):
+        raise ValueError(f"Heatmap resolutions {resolutions} must all divide {finest}")
+    x = np.asarray(x)
+    y = np.asarray(y)
+    track_id = np.asarray(track_id)
+
+    # Flat cell index of every point on the finest grid; points on the far edge go in the last cell
+    column = np.clip((x * finest) // max(1, width), 0, finest - 1).astype(np.int64)
+    row = np.clip((y * finest) // max(1, height), 0, finest - 1).astype(np.int64)
+    cell = row * finest + column
+    cells = finest * finest
+
+    players = np.unique(track_id[track_id >= 0])
+    finest_grids = {None: np.bincount(cell, minlength=cells).reshape(finest, finest)}
+    if len(players):
+        # One bincount for all players: player k's cells are offset by k * cells
+        player_index = np.searchsorted(players, track_id)
+        tracked = track_id >= 0
+        per_player = np.bincount(player_index[tracked] * cells + cell[tracked], minlength=len(players) * cells)
+        for k, player in enumerate(players):
+            finest_grids[int(player)] = per_player[k * cells:(k + 1) * cells].reshape(finest, finest)
+
+    heatmaps = {}
+    for player, grid in finest_grids.items():
+        for resolution in resolutions:
+            block = finest // resolution
+            coarse = grid.reshape(resolution, block, resolution, block).sum(axis=(1, 3))
+            heatmaps[grid_name(resolution, player)] = coarse.astype(np.float32)
+    return heatmaps
+
+
+def heatmaps_from_columns(player_detections, video_dimensions, resolutions=HEATMAP_RESOLUTIONS):
+    """compute_heatmaps over a player_detections table (see result_store.COLUMN_DTYPES)."""
+    return compute_heatmaps(
+        player_detections["x"], player_detections["y"], player_detections["track_id"],
+        video_dimensions["width"], video_dimensions["height"], resolutions,
+    )
+
+
+def heatmap_summary(heatmaps):
+    """The summary's "heatmaps" entry: which resolutions and players have grids."""
+    resolutions = set()
+    players = set()
+    for name in heatmaps:
+        resolution, grid = name.split(".", 1)
+        resolutions.add(int(resolution))
+        if grid != SESSION_GRID:
+            players.add(int(grid[len("player_"):]))
+    return {"resolutions": sorted(resolutions), "players": sorted(players)}
@@ -0,0 +1,780 @@
+# Save this as job_queue.py (next to app.py)
+"""
+Durable analysis job queue backed by SQLite, drained by a bounded pool of
+long-lived worker threads.
+
+The Flask request thread only inserts a row and returns; the workers pick jobs
+up in priority order, run the analysis and record status and progress
+(frames done out of total) in the database, so the state survives a restart.
+
+Jobs can belong to a court and carry their own options (e.g. a backfill mode,
+see batch_scheduler.py) and a deadline. Picking is fair across courts and
+limited by a cap on concurrent video decodes. Worker hosts other than this one
+claim jobs over HTTP (see remote_worker.py) and hold them under a lease that
+their progress reports renew.
+"""
+import contextlib
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from checkpoints import (DEFAULT_CHECKPOINT_MAX_AGE_SECONDS, DEFAULT_CHECKPOINT_MAX_BYTES, prune_checkpoints,
+                         recording_is_final)
+from metrics import record_analysis
+from result_store import install_results, save_results
+
+# Job states stored in the `status` column
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+ACTIVE_JOB_STATES = (JOB_QUEUED, JOB_RUNNING)
+
+# analyze_video.py reports progress on stderr as "PROGRESS <done> <total>"
+PROGRESS_PREFIX = "PROGRESS "
+
+ANALYZE_SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "analyze_video.py")
+
+# How a worker runs an analysis:
+#   "subprocess" - a fresh `python analyze_video.py <video>` per job (models loaded per job)
+#   "resident"   - one long-lived model_server.py process per worker (models loaded once)
+# Per-session checkpoint directories live in <results_dir>/checkpoints/<session_id>
+CHECKPOINTS_DIR_NAME = "checkpoints"
+
+BACKEND_SUBPROCESS = "subprocess"
+BACKEND_RESIDENT = "resident"
+ANALYSIS_BACKENDS = (BACKEND_SUBPROCESS, BACKEND_RESIDENT)
+
+# Seconds a remote worker host may go without reporting on a job before it goes back to the queue
+DEFAULT_REMOTE_LEASE_SECONDS = 120
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis_jobs (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    video_path TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    frames_done INTEGER NOT NULL DEFAULT 0,
+    frames_total INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    court_id TEXT,
+    options TEXT,
+    deadline REAL,
+    host TEXT,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_pick ON analysis_jobs (status, priority DESC, created_at);
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_session ON analysis_jobs (session_id, created_at);
+"""
+
+# Columns added after the first release; databases created before them get them with ALTER TABLE
+_ADDED_COLUMNS = {
+    "court_id": "TEXT", # Court of the session, for fair sharing between courts (NULL = none)
+    "options": "TEXT", # JSON analysis options of this job, over the queue's analysis_options
+    "deadline": "REAL", # When the results are needed (epoch seconds), or NULL
+    "host": "TEXT", # Remote worker host running the job; NULL while queued or run by this process
+    "heartbeat_at": "REAL", # Last progress report of the remote host (its lease)
+}
+
+
+def _options_to_argv(options):
+    """{"batch_size": 8} -> ["--batch-size", "8"], matching analyze_video.py's flags."""
+    argv = []
+    for name, value in options.items():
+        flag = "--" + name.replace("_", "-")
+        if value is True:
+            argv.append(flag)
+        elif value not in (None, False):
+            argv.extend([flag, str(value)])
+    return argv
+
+
+def _decode_slots(options, max_decodes):
+    """Concurrent decodes a job needs: one per segment process, at most max_decodes."""
+    return min(max(1, int(options.get("workers") or 1)), max_decodes)
+
+
+def _pick_job(queued, running, last_started, free_decodes, max_decodes, analysis_options):
+    """
+    Picks the next job to run from the queued rows.
+
+    Higher priorities go first. Within a priority, the court with the fewest running jobs
+    goes first, then the court that last started a job longest ago, so a long backlog on one
+    court doesn't hold up the others. Within a court, the earliest deadline goes first, then
+    the oldest job. Jobs that need more decodes than are free are skipped.
+
+    Args:
+        queued, running (list): Job dicts (see _row_to_job).
+        last_started (dict): {court_id: latest started_at of any of its jobs}.
+        free_decodes (int): Decodes the claiming host can start now.
+        max_decodes (int): The claiming host's decode cap.
+        analysis_options (dict): Options the job options are merged over.
+
+    Returns:
+        dict: The job, or None.
+    """
+    running_per_court = Counter(job["court_id"] for job in running)
+
+    def order(job):
+        deadline = job["deadline"] if job["deadline"] is not None else float("inf")
+        return (-job["priority"], running_per_court[job["court_id"]], last_started.get(job["court_id"]) or 0.0,
+                deadline, job["created_at"])
+
+    for job in sorted(queued, key=order):
+        if _decode_slots({**analysis_options, **job["options"]}, max_decodes) <= free_decodes:
+            return job
+    return None
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when the job it is running has been cancelled."""
+
+
+class LeaseLost(LookupError):
+    """A remote host reported on a job it no longer holds (lease expired, or job gone)."""
+
+
+class WorkerStopping(Exception):
+    """Raised inside a worker when the pool shuts down while a job is running."""
+
+
+class AnalysisJobQueue:
+    """
+    Queue of video analysis jobs persisted in SQLite.
+
+    Args:
+        db_path (str): Path of the SQLite database file.
+        results_dir (str): Directory where `<session_id>.json` (summary) and `<session_id>.npz`
+            (detection columns) results are written, see result_store.py.
+        num_workers (int): Number of worker threads (= concurrent analyses).
+        poll_interval (float): Seconds between queue polls / cancellation checks.
+        backend (str): "subprocess" or "resident", see ANALYSIS_BACKENDS.
+        analysis_options (dict, optional): Keyword arguments for analyze_pickleball_video used
+            for every job, e.g. {"batch_size": 8}.
+        result_cache (ResultCache, optional): Jobs whose video, models and options are already
+            in this cache are completed from it without analysing; new results are added to it.
+        metrics (MetricsRegistry, optional): Where finished jobs are recorded (see metrics.py).
+        max_decodes (int, optional): Cap on videos this process decodes at once; a job with
+            `workers` segment processes takes that many. Defaults to num_workers.
+        remote_lease_seconds (float): How long a remote worker host keeps a job without
+            reporting on it.
+        checkpoint_max_bytes, checkpoint_max_age_seconds: Retention of the sessions' checkpoint
+            directories, see checkpoints.prune_checkpoints. A session's checkpoints are also
+            dropped when its job completes on a recording that is no longer being written.
+    """
+
+    def __init__(self, db_path, results_dir, num_workers=2, poll_interval=1.0, backend=BACKEND_SUBPROCESS,
+                 analysis_options=None, result_cache=None, metrics=None, max_decodes=None,
+                 remote_lease_seconds=DEFAULT_REMOTE_LEASE_SECONDS, checkpoint_max_bytes=DEFAULT_CHECKPOINT_MAX_BYTES,
+                 checkpoint_max_age_seconds=DEFAULT_CHECKPOINT_MAX_AGE_SECONDS):
+        if backend not in ANALYSIS_BACKENDS:
+            raise ValueError(f"Unknown analysis backend {backend!r}, expected one of {ANALYSIS_BACKENDS}")
+        self.backend = backend
+        self.analysis_options = dict(analysis_options or {})
+        self.result_cache = result_cache
+        self.metrics = metrics
+        self.db_path = db_path
+        self.results_dir = results_dir
+        self.num_workers = max(1, int(num_workers))
+        self.poll_interval = poll_interval
+        self.max_decodes = max(1, int(max_decodes or self.num_workers))
+        self.remote_lease_seconds = remote_lease_seconds
+        self.checkpoint_max_bytes = checkpoint_max_bytes
+        self.checkpoint_max_age_seconds = checkpoint_max_age_seconds
+        self._remote_hosts = {} # {host: (job slots, last claim time)}, see worker_slots()
+        self._remote_hosts_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._workers = []
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            existing_columns = {row["name"] for row in conn.execute("PRAGMA table_info(analysis_jobs)")}
+            for column, column_type in _ADDED_COLUMNS.items():
+                if column not in existing_columns:
+                    conn.execute(f"ALTER TABLE analysis_jobs ADD COLUMN {column} {column_type}")
+            # Jobs that were running here when the previous process died go back to the queue,
+            # as do remote jobs it was completing (their lease was stopped, see complete_remote);
+            # remote hosts keep the others until their lease runs out
+            conn.execute(
+                "UPDATE analysis_jobs SET status = ?, host = NULL, frames_done = 0, started_at = NULL "
+                "WHERE status = ? AND (host IS NULL OR heartbeat_at IS NULL)",
+                (JOB_QUEUED, JOB_RUNNING),
+            )
+
+    # --- Database helpers ---
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # One short-lived connection per operation keeps us safe across threads.
+        # Autocommit mode; multi-statement updates use explicit BEGIN IMMEDIATE/COMMIT.
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def _update_job(self, job_id, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE analysis_jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    @staticmethod
+    def _row_to_job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        job["options"] = json.loads(job["options"]) if job["options"] else {}
+        total = job["frames_total"]
+        job["progress"] = round(job["frames_done"] / total, 4) if total else 0.0
+        return job
+
+    # --- Public API used by app.py ---
+
+    def submit(self, session_id, video_path, priority=0, court_id=None, options=None, deadline=None):
+        """
+        Queues an analysis job for a session, unless one is already queued or running.
+
+        Args:
+            court_id (str, optional): Court of the session; picking is fair between courts.
+            options (dict, optional): analyze_pickleball_video keywords for this job only,
+                merged over the queue's analysis_options.
+            deadline (float, optional): When the results are needed (epoch seconds); earlier
+                deadlines of the same court and priority are picked first.
+
+        Returns:
+            tuple: (job dict, created) where `created` is False if an active job was reused.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM analysis_jobs WHERE session_id = ? AND status IN (?, ?) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (session_id, *ACTIVE_JOB_STATES),
+            ).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                return self._row_to_job(row), False
+
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO analysis_jobs (id, session_id, video_path, priority, status, created_at, "
+                "court_id, options, deadline) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, session_id, video_path, int(priority), JOB_QUEUED, time.time(),
+                 court_id, json.dumps(options) if options else None, deadline),
+            )
+            row = conn.execute("SELECT * FROM analysis_jobs WHERE id = ?", (job_id,)).fetchone()
+            conn.execute("COMMIT")
+
+        self._wake_event.set()
+        return self._row_to_job(row), True
+
+    def get_job(self, session_id):
+        """Returns the most recent job for a session as a dict, or None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM analysis_jobs WHERE session_id = ? ORDER BY created_at DESC LIMIT 1",
+                (session_id,),
+            ).fetchone()
+        return self._row_to_job(row)
+
+    def active_jobs(self):
+        """All queued and running jobs, as dicts."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM analysis_jobs WHERE status IN (?, ?) ORDER BY created_at", ACTIVE_JOB_STATES,
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def recent_completed_jobs(self, limit=200):
+        """The latest jobs that ran to completion (not restored from the cache), newest first."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM analysis_jobs WHERE status = ? AND frames_total > 0 AND started_at IS NOT NULL "
+                "ORDER BY finished_at DESC LIMIT ?",
+                (JOB_COMPLETED, int(limit)),
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def worker_slots(self):
+        """
+        Jobs that can run at once: this process's workers (within its decode cap) plus those
+        of the remote worker hosts that claimed work within the last lease period.
+        """
+        slots = min(self.num_workers, self.max_decodes)
+        cutoff = time.time() - self.remote_lease_seconds
+        with self._remote_hosts_lock:
+            slots += sum(host_slots for host_slots, seen in self._remote_hosts.values() if seen >= cutoff)
+        return slots
+
+    def status_counts(self):
+        """Number of jobs in each state, e.g. {"queued": 3, "running": 2, ...}."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS jobs FROM analysis_jobs GROUP BY status").fetchall()
+        return {row["status"]: row["jobs"] for row in rows}
+
+    def cancel(self, session_id):
+        """
+        Cancels the active job for a session. Queued jobs are cancelled immediately,
+        running jobs are flagged and stopped by their worker at the next check.
+
+        Returns:
+            dict: The updated job, or None if the session had no active job.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM analysis_jobs WHERE session_id = ? AND status IN (?, ?) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (session_id, *ACTIVE_JOB_STATES),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            if row["status"] == JOB_QUEUED:
+                conn.execute(
+                    "UPDATE analysis_jobs SET status = ?, cancel_requested = 1, finished_at = ? WHERE id = ?",
+                    (JOB_CANCELLED, time.time(), row["id"]),
+                )
+            else:
+                conn.execute("UPDATE analysis_jobs SET cancel_requested = 1 WHERE id = ?", (row["id"],))
+            row = conn.execute("SELECT * FROM analysis_jobs WHERE id = ?", (row["id"],)).fetchone()
+            conn.execute("COMMIT")
+        return self._row_to_job(row)
+
+    # --- Remote worker hosts (see remote_worker.py) ---
+
+    def claim_remote(self, host, slots=1, max_decodes=1):
+        """
+        Claims the next job for a remote worker host. Jobs whose results are in the result
+        cache are completed from it here rather than handed out.
+
+        Args:
+            host (str): Name of the worker host.
+            slots (int): Jobs the host runs at once (counted by worker_slots()).
+            max_decodes (int): The host's cap on concurrent decodes.
+
+        Returns:
+            dict: The job, with its analyze_pickleball_video keywords as "analysis_options",
+                  or None if there is nothing the host can run now.
+        """
+        max_decodes = max(1, int(max_decodes))
+        with self._remote_hosts_lock:
+            self._remote_hosts[host] = (min(max(1, int(slots)), max_decodes), time.time())
+        while True:
+            job = self._claim_next_job(host=host, max_decodes=max_decodes)
+            if job is None:
+                return None
+            try:
+                if self._restore_cached(job, self._cache_key(job)):
+                    continue
+            except Exception as e:
+                print(f"Result cache lookup failed for {job['session_id']}: {e}", file=sys.stderr)
+            job["analysis_options"] = self._analysis_options(job, max_decodes)
+            return job
+
+    def _held_job(self, conn, job_id, host):
+        row = conn.execute(
+            "SELECT * FROM analysis_jobs WHERE id = ? AND status = ? AND host = ?", (job_id, JOB_RUNNING, host)
+        ).fetchone()
+        if row is None:
+            raise LeaseLost(f"Job {job_id} is not running on {host}")
+        return self._row_to_job(row)
+
+    def _update_held_job(self, job_id, host, **fields):
+        """
+        Updates a remote host's job in the same transaction as the check that the host holds
+        it, so its lease can't run out (and the job go to another host) in between.
+
+        Returns:
+            dict: The job as it was before the update.
+
+        Raises:
+            LeaseLost: The host no longer holds the job.
+        """
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                job = self._held_job(conn, job_id, host)
+                conn.execute(f"UPDATE analysis_jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            finally:
+                conn.execute("COMMIT")
+        return job
+
+    def report_remote(self, job_id, host, frames_done=None, frames_total=None):
+        """
+        Progress report of a remote host, which also renews its lease on the job.
+
+        Returns:
+            bool: True if the job has been cancelled and the host should stop.
+
+        Raises:
+            LeaseLost: The host no longer holds the job.
+        """
+        fields = {"heartbeat_at": time.time()}
+        if frames_done is not None and frames_total is not None:
+            fields.update(frames_done=int(frames_done), frames_total=int(frames_total))
+        return self._update_held_job(job_id, host, **fields)["cancel_requested"]
+
+    def uploaded_columns_path(self, job_id, host):
+        """
+        Where a remote host's upload of a job's .npz columns is written before complete_remote.
+
+        Raises:
+            LeaseLost: The host no longer holds the job.
+        """
+        with self._connect() as conn:
+            job = self._held_job(conn, job_id, host)
+        return os.path.join(self.results_dir, f"{job['session_id']}.{job_id}.npz.upload")
+
+    def complete_remote(self, job_id, host, summary):
+        """
+        Completes a remote host's job with its results summary and the columns it uploaded
+        to uploaded_columns_path().
+
+        The lease is stopped (heartbeat_at cleared, which never counts as expired) in the same
+        transaction as the check that the host holds the job, before the results are installed.
+        A lease running out meanwhile can't hand the job to another host, whose results would
+        then be overwritten by these.
+
+        Raises:
+            LeaseLost: The host no longer holds the job.
+            FileNotFoundError: The columns were not uploaded.
+        """
+        columns_path = self.uploaded_columns_path(job_id, host)
+        job = self._update_held_job(job_id, host, heartbeat_at=None)
+        results_base = os.path.join(self.results_dir, job["session_id"])
+        try:
+            install_results(summary, columns_path, results_base)
+        except Exception:
+            self._update_job(job_id, heartbeat_at=time.time()) # The lease runs again; the host may retry
+            raise
+        frames_total = (summary.get("sampling") or {}).get("frames_total")
+        if frames_total: # The last progress report may be older than the end of the analysis
+            self._update_job(job_id, frames_done=frames_total, frames_total=frames_total)
+            job["frames_total"] = frames_total
+        self._finish_completed(job, summary, time.time() - job["started_at"], self._cache_key(job), results_base)
+
+    def fail_remote(self, job_id, host, error, cancelled=False):
+        """
+        Records that a remote host's job failed, or stopped because it was cancelled.
+
+        Raises:
+            LeaseLost: The host no longer holds the job.
+        """
+        upload_path = self.uploaded_columns_path(job_id, host)
+        if cancelled:
+            self._update_held_job(job_id, host, status=JOB_CANCELLED, finished_at=time.time())
+            self._count_job(JOB_CANCELLED)
+        else:
+            job = self._update_held_job(job_id, host, status=JOB_FAILED, error=str(error), finished_at=time.time())
+            print(f"Analysis job {job_id} for {job['session_id']} failed on {host}: {error}", file=sys.stderr)
+            self._count_job(JOB_FAILED)
+        with contextlib.suppress(OSError):
+            os.remove(upload_path)
+
+    # --- Worker pool ---
+
+    def start(self):
+        """Starts the worker threads (idempotent)."""
+        if self._workers:
+            return
+        self._stop_event.clear()
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"analysis-worker-{i + 1}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self, timeout=None):
+        """Stops the workers. Running jobs are killed and put back in the queue."""
+        self._stop_event.set()
+        self._wake_event.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def _claim_next_job(self, host=None, max_decodes=None):
+        """
+        Claims the next job (see _pick_job) for this process (host None) or a remote host,
+        within the host's decode cap.
+        """
+        max_decodes = max(1, int(max_decodes or self.max_decodes))
+        now = time.time()
+        # BEGIN IMMEDIATE takes the write lock, so two workers can't claim the same row
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Jobs of remote hosts that stopped reporting go back to the queue
+            conn.execute(
+                "UPDATE analysis_jobs SET status = ?, host = NULL, frames_done = 0, started_at = NULL "
+                "WHERE status = ? AND host IS NOT NULL AND heartbeat_at < ?",
+                (JOB_QUEUED, JOB_RUNNING, now - self.remote_lease_seconds),
+            )
+            queued = [self._row_to_job(row) for row in conn.execute(
+                "SELECT * FROM analysis_jobs WHERE status = ?", (JOB_QUEUED,)
+            )]
+            if not queued:
+                conn.execute("COMMIT")
+                return None
+            running = [self._row_to_job(row) for row in conn.execute(
+                "SELECT * FROM analysis_jobs WHERE status = ?", (JOB_RUNNING,)
+            )]
+            last_started = dict(conn.execute(
+                "SELECT court_id, MAX(started_at) FROM analysis_jobs GROUP BY court_id"
+            ).fetchall())
+            decodes_in_use = sum(
+                _decode_slots({**self.analysis_options, **job["options"]}, max_decodes)
+                for job in running if job["host"] == host
+            )
+            job = _pick_job(queued, running, last_started, max_decodes - decodes_in_use, max_decodes,
+                            self.analysis_options)
+            if job is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE analysis_jobs SET status = ?, started_at = ?, host = ?, heartbeat_at = ? WHERE id = ?",
+                (JOB_RUNNING, now, host, now if host is not None else None, job["id"]),
+            )
+            conn.execute("COMMIT")
+        job.update(status=JOB_RUNNING, started_at=now, host=host)
+        return job
+
+    def _is_cancel_requested(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT cancel_requested FROM analysis_jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is None or bool(row["cancel_requested"])
+
+    def _check_interrupt(self, job_id):
+        """Returns the exception to stop a running job with, or None if it should carry on."""
+        if self._is_cancel_requested(job_id):
+            return JobCancelled(job_id)
+        if self._stop_event.is_set():
+            return WorkerStopping(job_id)
+        return None
+
+    def _worker_loop(self):
+        # Each worker owns its resident model process, so models stay warm between jobs
+        resident_analyzer = None
+        if self.backend == BACKEND_RESIDENT:
+            from model_server import ResidentAnalyzer
+            resident_analyzer = ResidentAnalyzer()
+
+        try:
+            while not self._stop_event.is_set():
+                job = self._claim_next_job()
+                if job is None:
+                    self._wake_event.wait(self.poll_interval)
+                    self._wake_event.clear()
+                    continue
+                self._process_job(job, resident_analyzer)
+        finally:
+            if resident_analyzer is not None:
+                resident_analyzer.close()
+
+    def _process_job(self, job, resident_analyzer=None):
+        """Runs one claimed job to completion and records its final state."""
+        started = time.perf_counter()
+        try:
+            results_base = os.path.join(self.results_dir, job["session_id"])
+            cache_key = self._cache_key(job)
+            if self._restore_cached(job, cache_key):
+                return
+            if resident_analyzer is not None:
+                summary = self._run_resident(job, resident_analyzer)
+                save_started = time.perf_counter()
+                save_results(summary, results_base)
+                if self.metrics is not None:
+                    self.metrics.observe("analysis_serialization_seconds", time.perf_counter() - save_started)
+            else:
+                summary = self._run_subprocess(job, results_base) # The script writes the results files itself
+            self._finish_completed(job, summary, time.perf_counter() - started, cache_key, results_base)
+        except JobCancelled:
+            self._update_job(job["id"], status=JOB_CANCELLED, finished_at=time.time())
+            self._count_job(JOB_CANCELLED)
+        except WorkerStopping:
+            self._update_job(job["id"], status=JOB_QUEUED, frames_done=0, started_at=None)
+        except Exception as e:
+            print(f"Analysis job {job['id']} for {job['session_id']} failed: {e}", file=sys.stderr)
+            self._update_job(job["id"], status=JOB_FAILED, error=str(e), finished_at=time.time())
+            self._count_job(JOB_FAILED)
+
+    def _restore_cached(self, job, cache_key):
+        """Completes a job from the result cache if it is there (same footage, models and options)."""
+        if cache_key is None:
+            return False
+        if not self.result_cache.restore(cache_key, os.path.join(self.results_dir, job["session_id"])):
+            return False
+        self._update_job(job["id"], status=JOB_COMPLETED, finished_at=time.time())
+        self._count_job("cached")
+        return True
+
+    def _finish_completed(self, job, summary, wall_seconds, cache_key, results_base):
+        """Records a job whose results have been written to `results_base`, and caches them."""
+        if self.metrics is not None:
+            record_analysis(self.metrics, summary, wall_seconds)
+        if cache_key is not None:
+            try:
+                self.result_cache.store(cache_key, results_base)
+            except Exception as e:
+                print(f"Failed to cache results of {job['session_id']}: {e}", file=sys.stderr)
+        self._update_job(job["id"], status=JOB_COMPLETED, finished_at=time.time())
+        self._retire_checkpoints(job)
+
+    def _checkpoint_dir(self, session_id):
+        return os.path.abspath(os.path.join(self.results_dir, CHECKPOINTS_DIR_NAME, session_id))
+
+    def _retire_checkpoints(self, job):
+        """
+        After a job completes: drops the session's checkpoints if its recording is final (they
+        could only resume an analysis that is already done), then prunes the other sessions'
+        checkpoints by age and size, sparing sessions with an active job.
+        """
+        try:
+            if recording_is_final(job["video_path"]):
+                shutil.rmtree(self._checkpoint_dir(job["session_id"]), ignore_errors=True)
+            prune_checkpoints(
+                os.path.join(self.results_dir, CHECKPOINTS_DIR_NAME), self.checkpoint_max_bytes,
+                self.checkpoint_max_age_seconds, keep={active["session_id"] for active in self.active_jobs()},
+            )
+        except Exception as e:
+            print(f"Pruning checkpoints after {job['session_id']} failed: {e}", file=sys.stderr)
+
+    def _count_job(self, outcome):
+        if self.metrics is not None:
+            self.metrics.inc("analysis_jobs_total", outcome=outcome)
+
+    def _analysis_options(self, job, max_decodes=None):
+        """The queue's options with the job's own over them, segment workers within the decode cap."""
+        options = {**self.analysis_options, **job["options"]}
+        if "workers" in options:
+            options["workers"] = _decode_slots(options, max_decodes or self.max_decodes)
+        return options
+
+    def _job_options(self, job):
+        """
+        analyze_pickleball_video keywords for a job: its options plus, when checkpointing
+        is enabled, the session's checkpoint directory. A retried or re-queued job, or one for a
+        recording that has grown, then resumes from the session's checkpoints.
+        """
+        options = self._analysis_options(job)
+        if options.get("checkpoint_frames"):
+            options["checkpoint_dir"] = self._checkpoint_dir(job["session_id"])
+        else:
+            options.pop("checkpoint_frames", None) # 0 disables checkpointing
+        return options
+
+    def _cache_key(self, job):
+        """The job's result cache key, or None without a cache (or if the video can't be read)."""
+        if self.result_cache is None:
+            return None
+        try:
+            return self.result_cache.key_for(job["video_path"], self._analysis_options(job))
+        except OSError as e:
+            print(f"Result cache skipped for {job['session_id']}: {e}", file=sys.stderr)
+            return None
+
+    def _run_subprocess(self, job, results_base):
+        """
+        Runs analyze_video.py for a job in a child process, forwarding its progress
+        to the database and killing it if the job is cancelled. The script saves the
+        results under `results_base` (see result_store.py).
+
+        Returns:
+            dict: The parsed results summary.
+        """
+        process = subprocess.Popen(
+            [sys.executable, ANALYZE_SCRIPT_PATH, job["video_path"], "--output", os.path.abspath(results_base),
+             *_options_to_argv(self._job_options(job))],
+            cwd=os.path.dirname(ANALYZE_SCRIPT_PATH),  # Model paths in the script are relative
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+
+        stdout_chunks = []
+        stderr_lines = []
+
+        def read_stdout():
+            stdout_chunks.append(process.stdout.read())
+
+        def read_stderr():
+            for line in process.stderr:
+                if line.startswith(PROGRESS_PREFIX):
+                    try:
+                        done, total = (int(v) for v in line[len(PROGRESS_PREFIX):].split())
+                        self._update_job(job["id"], frames_done=done, frames_total=total)
+                    except ValueError:
+                        pass
+                else:
+                    stderr_lines.append(line)
+
+        readers = [threading.Thread(target=read_stdout, daemon=True), threading.Thread(target=read_stderr, daemon=True)]
+        for reader in readers:
+            reader.start()
+
+        interrupt = None
+        while process.poll() is None:
+            interrupt = self._check_interrupt(job["id"])
+            if interrupt is not None:
+                process.kill()
+                break
+            time.sleep(self.poll_interval)
+        process.wait()
+        for reader in readers:
+            reader.join()
+
+        if interrupt is not None:
+            raise interrupt
+
+        if process.returncode != 0:
+            stderr_text = "".join(stderr_lines).strip()
+            # The script prints JSON errors as its last stderr line
+            try:
+                error_message = json.loads(stderr_text.splitlines()[-1]).get("error", "Unknown script error")
+            except (IndexError, json.JSONDecodeError, AttributeError):
+                error_message = stderr_text or "Script execution failed"
+            raise RuntimeError(f"Analysis failed: {error_message}")
+
+        try:
+            return json.loads("".join(stdout_chunks).strip())
+        except json.JSONDecodeError:
+            raise RuntimeError("Analysis script returned invalid data.")
+
+    def _run_resident(self, job, analyzer):
+        """
+        Runs a job in the worker's resident model process (see model_server.py).
+
+        Returns:
+            dict: The analysis results.
+        """
+        from analyze_video import AnalysisCancelled
+
+        def update_progress(frames_done, frames_total):
+            self._update_job(job["id"], frames_done=frames_done, frames_total=frames_total)
+
+        try:
+            return analyzer.analyze(
+                job["video_path"],
+                progress_callback=update_progress,
+                should_cancel=lambda: self._check_interrupt(job["id"]) is not None,
+                poll_interval=self.poll_interval,
+                options=self._job_options(job),
+            )
+        except AnalysisCancelled:
+            raise self._check_interrupt(job["id"]) or JobCancelled(job["id"])
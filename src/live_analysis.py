@@ -0,0 +1,527 @@
+# Save this as live_analysis.py (next to analyze_video.py)
+"""
+Live analysis of a court session that is still in progress.
+
+The source is a stream URL (e.g. rtsp://...) or a local file that is still
+being written. A reader thread decodes frames as they arrive; the analysis
+loop runs the models on the freshest frames only. Frames that would be
+finished later than `latency_budget` seconds after they were read (judged by
+their age plus the recent inference time) are dropped, so a slow machine
+skips frames instead of falling further and further behind.
+
+Every `publish_interval` seconds a rolling snapshot is published: the shot and
+rally counts so far, the latest events, each tracked player's movement stats and
+a heatmap of the last
+`heatmap_window_seconds` of play. Rallies that ended more than
+RALLY_GAP_SECONDS ago are counted once and forgotten, so a snapshot costs the
+same an hour into a session as a minute in.
+
+Run as a script, snapshots are printed to stdout as "LIVE <json>" lines.
+LiveSessionManager runs such a script per session and keeps the latest
+snapshot for app.py's Server-Sent Events endpoint, so the models stay out of
+the web server process.
+
+Usage (a finished local file as a stand-in for a stream, read at its frame rate):
+    python live_analysis.py <video_filepath_or_url> --realtime
+"""
+import argparse
+import collections
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from ball_tracking import FALLBACK_FPS, RALLY_GAP_SECONDS, detect_rallies
+from box_postprocessing import DetectionColumns, collect_batch_detections
+from heatmap import compute_heatmaps, grid_name
+from player_tracking import MIN_TRACK_SECONDS, PlayerStats, PlayerTracker
+from result_store import COLUMN_DTYPES
+
+# Drop frames that couldn't be finished within this many seconds of being read
+DEFAULT_LATENCY_BUDGET_SECONDS = 1.0
+# Seconds between published snapshots
+DEFAULT_PUBLISH_INTERVAL_SECONDS = 1.0
+# The live heatmap covers this many seconds of play, at this resolution
+DEFAULT_HEATMAP_WINDOW_SECONDS = 60
+LIVE_HEATMAP_RESOLUTION = 32
+# Events kept in each snapshot
+RECENT_EVENTS = 10
+# A local file that hasn't grown for this long (or a stream that can't be reopened) has ended
+SOURCE_IDLE_TIMEOUT_SECONDS = 30
+SOURCE_POLL_INTERVAL_SECONDS = 0.5
+
+# Run as a script, snapshots are printed on stdout with this prefix
+LIVE_PREFIX = "LIVE "
+
+LIVE_SCRIPT_PATH = os.path.abspath(__file__)
+# Seconds a stopped live session's process gets to publish its final snapshot before it is killed
+STOP_GRACE_SECONDS = 10
+
+
+def _is_stream_url(source):
+    return "://" in source
+
+
+class LiveFrameSource:
+    """
+    Reads frames from a growing file or stream on a background thread and hands out the
+    freshest ones within a latency budget.
+
+    Args:
+        source (str): Stream URL or local file path.
+        latency_budget (float): See DEFAULT_LATENCY_BUDGET_SECONDS.
+        realtime (bool): Pace reading a local file at its frame rate, so a finished recording
+            behaves like a live source.
+        idle_timeout (float): See SOURCE_IDLE_TIMEOUT_SECONDS.
+    """
+
+    # Returned by get() once the source has ended
+    END = object()
+
+    def __init__(self, source, latency_budget=DEFAULT_LATENCY_BUDGET_SECONDS, realtime=False,
+                 idle_timeout=SOURCE_IDLE_TIMEOUT_SECONDS):
+        self.source = source
+        self.latency_budget = latency_budget
+        self.realtime = realtime
+        self.idle_timeout = idle_timeout
+        self.fps = None
+        self.video_dimensions = None
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.error = None
+        self._processing_seconds = 0.0 # Moving average of the consumer's time per frame
+        self._frames = collections.deque()
+        self._condition = threading.Condition()
+        self._ready = threading.Event()
+        self._ended = False
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._read_loop, name="live-reader", daemon=True)
+
+    def start(self):
+        """Starts reading and waits until the source is open. Returns False if it couldn't be opened."""
+        self._thread.start()
+        self._ready.wait()
+        return self.error is None
+
+    def stop(self):
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        self._thread.join()
+
+    def record_processing(self, seconds):
+        """Tells the source how long the consumer took for a frame, to drop frames it can't finish in time."""
+        self._processing_seconds = 0.8 * self._processing_seconds + 0.2 * seconds
+
+    def get(self, timeout):
+        """
+        Returns (frame_number, frame, read_at) for the oldest frame that can still be finished
+        within the budget, None if no frame arrived within `timeout`, or END.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                while self._frames:
+                    frame_number, frame, read_at = self._frames.popleft()
+                    if now - read_at + self._processing_seconds > self.latency_budget:
+                        self.frames_dropped += 1
+                        continue
+                    return frame_number, frame, read_at
+                if self._ended:
+                    return self.END
+                remaining = deadline - now
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def _open(self):
+        if _is_stream_url(self.source):
+            cap = cv2.VideoCapture(self.source)
+            return cap if cap.isOpened() else None
+        # Reopening a grown file continues after the frames already read
+        from analyze_video import open_video_at
+        return open_video_at(self.source, self.frames_read)
+
+    def _read_loop(self):
+        cap = None
+        try:
+            cap = self._open()
+            if cap is None:
+                self.error = f"Could not open live source: {self.source}"
+                return
+            self.fps = cap.get(cv2.CAP_PROP_FPS) or FALLBACK_FPS
+            self.video_dimensions = {
+                "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            }
+            self._ready.set()
+
+            # Frames waiting longer than the budget are stale anyway, so the backlog is bounded by it
+            max_backlog = max(1, int(self.latency_budget * self.fps))
+            started = time.monotonic()
+            idle_since = None
+            last_size = None if _is_stream_url(self.source) else os.path.getsize(self.source)
+            while not self._stop_event.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    # End of the data so far: wait for the file to grow / the stream to come back
+                    idle_since = idle_since or time.monotonic()
+                    if time.monotonic() - idle_since > self.idle_timeout:
+                        return
+                    self._stop_event.wait(SOURCE_POLL_INTERVAL_SECONDS)
+                    if last_size is not None:
+                        size = os.path.getsize(self.source)
+                        if size == last_size:
+                            continue
+                        last_size = size
+                    cap.release()
+                    cap = self._open() or cap
+                    continue
+                idle_since = None
+                self.frames_read += 1
+                if self.realtime:
+                    self._stop_event.wait(max(0.0, started + self.frames_read / self.fps - time.monotonic()))
+                with self._condition:
+                    if len(self._frames) >= max_backlog:
+                        self._frames.popleft()
+                        self.frames_dropped += 1
+                    self._frames.append((self.frames_read, frame, time.monotonic()))
+                    self._condition.notify()
+        except Exception as e:
+            self.error = f"Live source failed: {e}"
+        finally:
+            if cap is not None:
+                cap.release()
+            self._ready.set()
+            with self._condition:
+                self._ended = True
+                self._condition.notify_all()
+
+
+class RollingResults:
+    """
+    Shot/rally counts, a sliding-window heatmap and per-player movement stats, updated frame
+    by frame. Players keep their ids across frames through the same PlayerTracker/PlayerStats
+    the full analysis uses (see player_tracking.py), with O(players) state.
+
+    Args:
+        fps (float): Source frame rate, to turn frame numbers into seconds.
+        video_dimensions (dict): {"width", "height"} for the heatmap grid.
+        heatmap_window_seconds (float): See DEFAULT_HEATMAP_WINDOW_SECONDS.
+    """
+
+    def __init__(self, fps, video_dimensions, heatmap_window_seconds=DEFAULT_HEATMAP_WINDOW_SECONDS):
+        self.fps = fps
+        self.video_dimensions = video_dimensions
+        self.heatmap_window_frames = heatmap_window_seconds * fps
+        self.heatmap_window_seconds = heatmap_window_seconds
+        self.last_frame = 0
+        self._player_points = collections.deque() # (frame, x, y)
+        self._tracker = PlayerTracker(fps)
+        self._player_stats = PlayerStats(fps, video_dimensions)
+        # Ball detections (frame, x, y, conf columns) not yet part of a finished rally
+        self._open_balls = {
+            field: np.empty(0, dtype=dtype) for field, dtype in COLUMN_DTYPES["ball_detections"].items()
+        }
+        self._finished_shots = 0
+        self._finished_rallies = 0
+        self._recent_events = collections.deque(maxlen=RECENT_EVENTS)
+
+    def add(self, frame_number, player_detections, ball_detections):
+        """Adds one inferred frame's player_detections/ball_detections columns (see box_postprocessing.py)."""
+        self.last_frame = frame_number
+        track_ids = self._tracker.update(
+            frame_number, player_detections["x"], player_detections["y"], player_detections["w"],
+            player_detections["h"], player_detections["conf"],
+        )
+        self._player_stats.update(frame_number, track_ids, player_detections["x"], player_detections["y"])
+        for x, y in zip(player_detections["x"].tolist(), player_detections["y"].tolist()):
+            self._player_points.append((frame_number, x, y))
+        self._open_balls = {
+            field: np.concatenate([self._open_balls[field], np.asarray(ball_detections[field], dtype=dtype)])
+            for field, dtype in COLUMN_DTYPES["ball_detections"].items()
+        }
+
+    def _finish_rallies(self):
+        # Rallies are separated by ball gaps longer than RALLY_GAP_SECONDS: everything before
+        # the last such gap (or all of it, if the ball has been gone that long) is final
+        gap = RALLY_GAP_SECONDS * self.fps
+        frames = self._open_balls["frame"]
+        split = 0
+        if len(frames) and self.last_frame - frames[-1] > gap:
+            split = len(frames)
+        else:
+            gaps = np.flatnonzero(np.diff(frames) > gap)
+            if len(gaps):
+                split = int(gaps[-1]) + 1
+        if split:
+            finished = detect_rallies({field: column[:split] for field, column in self._open_balls.items()}, self.fps)
+            self._finished_shots += finished["total_shots"]
+            self._finished_rallies += len(finished["rallies"])
+            self._recent_events.extend(finished["events"])
+            self._open_balls = {field: column[split:] for field, column in self._open_balls.items()}
+
+    def snapshot(self):
+        self._finish_rallies()
+        ongoing = detect_rallies(self._open_balls, self.fps)
+        recent_events = (list(self._recent_events) + ongoing["events"])[-RECENT_EVENTS:]
+
+        while self._player_points and self._player_points[0][0] < self.last_frame - self.heatmap_window_frames:
+            self._player_points.popleft()
+        points = np.array(self._player_points, dtype=np.int64).reshape(-1, 3)
+        grid = compute_heatmaps(
+            points[:, 1], points[:, 2], np.full(len(points), -1), self.video_dimensions["width"],
+            self.video_dimensions["height"], (LIVE_HEATMAP_RESOLUTION,),
+        )[grid_name(LIVE_HEATMAP_RESOLUTION)]
+
+        return {
+            "frame": self.last_frame,
+            "video_time": round((self.last_frame - 1) / self.fps, 3) if self.last_frame else 0.0,
+            "total_shots": self._finished_shots + ongoing["total_shots"],
+            "rallies": self._finished_rallies + len(ongoing["rallies"]),
+            "rally_in_progress": bool(ongoing["rallies"]),
+            "recent_events": recent_events,
+            # Players tracked for at least MIN_TRACK_SECONDS so far, by tracker id
+            "players": self._player_stats.summary([
+                track_id for track_id in sorted(self._player_stats.track_ids())
+                if self._player_stats.span_frames(track_id) >= MIN_TRACK_SECONDS * self.fps
+            ]),
+            "video_dimensions": self.video_dimensions,
+            "heatmap": {
+                "res": LIVE_HEATMAP_RESOLUTION,
+                "window_seconds": self.heatmap_window_seconds,
+                "total": float(grid.sum()),
+                "max": float(grid.max()),
+                "grid": grid.tolist(),
+            },
+        }
+
+
+def analyze_live(source, publish, player_model=None, ball_model=None, latency_budget=DEFAULT_LATENCY_BUDGET_SECONDS,
+                 publish_interval=DEFAULT_PUBLISH_INTERVAL_SECONDS, heatmap_window_seconds=DEFAULT_HEATMAP_WINDOW_SECONDS,
+                 realtime=False, idle_timeout=SOURCE_IDLE_TIMEOUT_SECONDS, should_stop=None):
+    """
+    Analyses a live source until it ends (or should_stop() returns True).
+
+    Args:
+        source (str): Stream URL or path of a file that is still being written.
+        publish (callable): publish(snapshot) with a RollingResults snapshot plus "status"
+            ("running", then "finished" or "failed"), frame counters and latency. Called every
+            publish_interval seconds and once at the end.
+        player_model, ball_model (optional): Already loaded YOLO models (default: get_models()).
+        latency_budget (float): Seconds from reading a frame to finishing it; later frames are dropped.
+        realtime (bool): Pace a local file at its frame rate (for testing with finished recordings).
+        idle_timeout (float): Seconds without new frames after which the source has ended.
+    """
+    import analyze_video
+
+    if player_model is None or ball_model is None:
+        player_model, ball_model = analyze_video.get_models()
+
+    frames = LiveFrameSource(source, latency_budget=latency_budget, realtime=realtime, idle_timeout=idle_timeout)
+    if not frames.start():
+        publish({"status": "failed", "error": frames.error})
+        return
+    rolling = RollingResults(frames.fps, frames.video_dimensions, heatmap_window_seconds)
+    frames_inferred = 0
+    last_latency = None
+    last_publish = time.monotonic()
+
+    def publish_snapshot(status):
+        publish({
+            "status": status,
+            **rolling.snapshot(),
+            "frames_read": frames.frames_read,
+            "frames_inferred": frames_inferred,
+            "frames_dropped": frames.frames_dropped,
+            "latency_seconds": round(last_latency, 3) if last_latency is not None else None,
+            "latency_budget_seconds": latency_budget,
+            **({"error": frames.error} if frames.error else {}),
+        })
+
+    try:
+        while should_stop is None or not should_stop():
+            item = frames.get(timeout=publish_interval)
+            if item is frames.END:
+                break
+            if item is not None:
+                frame_number, frame, read_at = item
+                started = time.monotonic()
+                player_columns = DetectionColumns("player_detections", capacity=16)
+                ball_columns = DetectionColumns("ball_detections", capacity=1)
+                try:
+                    player_results = player_model.predict([frame], verbose=False)
+                    ball_results = ball_model.predict([frame], verbose=False)
+                    collect_batch_detections([frame_number], player_results, ball_results, player_columns, ball_columns)
+                except Exception as e:
+                    print(f"Error processing live frame {frame_number}: {e}", file=sys.stderr)
+                rolling.add(frame_number, player_columns.columns(), ball_columns.columns())
+                frames_inferred += 1
+                frames.record_processing(time.monotonic() - started)
+                last_latency = time.monotonic() - read_at
+
+            if time.monotonic() - last_publish >= publish_interval:
+                last_publish = time.monotonic()
+                publish_snapshot("running")
+    finally:
+        frames.stop()
+    publish_snapshot("failed" if frames.error else "finished")
+
+
+class LiveSessionManager:
+    """
+    Runs one live_analysis.py process per live session and keeps each session's latest snapshot.
+
+    Args:
+        max_sessions (int): Live sessions allowed to run at once (each holds its own models).
+        options (dict, optional): latency_budget, publish_interval, heatmap_window_seconds,
+            idle_timeout and realtime, passed to every session.
+    """
+
+    def __init__(self, max_sessions=2, options=None):
+        self.max_sessions = max(1, int(max_sessions))
+        self.options = dict(options or {})
+        self._sessions = {}
+        self._condition = threading.Condition()
+
+    def _running(self):
+        return [s for s in self._sessions.values() if s["process"].poll() is None]
+
+    def start(self, session_id, source):
+        """
+        Starts analysing a live session (a no-op if it is already running).
+
+        Returns:
+            bool: False if too many live sessions are running already.
+        """
+        with self._condition:
+            session = self._sessions.get(session_id)
+            if session is not None and session["process"].poll() is None:
+                return True
+            if len(self._running()) >= self.max_sessions:
+                return False
+
+            argv = [sys.executable, LIVE_SCRIPT_PATH, source]
+            for name, value in self.options.items():
+                flag = "--" + name.replace("_", "-")
+                if value is True:
+                    argv.append(flag)
+                elif value not in (None, False):
+                    argv.extend([flag, str(value)])
+            process = subprocess.Popen(
+                argv, cwd=os.path.dirname(LIVE_SCRIPT_PATH), # Model paths are relative
+                stdout=subprocess.PIPE, stdin=subprocess.DEVNULL, text=True,
+            )
+            session = {"process": process, "version": 1, "snapshot": {"status": "starting"}, "stop_requested": False}
+            self._sessions[session_id] = session
+            self._condition.notify_all()
+
+        threading.Thread(target=self._read_snapshots, args=(session,), name=f"live-{session_id}", daemon=True).start()
+        return True
+
+    def _read_snapshots(self, session):
+        process = session["process"]
+        for line in process.stdout:
+            if not line.startswith(LIVE_PREFIX):
+                continue
+            try:
+                snapshot = json.loads(line[len(LIVE_PREFIX):])
+            except json.JSONDecodeError:
+                continue
+            self._publish(session, snapshot)
+        process.wait()
+        if session["snapshot"].get("status") in ("starting", "running"):
+            # Exited without a final snapshot: crashed, or was stopped before it could publish one
+            # (e.g. killed after STOP_GRACE_SECONDS, or on Windows, where terminate() can't be caught)
+            status = "finished" if process.returncode == 0 or session["stop_requested"] else "failed"
+            self._publish(session, {**session["snapshot"], "status": status})
+
+    def _publish(self, session, snapshot):
+        with self._condition:
+            session["snapshot"] = snapshot
+            session["version"] += 1
+            self._condition.notify_all()
+
+    def running_sessions(self):
+        """IDs of the live sessions whose analysis process is running."""
+        with self._condition:
+            return [session_id for session_id, session in self._sessions.items() if session["process"].poll() is None]
+
+    def stop(self, session_id):
+        """Stops a live session. Returns False if it wasn't running."""
+        with self._condition:
+            session = self._sessions.get(session_id)
+        if session is None or session["process"].poll() is not None:
+            return False
+        # The script stops at its next frame on SIGTERM and publishes a final "finished" snapshot;
+        # one stuck in a model call is killed after a grace period
+        session["stop_requested"] = True
+        session["process"].terminate()
+        threading.Thread(target=self._kill_after_grace, args=(session["process"],), daemon=True).start()
+        return True
+
+    @staticmethod
+    def _kill_after_grace(process):
+        try:
+            process.wait(STOP_GRACE_SECONDS)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    def stop_all(self):
+        for session_id in list(self._sessions):
+            self.stop(session_id)
+
+    def wait_for_update(self, session_id, after_version=0, timeout=None):
+        """
+        Waits until the session has a snapshot newer than `after_version`.
+
+        Returns:
+            tuple: (version, snapshot) - the version is unchanged if the wait timed out;
+                   or None if the session is unknown.
+        """
+        with self._condition:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            self._condition.wait_for(lambda: session["version"] > after_version, timeout)
+            return session["version"], session["snapshot"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyse a live court session and print rolling results.")
+    parser.add_argument("source", help="Stream URL or path of a video file that is still being written")
+    parser.add_argument("--latency-budget", type=float, default=DEFAULT_LATENCY_BUDGET_SECONDS,
+                        help="Drop frames that can't be finished within this many seconds (default: %(default)s)")
+    parser.add_argument("--publish-interval", type=float, default=DEFAULT_PUBLISH_INTERVAL_SECONDS,
+                        help="Seconds between snapshots (default: %(default)s)")
+    parser.add_argument("--heatmap-window-seconds", type=float, default=DEFAULT_HEATMAP_WINDOW_SECONDS,
+                        help="Seconds of play covered by the live heatmap (default: %(default)s)")
+    parser.add_argument("--idle-timeout", type=float, default=SOURCE_IDLE_TIMEOUT_SECONDS,
+                        help="Seconds without new frames after which the session has ended (default: %(default)s)")
+    parser.add_argument("--realtime", action="store_true",
+                        help="Read a local file at its frame rate, as if it were live")
+    args = parser.parse_args()
+
+    def print_snapshot(snapshot):
+        print(LIVE_PREFIX + json.dumps(snapshot), flush=True)
+
+    # LiveSessionManager.stop sends SIGTERM: finish the current frame and publish the final snapshot
+    stop_requested = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_requested.set())
+
+    try:
+        analyze_live(
+            args.source, print_snapshot, latency_budget=args.latency_budget, publish_interval=args.publish_interval,
+            heatmap_window_seconds=args.heatmap_window_seconds, realtime=args.realtime, idle_timeout=args.idle_timeout,
+            should_stop=stop_requested.is_set,
+        )
+    except Exception as e:
+        print_snapshot({"status": "failed", "error": f"Live analysis failed: {e}"})
+        sys.exit(1)
@@ -0,0 +1,177 @@
+# Save this as metrics.py (next to app.py)
+"""
+In-process metrics served by GET /metrics in the Prometheus text format.
+
+Every metric is declared in METRICS with its type and help text. Counters and
+summaries (a _count and a _sum series) only go up; gauges hold the last value
+set. Values are kept per label set, e.g. pickleball_analysis_substage_seconds_total
+{substage="player_model"}. Values that are cheaper to read when scraped (queue
+depth, cache counters, ...) come from collectors registered with add_collector.
+
+record_analysis turns an analysis's results summary (stage_stats, sampling and
+the optional profile block) into per-stage metrics, so a regression in one
+stage shows up as a change in that stage's rate. Pipeline stages, their
+sub-stages (whose time is part of the enclosing stage's) and post-processing
+steps are separate metrics, so each one can be summed over its label without
+counting any time twice.
+"""
+import sys
+import threading
+
+from video_pipeline import PIPELINE_STAGES
+
+METRIC_PREFIX = "pickleball_"
+
+COUNTER = "counter"
+GAUGE = "gauge"
+SUMMARY = "summary"
+
+# name (without METRIC_PREFIX): (type, help)
+METRICS = {
+    "analysis_jobs_total": (COUNTER, "Analysis jobs finished, by outcome (completed, cached, failed, cancelled)."),
+    "analysis_job_seconds": (SUMMARY, "Wall-clock time of analysis jobs that ran the models."),
+    "analysis_frames_total": (COUNTER, "Video frames read by analysis jobs."),
+    "analysis_inferred_frames_total": (COUNTER, "Video frames the models ran on."),
+    "analysis_stage_seconds_total": (COUNTER, "Busy time per pipeline stage (decode, inference, aggregation)."),
+    "analysis_substage_seconds_total": (COUNTER, "Busy time per part of a pipeline stage (model calls, box conversion)."),
+    "analysis_substage_frames_total": (COUNTER, "Frames processed per part of a pipeline stage."),
+    "analysis_post_processing_seconds_total": (COUNTER, "Time per post-processing step after detection."),
+    "analysis_stage_blocked_seconds_total": (COUNTER, "Time pipeline stages spent waiting on their queues."),
+    "analysis_stage_frames_total": (COUNTER, "Frames processed per pipeline stage."),
+    "analysis_stage_max_queue_depth": (GAUGE, "Deepest input queue of each pipeline stage in the last job."),
+    "analysis_last_frames_per_second": (GAUGE, "Frames read per wall-clock second by the last job."),
+    "analysis_peak_rss_bytes": (GAUGE, "Peak resident memory of the last job's analysing process and segment processes."),
+    "analysis_serialization_seconds": (SUMMARY, "Time spent writing analysis results to disk."),
+    "analysis_queue_jobs": (GAUGE, "Analysis jobs in the queue, by status."),
+    "analysis_cache_events_total": (COUNTER, "Result cache lookups and updates, by event."),
+    "analysis_cache_size_bytes": (GAUGE, "Total size of the result cache entries."),
+    "trigger_analysis_requests_total": (COUNTER, "POST /api/analyze_booking requests, by HTTP status."),
+    "trigger_analysis_seconds": (SUMMARY, "Time to answer POST /api/analyze_booking requests."),
+    "live_sessions": (GAUGE, "Live analysis sessions running."),
+    "server_peak_rss_bytes": (GAUGE, "Peak resident memory of the API server process."),
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_sample(name, label_key, value):
+    labels = ",".join(f'{label}="{_escape(label_value)}"' for label, label_value in label_key)
+    return f"{name}{{{labels}}} {value:.10g}" if labels else f"{name} {value:.10g}"
+
+
+class MetricsRegistry:
+    """Thread-safe store of the METRICS values."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {} # {(name, label_key): value}; summaries store [count, sum]
+        self._collectors = []
+
+    def _check(self, name, *expected_types):
+        metric_type = METRICS.get(name, (None,))[0]
+        if metric_type not in expected_types:
+            raise ValueError(f"{name!r} is not a declared {' or '.join(expected_types)}")
+
+    def inc(self, name, amount=1, **labels):
+        """Adds `amount` to a counter."""
+        self._check(name, COUNTER)
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        """Sets a gauge, or a counter whose total is kept elsewhere (e.g. in a database)."""
+        self._check(name, GAUGE, COUNTER)
+        with self._lock:
+            self._values[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        """Adds one observation to a summary."""
+        self._check(name, SUMMARY)
+        key = (name, _label_key(labels))
+        with self._lock:
+            count_and_sum = self._values.setdefault(key, [0, 0.0])
+            count_and_sum[0] += 1
+            count_and_sum[1] += value
+
+    def add_collector(self, collector):
+        """
+        Registers collector(registry), called before every render to update gauges and
+        counters from their source (e.g. the job database). Errors are printed, not raised.
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format (version 0.0.4)."""
+        for collector in self._collectors:
+            try:
+                collector(self)
+            except Exception as e:
+                print(f"Metrics collector {collector!r} failed: {e}", file=sys.stderr)
+
+        with self._lock:
+            values = dict(self._values)
+        samples_by_name = {}
+        for (name, label_key), value in sorted(values.items()):
+            samples_by_name.setdefault(name, []).append((label_key, value))
+
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            if name not in samples_by_name:
+                continue
+            full_name = METRIC_PREFIX + name
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+            for label_key, value in samples_by_name[name]:
+                if metric_type == SUMMARY:
+                    lines.append(_format_sample(f"{full_name}_count", label_key, value[0]))
+                    lines.append(_format_sample(f"{full_name}_sum", label_key, value[1]))
+                else:
+                    lines.append(_format_sample(full_name, label_key, value))
+        return "\n".join(lines) + "\n"
+
+
+def record_analysis(registry, summary, wall_seconds):
+    """
+    Records a finished analysis.
+
+    Args:
+        registry (MetricsRegistry): Where to record.
+        summary (dict): The results summary (see result_store.py) or the full results;
+            only the summary entries are read.
+        wall_seconds (float): How long the job took.
+    """
+    registry.inc("analysis_jobs_total", outcome="completed")
+    registry.observe("analysis_job_seconds", wall_seconds)
+
+    sampling = summary.get("sampling") or {}
+    frames = sampling.get("frames_total", 0)
+    registry.inc("analysis_frames_total", frames)
+    registry.inc("analysis_inferred_frames_total", sampling.get("frames_inferred", 0))
+    if wall_seconds > 0:
+        registry.set("analysis_last_frames_per_second", frames / wall_seconds)
+
+    for stage, stats in (summary.get("stage_stats") or {}).items():
+        if stage in PIPELINE_STAGES:
+            registry.inc("analysis_stage_seconds_total", stats["busy_seconds"], stage=stage)
+            registry.inc("analysis_stage_frames_total", stats["frames"], stage=stage)
+            registry.inc("analysis_stage_blocked_seconds_total", stats["blocked_seconds"], stage=stage)
+            registry.set("analysis_stage_max_queue_depth", stats["max_queue_depth"], stage=stage)
+        else: # Sub-stages: already counted in their stage's busy time, and never wait on a queue
+            registry.inc("analysis_substage_seconds_total", stats["busy_seconds"], substage=stage)
+            registry.inc("analysis_substage_frames_total", stats["frames"], substage=stage)
+
+    # Only present when the analysis ran with profile=True
+    profile = summary.get("profile") or {}
+    for step, seconds in profile.get("post_processing_seconds", {}).items():
+        registry.inc("analysis_post_processing_seconds_total", seconds, step=step)
+    if profile.get("peak_rss_bytes") is not None:
+        registry.set("analysis_peak_rss_bytes", profile["peak_rss_bytes"], process="analysis")
+    if profile.get("segment_peak_rss_bytes") is not None:
+        registry.set("analysis_peak_rss_bytes", profile["segment_peak_rss_bytes"], process="segment")
@@ -0,0 +1,418 @@
+# Save this as model_backends.py (next to analyze_video.py)
+"""
+Inference backends for the player and ball YOLO models.
+
+analyze_video.load_models runs the PyTorch weights by default. With
+ANALYSIS_MODEL_BACKEND set to "onnx" (ONNX Runtime) or "openvino", both models
+are exported once to that format and the export is run instead, which is usually
+much faster on CPU-only machines. Exports are cached in EXPORT_DIR, keyed by the
+weights' digest, the format, the image size and the precision, so later runs
+(and every worker and segment process) load the cached files.
+
+With ANALYSIS_MODEL_INT8=1 the export is also quantized to INT8, calibrated on
+frames of a sample court recording (ANALYSIS_CALIBRATION_VIDEO):
+    onnx     - static QDQ quantization with onnxruntime.quantization
+    openvino - post-training quantization with NNCF
+
+Exported models are loaded through Ultralytics' YOLO class, so predict() and its
+Results stay the same for the rest of the analysis. Detections can still differ
+slightly, especially with INT8. Before switching a production box, check the
+accuracy against PyTorch and the speedup on a real recording:
+
+    python model_backends.py compare <video> --backend openvino --int8 --calibration-video <court.mp4>
+
+Usage:
+    python model_backends.py export --backend onnx [--int8 --calibration-video <court.mp4>]
+    python model_backends.py compare <video> --backend onnx [--int8 ...] [--frames 240] [--batch-size 8]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from box_postprocessing import boxes_array
+
+BACKEND_PYTORCH = "pytorch"
+BACKEND_ONNX = "onnx"
+BACKEND_OPENVINO = "openvino"
+MODEL_BACKENDS = (BACKEND_PYTORCH, BACKEND_ONNX, BACKEND_OPENVINO)
+
+# Configuration, read from the environment so model_server.py and segment processes inherit it
+BACKEND_ENV = "ANALYSIS_MODEL_BACKEND"
+INT8_ENV = "ANALYSIS_MODEL_INT8"
+CALIBRATION_VIDEO_ENV = "ANALYSIS_CALIBRATION_VIDEO"
+EXPORT_DIR_ENV = "ANALYSIS_MODEL_EXPORT_DIR"
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_EXPORT_DIR = os.path.join(SCRIPT_DIR, "model_exports")
+
+EXPORT_IMAGE_SIZE = 640 # Input size of the exported models (the size the weights were trained at)
+CALIBRATION_FRAMES = 200 # Frames spread over the calibration video used for INT8 calibration
+LETTERBOX_COLOR = 114 # Padding value Ultralytics uses
+
+# Agreement with the PyTorch detections below which `compare` fails (exit status 1)
+PARITY_IOU = 0.5
+MIN_AGREEMENT = {"fp32": 0.98, "int8": 0.90}
+
+
+def backend_config():
+    """
+    The configured backend as {"backend": ..., "int8": bool}, or None for the PyTorch weights.
+    Part of the result cache key and the checkpoint identity, since detections can differ.
+    """
+    backend = os.environ.get(BACKEND_ENV, BACKEND_PYTORCH) or BACKEND_PYTORCH
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(f"Unknown {BACKEND_ENV} {backend!r}, expected one of {MODEL_BACKENDS}")
+    if backend == BACKEND_PYTORCH:
+        return None
+    return {"backend": backend, "int8": os.environ.get(INT8_ENV, "0") == "1"}
+
+
+def export_path(weights_path, backend, int8=False, imgsz=EXPORT_IMAGE_SIZE, export_dir=None):
+    """
+    Where the export of `weights_path` is cached: a .onnx file, or an OpenVINO model directory.
+    The name includes the weights' digest, so new weights are exported again.
+    """
+    from result_cache import weights_digest
+
+    digest = weights_digest(weights_path)
+    if digest is None:
+        raise FileNotFoundError(f"Model weights not found: {weights_path}")
+    stem = os.path.splitext(os.path.basename(weights_path))[0]
+    name = f"{stem}-{digest[:12]}-{imgsz}-{'int8' if int8 else 'fp32'}"
+    export_dir = export_dir or os.environ.get(EXPORT_DIR_ENV) or DEFAULT_EXPORT_DIR
+    if backend == BACKEND_ONNX:
+        return os.path.join(export_dir, f"{name}.onnx")
+    if backend == BACKEND_OPENVINO:
+        return os.path.join(export_dir, f"{name}_openvino_model")
+    raise ValueError(f"Nothing to export for backend {backend!r}")
+
+
+def letterbox(frame, imgsz=EXPORT_IMAGE_SIZE):
+    """
+    A BGR frame as the exported models' input: resized to fit imgsz x imgsz, padded, RGB,
+    CHW, scaled to 0..1, with a batch dimension. Matches Ultralytics' own preprocessing.
+    """
+    height, width = frame.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    resized_width, resized_height = round(width * scale), round(height * scale)
+    resized = cv2.resize(frame, (resized_width, resized_height), interpolation=cv2.INTER_LINEAR)
+    padded = np.full((imgsz, imgsz, 3), LETTERBOX_COLOR, dtype=np.uint8)
+    top = (imgsz - resized_height) // 2
+    left = (imgsz - resized_width) // 2
+    padded[top:top + resized_height, left:left + resized_width] = resized
+    return np.ascontiguousarray(padded[:, :, ::-1].transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+
+
+def read_frames(video_path, count, max_frames=None):
+    """Up to `count` frames spread evenly over the video (or over its first max_frames frames)."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video file: {video_path}")
+    try:
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if max_frames:
+            total = min(total, max_frames) if total > 0 else max_frames
+        if total <= 0:
+            raise IOError(f"Cannot read the frame count of {video_path}")
+        wanted = set(np.linspace(0, total - 1, num=min(count, total)).astype(int).tolist())
+        frames = []
+        # Read sequentially: seeking is slow and inexact in many codecs
+        for frame_number in range(max(wanted) + 1):
+            ok, frame = cap.read()
+            if not ok:
+                break
+            if frame_number in wanted:
+                frames.append(frame)
+        return frames
+    finally:
+        cap.release()
+
+
+def _export_onnx(model, destination, imgsz, calibration_frames):
+    exported = model.export(format="onnx", imgsz=imgsz, dynamic=True) # Dynamic batch size
+    if calibration_frames is None:
+        shutil.move(exported, destination)
+        return
+
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    fp32_model = onnx.load(exported)
+    input_name = fp32_model.graph.input[0].name
+
+    class CourtFrames(CalibrationDataReader):
+        def __init__(self):
+            self._frames = iter(calibration_frames)
+
+        def get_next(self):
+            frame = next(self._frames, None)
+            return None if frame is None else {input_name: letterbox(frame, imgsz)}
+
+    quantize_static(
+        exported, destination, CourtFrames(), quant_format=QuantFormat.QDQ,
+        per_channel=True, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+    )
+    # Ultralytics reads the class names, stride and image size from the model metadata
+    quantized = onnx.load(destination)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(quantized, destination)
+    os.remove(exported)
+
+
+def _export_openvino(model, destination, imgsz, calibration_frames):
+    exported = model.export(format="openvino", imgsz=imgsz, dynamic=True)
+    if calibration_frames is None:
+        shutil.move(exported, destination)
+        return
+
+    import nncf
+    import openvino as ov
+
+    xml_name = next(name for name in os.listdir(exported) if name.endswith(".xml"))
+    fp32_model = ov.Core().read_model(os.path.join(exported, xml_name))
+    quantized = nncf.quantize(
+        fp32_model, nncf.Dataset(calibration_frames, lambda frame: letterbox(frame, imgsz)),
+        preset=nncf.QuantizationPreset.MIXED, subset_size=len(calibration_frames),
+    )
+    os.makedirs(destination)
+    ov.save_model(quantized, os.path.join(destination, xml_name), compress_to_fp16=False)
+    # metadata.yaml (class names, stride, image size) is what Ultralytics loads the directory with
+    for name in os.listdir(exported):
+        if name.endswith(".yaml"):
+            shutil.copy2(os.path.join(exported, name), destination)
+    shutil.rmtree(exported, ignore_errors=True)
+
+
+def ensure_exported(weights_path, backend, int8=False, calibration_video=None, imgsz=EXPORT_IMAGE_SIZE,
+                    export_dir=None):
+    """
+    Returns the cached export of `weights_path` for `backend`, exporting it first if needed.
+
+    Exports are built in a temporary directory and renamed into place, so processes that
+    start at the same time may export twice but never load a partial export.
+
+    Args:
+        int8 (bool): Quantize to INT8, calibrated on frames of `calibration_video`.
+        calibration_video (str, optional): Sample court recording for INT8 calibration
+            (default: ANALYSIS_CALIBRATION_VIDEO).
+
+    Returns:
+        str: Path of the .onnx file or OpenVINO model directory.
+    """
+    destination = export_path(weights_path, backend, int8, imgsz, export_dir)
+    if os.path.exists(destination):
+        return destination
+
+    calibration_frames = None
+    if int8:
+        calibration_video = calibration_video or os.environ.get(CALIBRATION_VIDEO_ENV)
+        if not calibration_video:
+            raise ValueError(f"INT8 export needs sample court frames: set {CALIBRATION_VIDEO_ENV}")
+        calibration_frames = read_frames(calibration_video, CALIBRATION_FRAMES)
+
+    from ultralytics import YOLO
+
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=".export-", dir=os.path.dirname(destination))
+    try:
+        # Ultralytics writes the export next to the weights, so export a copy inside work_dir
+        weights_copy = os.path.join(work_dir, os.path.basename(weights_path))
+        shutil.copy2(weights_path, weights_copy)
+        partial = os.path.join(work_dir, os.path.basename(destination))
+        export = _export_onnx if backend == BACKEND_ONNX else _export_openvino
+        started = time.perf_counter()
+        export(YOLO(weights_copy), partial, imgsz, calibration_frames)
+        try:
+            os.rename(partial, destination)
+        except OSError:
+            if not os.path.exists(destination): # Otherwise another process finished first
+                raise
+        print(f"Exported {weights_path} to {destination} in {time.perf_counter() - started:.1f} s", file=sys.stderr)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return destination
+
+
+def load_backend_models(player_weights, ball_weights, backend, int8=False, calibration_video=None):
+    """The (player_model, ball_model) pair run by `backend`, exporting them first if needed."""
+    from ultralytics import YOLO
+
+    if backend == BACKEND_PYTORCH:
+        return YOLO(player_weights), YOLO(ball_weights)
+    return tuple(
+        YOLO(ensure_exported(weights, backend, int8, calibration_video), task="detect")
+        for weights in (player_weights, ball_weights)
+    )
+
+
+# --- Accuracy parity and speed ---
+
+def box_iou(boxes_a, boxes_b):
+    """IoU matrix of two (N, 4+) and (M, 4+) arrays of x1, y1, x2, y2 boxes."""
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:4], boxes_b[None, :, 2:4])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:4] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:4] - boxes_b[:, :2], axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def match_boxes(reference, candidate, iou_threshold=PARITY_IOU):
+    """
+    Greedy one-to-one matching of one frame's boxes (N, 6) by IoU, within the same class.
+
+    Returns:
+        tuple: (ious, conf_diffs) of the matched pairs.
+    """
+    if len(reference) == 0 or len(candidate) == 0:
+        return np.empty(0), np.empty(0)
+    ious = box_iou(reference, candidate)
+    ious[reference[:, 5, None] != candidate[None, :, 5]] = 0.0
+    matched_ious, conf_diffs = [], []
+    while True:
+        row, column = np.unravel_index(np.argmax(ious), ious.shape)
+        if ious[row, column] < iou_threshold:
+            break
+        matched_ious.append(ious[row, column])
+        conf_diffs.append(abs(float(reference[row, 4]) - float(candidate[column, 4])))
+        ious[row, :] = 0.0
+        ious[:, column] = 0.0
+    return np.asarray(matched_ious), np.asarray(conf_diffs)
+
+
+def agreement(reference_frames, candidate_frames):
+    """
+    How well one model's detections agree with the reference's, over the same frames.
+
+    Args:
+        reference_frames, candidate_frames (list): Per frame, an (N, 6) boxes array.
+
+    Returns:
+        dict: recall (reference boxes matched), precision (candidate boxes matched),
+              mean_iou and mean_conf_diff of the matches, and the box counts.
+    """
+    reference_boxes = sum(len(boxes) for boxes in reference_frames)
+    candidate_boxes = sum(len(boxes) for boxes in candidate_frames)
+    ious, conf_diffs = [], []
+    for reference, candidate in zip(reference_frames, candidate_frames):
+        frame_ious, frame_conf_diffs = match_boxes(reference, candidate)
+        ious.extend(frame_ious)
+        conf_diffs.extend(frame_conf_diffs)
+    matched = len(ious)
+    return {
+        "reference_boxes": reference_boxes,
+        "candidate_boxes": candidate_boxes,
+        "recall": matched / reference_boxes if reference_boxes else 1.0,
+        "precision": matched / candidate_boxes if candidate_boxes else 1.0,
+        "mean_iou": float(np.mean(ious)) if ious else None,
+        "mean_conf_diff": float(np.mean(conf_diffs)) if conf_diffs else None,
+    }
+
+
+def time_predictions(model, frames, batch_size):
+    """
+    Runs `model` over `frames` in batches (after one warm-up batch).
+
+    Returns:
+        tuple: ([(N, 6) boxes per frame], seconds per frame)
+    """
+    model.predict(frames[:batch_size], verbose=False)
+    boxes = []
+    started = time.perf_counter()
+    for start in range(0, len(frames), batch_size):
+        boxes.extend(boxes_array(results) for results in model.predict(frames[start:start + batch_size], verbose=False))
+    return boxes, (time.perf_counter() - started) / max(1, len(frames))
+
+
+def compare_backends(video_path, backend, int8=False, calibration_video=None, frame_count=240, batch_size=8,
+                     player_weights=None, ball_weights=None):
+    """
+    Runs the PyTorch models and the `backend` export on the same frames of a video and
+    reports their agreement and speed.
+
+    Returns:
+        dict: Per model ("player", "ball"): agreement (see agreement()), seconds_per_frame of
+              both backends and the speedup, plus "passed" (all agreements above MIN_AGREEMENT).
+    """
+    from result_cache import default_model_paths
+
+    default_player, default_ball = default_model_paths()
+    player_weights, ball_weights = player_weights or default_player, ball_weights or default_ball
+    frames = read_frames(video_path, frame_count, max_frames=frame_count)
+    reference_models = load_backend_models(player_weights, ball_weights, BACKEND_PYTORCH)
+    candidate_models = load_backend_models(player_weights, ball_weights, backend, int8, calibration_video)
+    min_agreement = MIN_AGREEMENT["int8" if int8 else "fp32"]
+
+    report = {"video": video_path, "frames": len(frames), "batch_size": batch_size, "backend": backend,
+              "int8": int8, "min_agreement": min_agreement, "passed": True}
+    for name, reference_model, candidate_model in zip(("player", "ball"), reference_models, candidate_models):
+        reference_boxes, reference_seconds = time_predictions(reference_model, frames, batch_size)
+        candidate_boxes, candidate_seconds = time_predictions(candidate_model, frames, batch_size)
+        model_agreement = agreement(reference_boxes, candidate_boxes)
+        report[name] = {
+            **model_agreement,
+            "pytorch_seconds_per_frame": round(reference_seconds, 5),
+            f"{backend}_seconds_per_frame": round(candidate_seconds, 5),
+            "speedup": round(reference_seconds / candidate_seconds, 2) if candidate_seconds else None,
+        }
+        if min(model_agreement["recall"], model_agreement["precision"]) < min_agreement:
+            report["passed"] = False
+    return report
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Export the YOLO models and check exports against PyTorch.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    configured = os.environ.get(BACKEND_ENV)
+
+    def add_backend_args(subparser):
+        subparser.add_argument("--backend", choices=[BACKEND_ONNX, BACKEND_OPENVINO],
+                               default=configured if configured in (BACKEND_ONNX, BACKEND_OPENVINO) else None,
+                               help=f"Export format (default: ${BACKEND_ENV})")
+        subparser.add_argument("--int8", action="store_true", default=os.environ.get(INT8_ENV) == "1",
+                               help="Quantize to INT8")
+        subparser.add_argument("--calibration-video", default=os.environ.get(CALIBRATION_VIDEO_ENV),
+                               help="Sample court recording for INT8 calibration")
+
+    export_parser = subparsers.add_parser("export", help="Export both models (cached)")
+    add_backend_args(export_parser)
+
+    compare_parser = subparsers.add_parser("compare", help="Accuracy parity and speedup against PyTorch")
+    compare_parser.add_argument("video_filepath", help="Video to compare on")
+    add_backend_args(compare_parser)
+    compare_parser.add_argument("--frames", type=int, default=240, help="Frames to compare on")
+    compare_parser.add_argument("--batch-size", type=int, default=8, help="Frames per predict() call")
+    return parser
+
+
+if __name__ == "__main__":
+    parser = build_arg_parser()
+    args = parser.parse_args()
+    if args.backend is None:
+        parser.error(f"--backend is required unless {BACKEND_ENV} is onnx or openvino")
+    try:
+        if args.command == "export":
+            from result_cache import default_model_paths
+            paths = [ensure_exported(weights, args.backend, args.int8, args.calibration_video)
+                     for weights in default_model_paths()]
+            print(json.dumps({"player": paths[0], "ball": paths[1]}, indent=2))
+        else:
+            report = compare_backends(args.video_filepath, args.backend, args.int8, args.calibration_video,
+                                      frame_count=args.frames, batch_size=args.batch_size)
+            print(json.dumps(report, indent=2))
+            if not report["passed"]:
+                print(f"Detections differ from PyTorch by more than {1 - report['min_agreement']:.0%}", file=sys.stderr)
+                sys.exit(1)
+    except Exception as e:
+        print(json.dumps({"error": str(e)}), file=sys.stderr)
+        sys.exit(1)
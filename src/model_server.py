@@ -0,0 +1,251 @@
+# Save this as model_server.py (next to analyze_video.py)
+"""
+Resident inference worker: a child process that loads both YOLO models once and
+then analyses any number of videos sent to it over an authenticated local socket.
+
+Running analyze_video.py as a fresh subprocess pays for interpreter startup, the
+torch import and model deserialization on every video. A ResidentAnalyzer pays
+that once, when it starts, and is otherwise a drop-in replacement for the
+subprocess path used by job_queue.py.
+
+Usage (cold vs warm start timing on one video):
+    python model_server.py <video_filepath>
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The parent hands the child the connection authkey through the environment (not argv)
+AUTHKEY_ENV_VAR = "MODEL_SERVER_AUTHKEY"
+
+
+class ModelServerError(RuntimeError):
+    """The resident process failed to start or died while analysing."""
+
+
+def serve(address):
+    """
+    Entry point of the resident process: connect back to the parent, load the
+    models, then serve analysis requests until told to stop.
+    """
+    conn = Client(address, authkey=bytes.fromhex(os.environ[AUTHKEY_ENV_VAR]))
+
+    load_started = time.perf_counter()
+    try:
+        import analyze_video
+        player_model, ball_model = analyze_video.get_models()
+    except Exception as e:
+        conn.send(("error", f"Failed to load models: {e}"))
+        return
+    conn.send(("ready", time.perf_counter() - load_started))
+
+    def report_progress(frames_done, frames_total):
+        conn.send(("progress", frames_done, frames_total))
+        # The parent can only reach us between frames; check for a cancel request
+        while conn.poll(0):
+            if conn.recv()[0] == "cancel":
+                raise analyze_video.AnalysisCancelled()
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return # Parent went away
+        if message[0] == "stop":
+            return
+        if message[0] != "analyze":
+            continue # e.g. a cancel that arrived after its analysis had finished
+
+        _, video_path, options = message
+        try:
+            results = analyze_video.analyze_pickleball_video(
+                video_path, player_model, ball_model, progress_callback=report_progress, **options
+            )
+        except analyze_video.AnalysisCancelled:
+            conn.send(("cancelled",))
+            continue
+        except Exception as e:
+            conn.send(("error", f"Analysis failed: {e}"))
+            continue
+
+        if "error" in results:
+            conn.send(("error", f"Analysis failed: {results['error']}"))
+        else:
+            conn.send(("result", results))
+
+
+class ResidentAnalyzer:
+    """
+    Handle on one resident model process. Not thread-safe: give each worker thread its own.
+
+    Args:
+        start_timeout (float): Seconds to wait for the models to load.
+    """
+
+    def __init__(self, start_timeout=300):
+        self.start_timeout = start_timeout
+        self.load_seconds = None
+        self._process = None
+        self._conn = None
+
+    def is_alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        """Starts the resident process and waits until both models are loaded (idempotent)."""
+        if self.is_alive():
+            return
+        self.close()
+
+        # A plain child interpreter (rather than multiprocessing.Process) so the child
+        # never re-imports the parent's __main__, i.e. app.py and its job queue.
+        authkey = os.urandom(16)
+        listener = Listener(("127.0.0.1", 0), authkey=authkey)
+        host, port = listener.address
+        self._process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", f"{host}:{port}"],
+            cwd=SCRIPT_DIR, # Model paths in analyze_video.py are relative
+            env={**os.environ, AUTHKEY_ENV_VAR: authkey.hex()},
+            stdin=subprocess.DEVNULL,
+        )
+
+        # Listener.accept() has no timeout, so wait for it on a helper thread
+        accepted = []
+        acceptor = threading.Thread(target=lambda: accepted.append(listener.accept()), daemon=True)
+        acceptor.start()
+        acceptor.join(self.start_timeout)
+        listener.close()
+        if not accepted:
+            self.close()
+            raise ModelServerError("Model server did not connect back in time.")
+        self._conn = accepted[0]
+
+        if not self._conn.poll(self.start_timeout):
+            self.close()
+            raise ModelServerError("Timed out waiting for the model server to load models.")
+        try:
+            message = self._conn.recv()
+        except EOFError:
+            self.close()
+            raise ModelServerError("Model server exited during startup.")
+        if message[0] == "error":
+            self.close()
+            raise ModelServerError(message[1])
+        self.load_seconds = message[1]
+
+    def analyze(self, video_path, progress_callback=None, should_cancel=None, poll_interval=1.0, options=None):
+        """
+        Analyses a video in the resident process.
+
+        Args:
+            video_path (str): Path to the video file.
+            options (dict, optional): Extra keyword arguments for analyze_pickleball_video
+                (e.g. {"batch_size": 8}).
+            progress_callback (callable, optional): progress_callback(frames_done, frames_total).
+            should_cancel (callable, optional): Polled about every `poll_interval` seconds; returning
+                True stops the analysis and raises AnalysisCancelled.
+
+        Returns:
+            dict: The analysis results, as analyze_pickleball_video returns them.
+        """
+        from analyze_video import AnalysisCancelled
+
+        self.start()
+        self._conn.send(("analyze", os.path.abspath(video_path), dict(options or {})))
+        cancel_sent = False
+        last_cancel_check = time.monotonic()
+        while True:
+            if should_cancel is not None and not cancel_sent and time.monotonic() - last_cancel_check >= poll_interval:
+                last_cancel_check = time.monotonic()
+                if should_cancel():
+                    self._conn.send(("cancel",)) # The child stops at its next progress report
+                    cancel_sent = True
+
+            if not self._conn.poll(poll_interval):
+                if not self.is_alive():
+                    self.close()
+                    raise ModelServerError("Model server died during analysis.")
+                continue
+
+            try:
+                message = self._conn.recv()
+            except EOFError:
+                self.close()
+                raise ModelServerError("Model server died during analysis.")
+
+            kind = message[0]
+            if kind == "progress":
+                if progress_callback is not None:
+                    progress_callback(message[1], message[2])
+            elif kind == "result":
+                return message[1]
+            elif kind == "cancelled":
+                raise AnalysisCancelled(video_path)
+            else:
+                raise RuntimeError(message[1])
+
+    def close(self):
+        """Stops the resident process."""
+        if self._process is None:
+            return
+        try:
+            if self._conn is not None and self.is_alive():
+                self._conn.send(("stop",))
+                self._process.wait(5)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        if self.is_alive():
+            self._process.kill()
+            self._process.wait()
+        if self._conn is not None:
+            self._conn.close()
+        self._process = None
+        self._conn = None
+
+
+def _time_cold_start(video_path):
+    """One analysis the old way: a fresh interpreter running analyze_video.py."""
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, os.path.join(SCRIPT_DIR, "analyze_video.py"), video_path],
+        cwd=SCRIPT_DIR, capture_output=True, text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip())
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--serve":
+        # Internal: started by ResidentAnalyzer.start()
+        host, port = sys.argv[2].rsplit(":", 1)
+        serve((host, int(port)))
+        sys.exit(0)
+
+    if len(sys.argv) < 2:
+        print(json.dumps({"error": "Usage: python model_server.py <video_filepath>"}), file=sys.stderr)
+        sys.exit(1)
+
+    video_filepath = os.path.abspath(sys.argv[1])
+    timings = {"cold_subprocess_seconds": _time_cold_start(video_filepath)}
+
+    analyzer = ResidentAnalyzer()
+    started = time.perf_counter()
+    analyzer.start()
+    timings["resident_startup_seconds"] = time.perf_counter() - started
+    timings["resident_model_load_seconds"] = analyzer.load_seconds
+    try:
+        for run in ("first", "second"):
+            started = time.perf_counter()
+            analyzer.analyze(video_filepath)
+            timings[f"warm_{run}_video_seconds"] = time.perf_counter() - started
+    finally:
+        analyzer.close()
+
+    print(json.dumps({k: round(v, 3) for k, v in timings.items()}, indent=2))
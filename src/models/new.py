@@ -1,3 +1,5 @@
+import os
+import sys
 import cv2
 import numpy as np
 import pandas as pd
@@ -5,6 +7,11 @@ import matplotlib.pyplot as plt
 from ultralytics import YOLO
 from collections import defaultdict
 
+# Share the vectorized box post-processing with analyze_video.py (one directory up)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from box_postprocessing import boxes_array, box_centers, box_sizes
+from player_tracking import PlayerTracker
+
 # Load YOLOv8 pretrained model (you can fine-tune for better results)
 model = YOLO("yolov8n.pt")  # or "yolov8s.pt" for more accuracy
 
@@ -20,6 +27,10 @@ frame_idx = 0
 # Object classes of interest (0 = person in COCO)
 TARGET_CLASS = 0
 
+# Keeps each player's label across frames (see player_tracking.py), instead of numbering
+# the players of every frame in detection order
+tracker = PlayerTracker(fps)
+
 while True:
     ret, frame = cap.read()
     if not ret:
@@ -28,12 +39,12 @@ while True:
     frame_idx += 1
     results = model(frame)
 
-    for box in results[0].boxes.data:
-        x1, y1, x2, y2, conf, cls = box.cpu().numpy()
-        if int(cls) == TARGET_CLASS:
-            cx = int((x1 + x2) / 2)
-            cy = int((y1 + y2) / 2)
-            player_positions[frame_idx].append((cx, cy))
+    # One host copy of the frame's boxes, then class filtering and centres as arrays
+    boxes = boxes_array(results[0])
+    keep, cx, cy, conf = box_centers(boxes, TARGET_CLASS)
+    w, h = box_sizes(boxes, keep)
+    track_ids = tracker.update(frame_idx, cx, cy, w, h, conf)
+    player_positions[frame_idx].extend(zip(track_ids.tolist(), cx.tolist(), cy.tolist()))
 
 cap.release()
 
@@ -41,8 +52,9 @@ cap.release()
 # After this block:
 data = []
 for frame_id, coords in player_positions.items():
-    for i, (x, y) in enumerate(coords):
-        data.append({"frame": frame_id, "player": f"Player_{i+1}", "x": x, "y": y})
+    for track_id, x, y in coords:
+        if track_id >= 0: # Low-confidence boxes that continued no track
+            data.append({"frame": frame_id, "player": f"Player_{track_id+1}", "x": x, "y": y})
 
 # Convert to DataFrame
 positions_df = pd.DataFrame(data)
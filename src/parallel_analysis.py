@@ -0,0 +1,293 @@
+# Save this as parallel_analysis.py (next to analyze_video.py)
+"""
+Temporal-segment parallel analysis: splits a video into time segments whose
+boundaries sit on keyframes, runs detect_video_range on each segment in a pool
+of processes (each loading its own models once) and merges the detections.
+
+Detections carry global frame numbers, and everything that looks across frames
+(player interpolation, shot counting, ball tracking) runs once on the merged
+detections in build_results. A ball track crossing a segment boundary is
+therefore seen as one track and is never counted once per segment.
+"""
+import bisect
+import concurrent.futures
+import multiprocessing
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+
+import cv2
+
+from box_postprocessing import concatenate_columns
+from profiling import peak_rss_bytes, reset_peak_rss
+
+# Segments shorter than this aren't worth a process (model load + seek cost)
+MIN_SEGMENT_FRAMES = 300
+
+# Set in each pool process by _init_segment_worker
+_progress_queue = None
+_cancelled_run = None
+
+# The pool is created on first use and kept for the life of the process, so a resident
+# model server (model_server.py) loads the models into its pool processes only once.
+_pool_lock = threading.Lock()
+_pool = None
+_pool_workers = 0
+_pool_progress_queue = None
+_pool_cancelled_run = None
+_next_run_id = 0
+
+
+def find_keyframes(video_path, fps):
+    """
+    Returns the 0-based frame indices of the video's keyframes, read from packet flags with
+    ffprobe (no decoding), or None if ffprobe isn't installed or fails.
+    """
+    ffprobe = shutil.which("ffprobe")
+    if ffprobe is None or not fps:
+        return None
+    try:
+        output = subprocess.run(
+            [ffprobe, "-v", "error", "-select_streams", "v:0",
+             "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_path],
+            capture_output=True, text=True, check=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    packet_times = []
+    keyframe_times = []
+    for line in output.splitlines():
+        fields = line.strip().split(",")
+        if len(fields) < 2 or fields[0] in ("", "N/A"):
+            continue
+        pts_time = float(fields[0])
+        packet_times.append(pts_time)
+        if "K" in fields[1]:
+            keyframe_times.append(pts_time)
+    if not keyframe_times:
+        return None
+    first_pts = min(packet_times)
+    return sorted({int(round((t - first_pts) * fps)) for t in keyframe_times})
+
+
+def plan_segments(total_frames, workers, keyframes=None, min_segment_frames=MIN_SEGMENT_FRAMES):
+    """
+    Splits [0, total_frames) into at most `workers` contiguous segments.
+
+    Boundaries start evenly spaced and are moved to the nearest keyframe when keyframes are
+    known, so every segment starts on a frame the decoder can seek to exactly.
+
+    Returns:
+        list: (start_frame, max_frames) tuples. The last segment has max_frames=None and runs
+              to the real end of the video, since the container frame count is only an estimate.
+    """
+    count = max(1, min(int(workers), total_frames // max(1, min_segment_frames)))
+    boundaries = []
+    for i in range(1, count):
+        boundary = round(i * total_frames / count)
+        if keyframes:
+            position = bisect.bisect_left(keyframes, boundary)
+            candidates = keyframes[max(0, position - 1):position + 1]
+            boundary = min(candidates, key=lambda k: abs(k - boundary))
+        if 0 < boundary < total_frames and (not boundaries or boundary > boundaries[-1]):
+            boundaries.append(boundary)
+
+    starts = [0] + boundaries
+    segments = [(start, end - start) for start, end in zip(starts, boundaries)]
+    segments.append((starts[-1], None))
+    return segments
+
+
+def _init_segment_worker(progress_queue, cancelled_run, threads_per_worker):
+    global _progress_queue, _cancelled_run
+    _progress_queue = progress_queue
+    _cancelled_run = cancelled_run
+    # Share the cores between pool processes instead of every process grabbing all of them
+    cv2.setNumThreads(threads_per_worker)
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+
+
+def _analyze_segment(run_id, video_path, segment_index, start_frame, max_frames, options):
+    import analyze_video
+
+    def report_progress(frames_done, frames_total):
+        _progress_queue.put((run_id, segment_index, frames_done))
+        if _cancelled_run.value == run_id:
+            raise analyze_video.AnalysisCancelled()
+
+    # get_models() caches per process, so each pool process loads the models only once
+    player_model, ball_model = analyze_video.get_models()
+    reset_peak_rss() # Pool processes are reused; measure this segment only
+    detections = analyze_video.detect_video_range(
+        video_path, player_model, ball_model, start_frame=start_frame, max_frames=max_frames,
+        progress_callback=report_progress, **options
+    )
+    detections["peak_rss_bytes"] = peak_rss_bytes()
+    return detections
+
+
+def detect_video_in_segments(video_path, workers, progress_callback=None, **options):
+    """
+    Parallel counterpart of analyze_video.detect_video_range over the whole video.
+
+    Args:
+        video_path (str): Path to the video file.
+        workers (int): Maximum number of pool processes (= segments).
+        progress_callback (callable, optional): progress_callback(frames_done, frames_total)
+            summed over all segments. It may raise AnalysisCancelled, which stops the workers.
+        options: Passed to detect_video_range (batch_size, pipelined, sampling, ...).
+
+    Returns:
+        dict: Merged detections in the detect_video_range format, plus a "segments" list;
+              or {"error": ...}.
+    """
+    import analyze_video
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return {"error": f"Could not open video file: {video_path}"}
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    segments = plan_segments(total_frames, workers, find_keyframes(video_path, fps))
+    if len(segments) == 1:
+        # Too short to be worth splitting
+        player_model, ball_model = analyze_video.get_models()
+        detections = analyze_video.detect_video_range(
+            video_path, player_model, ball_model, progress_callback=progress_callback, **options
+        )
+        if "error" not in detections:
+            detections["segments"] = [_segment_summary(0, detections)]
+        return detections
+
+    segment_detections = run_segments(
+        video_path, workers, segments, progress_callback=progress_callback, frames_total=total_frames, **options
+    )
+    for detections in segment_detections:
+        if "error" in detections:
+            return detections
+    return merge_segments(segments, segment_detections)
+
+
+def run_segments(video_path, workers, segments, progress_callback=None, frames_total=0, on_segment_done=None,
+                 **options):
+    """
+    Runs detect_video_range on each (start_frame, max_frames) segment in the process pool.
+
+    Args:
+        progress_callback (callable, optional): As for detect_video_in_segments, with frames
+            counted over these segments only.
+        frames_total (int): Expected number of frames over all segments, for progress reports.
+        on_segment_done (callable, optional): on_segment_done(index, detections), called on
+            this thread as each segment finishes (in completion order, not segment order).
+
+    Returns:
+        list: detect_video_range's output for each segment, in segment order.
+    """
+    # One video at a time per process: segments of concurrent calls would just queue up
+    with _pool_lock:
+        pool, progress_queue, cancelled_run, run_id = _get_pool(workers)
+        segment_progress = [0] * len(segments)
+        last_reported = 0
+
+        futures = [
+            pool.submit(_analyze_segment, run_id, video_path, index, start, max_frames, options)
+            for index, (start, max_frames) in enumerate(segments)
+        ]
+        try:
+            pending = set(futures)
+            while pending:
+                finished, pending = concurrent.futures.wait(pending, timeout=0.5)
+                if on_segment_done is not None:
+                    for future in finished:
+                        on_segment_done(futures.index(future), future.result())
+                while True:
+                    try:
+                        message_run_id, index, frames_done = progress_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if message_run_id == run_id: # Ignore stragglers from a cancelled run
+                        segment_progress[index] = max(segment_progress[index], frames_done)
+                frames_done = sum(segment_progress)
+                if progress_callback is not None and frames_done > last_reported:
+                    last_reported = frames_done
+                    progress_callback(frames_done, max(frames_total, frames_done))
+            return [future.result() for future in futures]
+        except BaseException:
+            # Cancelled or failed: stop this run's other segments at their next progress report
+            cancelled_run.value = run_id
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def _get_pool(workers):
+    """
+    Returns (pool, progress_queue, cancelled_run, run_id) for a new run, (re)creating the
+    process pool if it doesn't exist yet, has a different size or is broken. Hold _pool_lock.
+    """
+    global _pool, _pool_workers, _pool_progress_queue, _pool_cancelled_run, _next_run_id
+    if _pool is not None and (_pool_workers != workers or getattr(_pool, "_broken", False)):
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+    if _pool is None:
+        # "spawn" gives each process a clean interpreter (forking after torch is loaded is unsafe)
+        ctx = multiprocessing.get_context("spawn")
+        _pool_progress_queue = ctx.Queue()
+        _pool_cancelled_run = ctx.Value("q", -1)
+        threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+        _pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=ctx, initializer=_init_segment_worker,
+            initargs=(_pool_progress_queue, _pool_cancelled_run, threads_per_worker),
+        )
+        _pool_workers = workers
+    _next_run_id += 1
+    return _pool, _pool_progress_queue, _pool_cancelled_run, _next_run_id
+
+
+def _segment_summary(start_frame, detections):
+    return {
+        "start_frame": start_frame + 1, # 1-based, like all frame numbers in the results
+        "end_frame": start_frame + detections["frames_read"],
+        "frames_inferred": len(detections["inferred_frames"]),
+    }
+
+
+def merge_segments(segments, segment_detections):
+    """Concatenates per-segment detections (already in global frame numbers) in time order."""
+    first = segment_detections[0]
+    merged = {
+        "inferred_frames": [],
+        "frames_read": 0,
+        "stage_stats": first["stage_stats"],
+        "fps": first["fps"],
+        "video_dimensions": first["video_dimensions"],
+        "total_frames": first["total_frames"],
+        "segments": [],
+        "segment_peak_rss_bytes": None, # Largest peak RSS of a segment process, if known
+    }
+    for index, ((start_frame, max_frames), detections) in enumerate(zip(segments, segment_detections)):
+        if max_frames is not None and detections["frames_read"] < max_frames:
+            print(f"Segment {index + 1} stopped after {detections['frames_read']} of {max_frames} frames; "
+                  f"frames {start_frame + detections['frames_read'] + 1}-{start_frame + max_frames} are missing",
+                  file=sys.stderr)
+        merged["inferred_frames"].extend(detections["inferred_frames"])
+        merged["frames_read"] = max(merged["frames_read"], start_frame + detections["frames_read"])
+        if index > 0:
+            for name, stats in detections["stage_stats"].items():
+                merged["stage_stats"][name].merge(stats)
+        merged["segments"].append(_segment_summary(start_frame, detections))
+        if detections.get("peak_rss_bytes") is not None:
+            merged["segment_peak_rss_bytes"] = max(merged["segment_peak_rss_bytes"] or 0, detections["peak_rss_bytes"])
+    for table in ("player_detections", "ball_detections"):
+        merged[table] = concatenate_columns(table, [detections[table] for detections in segment_detections])
+    return merged
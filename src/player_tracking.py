@@ -0,0 +1,373 @@
+# Save this as player_tracking.py (next to analyze_video.py)
+"""
+Player identities across frames, and per-player movement stats, in one streaming pass.
+
+PlayerTracker gives each frame's player boxes a track id, ByteTrack-style:
+
+- Every live track predicts where its box is now (its last box moved at its
+  velocity).
+- Confident detections (conf >= high_conf) are matched to the predictions
+  by IoU first. When the track was last seen some frames ago (e.g. frames
+  skipped by adaptive sampling), the prediction is less certain, so both
+  boxes are widened by a buffer that grows with the gap before the IoU is
+  taken ("buffered IoU").
+- The tracks still unmatched get a second chance with the low-confidence
+  detections, which are often players half hidden by the net or a partner.
+  This keeps their ids through the occlusion.
+- Only confident detections that matched no track start new tracks.
+- A track not seen for max_lost_seconds is dropped.
+
+A frame rarely has more than a handful of players, so the matching is plain
+Python on those few boxes: at that size NumPy's per-call overhead would cost
+more than the arithmetic.
+
+PlayerStats accumulates distance covered, speed and time per court zone for
+each track as the frames go by. Like the tracker, it keeps only a few numbers
+per player (last position, running totals), never a list of positions, so
+both are O(players) in memory however long the video is.
+
+track_players runs both over a whole video's player_detections columns (see
+analyze_video.build_results). live_analysis.py feeds them one frame at a time.
+Distances and speeds are in pixels of the video frame; the camera framing
+decides how they relate to the court.
+"""
+import math
+
+import numpy as np
+
+# Detections at least this confident are matched first and may start tracks; less confident
+# ones (down to LOW_CONF, after YOLO's own threshold) can only continue existing tracks
+HIGH_CONF = 0.5
+LOW_CONF = 0.1
+# Lowest IoU between a track's predicted box and a detection for them to match, per stage
+MATCH_IOU = 0.3
+LOW_CONF_MATCH_IOU = 0.5
+# Buffered IoU: for a track last seen n frames ago, both boxes are widened on each side by
+# GAP_BUFFER_PER_FRAME * (n - 1) of the track's box size (at most MAX_GAP_BUFFER), plus the
+# distance its velocity covers in the n - 1 extra frames, before the IoU is taken. The player
+# may have stopped or turned since the velocity was measured (a rally ending is what sends
+# adaptive sampling to IDLE_STRIDE), so the extrapolated box can be off by that much.
+# Consecutive frames are not buffered.
+GAP_BUFFER_PER_FRAME = 0.1
+MAX_GAP_BUFFER = 1.0
+# A track unmatched for this long is dropped (a player who comes back gets a new id)
+MAX_LOST_SECONDS = 1.0
+# Weight of the newest frame-to-frame motion in a track's velocity
+VELOCITY_SMOOTHING = 0.5
+
+# Tracks seen for less than this (first to last detection) are noise, e.g. passers-by or
+# false positives, and are dropped from the results (their detections get track_id -1)
+MIN_TRACK_SECONDS = 1.0
+# Weight of the newest position in a player's smoothed position
+POSITION_SMOOTHING = 0.5
+# Distance is measured between smoothed positions this far apart in time, rather than frame to
+# frame, so box jitter is added once per step instead of once per frame. Speeds are per step too.
+DISTANCE_STEP_SECONDS = 0.25
+# Weight of the newest step in the smoothed speed max_speed is taken from, so one jittery step
+# doesn't set a player's top speed
+SPEED_SMOOTHING = 0.5
+
+# Court zones as (left, top, right, bottom) fractions of the frame. The defaults split the
+# frame into far/mid/near thirds and left/right halves, which suits a camera behind one
+# baseline; adjust them to the camera's framing. A point counts towards the first zone that
+# contains it.
+COURT_ZONES = {
+    f"{depth}_{side}": (left, top, left + 0.5, top + 1 / 3)
+    for top, depth in ((0.0, "far"), (1 / 3, "mid"), (2 / 3, "near"))
+    for left, side in ((0.0, "left"), (0.5, "right"))
+}
+
+
+class PlayerTracker:
+    """
+    Assigns track ids to one frame's player detections at a time.
+
+    Args:
+        fps (float): Video frame rate, to turn seconds into frames.
+        high_conf, low_conf (float): See HIGH_CONF and LOW_CONF.
+        match_iou, low_conf_match_iou (float): See MATCH_IOU and LOW_CONF_MATCH_IOU. Tracks
+            last seen more than a frame ago are matched by buffered IoU, see GAP_BUFFER_PER_FRAME.
+        max_lost_seconds (float): See MAX_LOST_SECONDS.
+    """
+
+    def __init__(self, fps, high_conf=HIGH_CONF, low_conf=LOW_CONF, match_iou=MATCH_IOU,
+                 low_conf_match_iou=LOW_CONF_MATCH_IOU, max_lost_seconds=MAX_LOST_SECONDS):
+        self.high_conf = high_conf
+        self.low_conf = low_conf
+        self.match_iou = match_iou
+        self.low_conf_match_iou = low_conf_match_iou
+        self.max_lost_frames = max(1, round(max_lost_seconds * (fps or 30)))
+        self._next_id = 0
+        # Live tracks: id -> {"box": (cx, cy, w, h), "velocity": (vx, vy) per frame, "last_frame"}
+        self._tracks = {}
+
+    @property
+    def tracks_started(self):
+        """Track ids handed out so far (ids are 0 .. tracks_started - 1)."""
+        return self._next_id
+
+    def _continue_track(self, track_id, frame, box):
+        track = self._tracks[track_id]
+        elapsed = frame - track["last_frame"]
+        old_cx, old_cy = track["box"][:2]
+        vx, vy = track["velocity"]
+        track["velocity"] = (
+            VELOCITY_SMOOTHING * (box[0] - old_cx) / elapsed + (1 - VELOCITY_SMOOTHING) * vx,
+            VELOCITY_SMOOTHING * (box[1] - old_cy) / elapsed + (1 - VELOCITY_SMOOTHING) * vy,
+        )
+        track["box"] = box
+        track["last_frame"] = frame
+
+    def _match(self, track_ids, frame, corners, detections, min_iou):
+        """
+        Greedy one-to-one matching of tracks to detections, highest (buffered) IoU first.
+
+        Args:
+            corners (list): (x1, y1, x2, y2, area) per detection of the frame.
+
+        Returns:
+            list: (track_id, detection index) pairs.
+        """
+        candidates = []
+        for track_id in track_ids:
+            track = self._tracks[track_id]
+            elapsed = frame - track["last_frame"]
+            cx, cy, w, h = track["box"]
+            vx, vy = track["velocity"]
+            cx += vx * elapsed
+            cy += vy * elapsed
+            pad_x = pad_y = 0.0
+            if elapsed > 1:
+                buffer = min(MAX_GAP_BUFFER, GAP_BUFFER_PER_FRAME * (elapsed - 1))
+                pad_x = buffer * w + abs(vx) * (elapsed - 1)
+                pad_y = buffer * h + abs(vy) * (elapsed - 1)
+                w += 2 * pad_x
+                h += 2 * pad_y
+            left, top, right, bottom = cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2
+            for detection in detections:
+                x1, y1, x2, y2, area = corners[detection]
+                if pad_x or pad_y: # The same padding on both boxes, so an exact prediction keeps IoU 1
+                    x1, y1, x2, y2 = x1 - pad_x, y1 - pad_y, x2 + pad_x, y2 + pad_y
+                    area = (x2 - x1) * (y2 - y1)
+                if x1 >= right or x2 <= left or y1 >= bottom or y2 <= top:
+                    continue # No overlap, the common case
+                overlap_w = (right if right < x2 else x2) - (left if left > x1 else x1)
+                overlap_h = (bottom if bottom < y2 else y2) - (top if top > y1 else y1)
+                intersection = overlap_w * overlap_h
+                iou = intersection / (w * h + area - intersection)
+                if iou >= min_iou:
+                    candidates.append((iou, track_id, detection))
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        pairs, used_tracks, used_detections = [], set(), set()
+        for _, track_id, detection in candidates:
+            if track_id not in used_tracks and detection not in used_detections:
+                used_tracks.add(track_id)
+                used_detections.add(detection)
+                pairs.append((track_id, detection))
+        return pairs
+
+    def update(self, frame, x, y, w, h, conf):
+        """
+        Matches one frame's detections to the tracks.
+
+        Args:
+            frame (int): Frame number; frames must come in increasing order (skipping is fine).
+            x, y, w, h, conf (array): The frame's player boxes (centre, size) and confidences.
+
+        Returns:
+            np.ndarray: int32 track id per detection, -1 for low-confidence detections that
+                        matched no track.
+        """
+        boxes = list(zip(*(np.asarray(column).tolist() for column in (x, y, w, h))))
+        corners = [(cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2, bw * bh) for cx, cy, bw, bh in boxes]
+        conf = np.asarray(conf).tolist()
+        ids = [-1] * len(boxes)
+        for track_id in [track_id for track_id, track in self._tracks.items()
+                         if frame - track["last_frame"] > self.max_lost_frames]:
+            del self._tracks[track_id]
+        high = [i for i, c in enumerate(conf) if c >= self.high_conf]
+        low = [i for i, c in enumerate(conf) if self.low_conf <= c < self.high_conf]
+
+        unmatched_tracks = [track_id for track_id, track in self._tracks.items() if track["last_frame"] < frame]
+        for detections, min_iou in ((high, self.match_iou), (low, self.low_conf_match_iou)):
+            if not unmatched_tracks or not detections:
+                continue
+            for track_id, detection in self._match(unmatched_tracks, frame, corners, detections, min_iou):
+                ids[detection] = track_id
+                self._continue_track(track_id, frame, boxes[detection])
+            unmatched_tracks = [track_id for track_id in unmatched_tracks if self._tracks[track_id]["last_frame"] < frame]
+
+        for detection in high:
+            if ids[detection] < 0:
+                ids[detection] = self._next_id
+                self._tracks[self._next_id] = {"box": boxes[detection], "velocity": (0.0, 0.0), "last_frame": frame}
+                self._next_id += 1
+        return np.asarray(ids, dtype=np.int32)
+
+
+class PlayerStats:
+    """
+    Per-player distance, speed and zone occupancy, accumulated frame by frame.
+
+    Args:
+        fps (float): Video frame rate.
+        video_dimensions (dict): {"width", "height"}, for the zones.
+        zones (dict): {name: (left, top, right, bottom)} fractions of the frame, see COURT_ZONES.
+        max_gap_seconds (float): Longest gap between two detections of a player that counts as
+            time on court (sampled runs only infer some frames); see MAX_LOST_SECONDS.
+    """
+
+    def __init__(self, fps, video_dimensions, zones=COURT_ZONES, max_gap_seconds=MAX_LOST_SECONDS):
+        self.fps = fps or 30
+        self.width = max(1, video_dimensions.get("width") or 1)
+        self.height = max(1, video_dimensions.get("height") or 1)
+        self.zone_names = list(zones)
+        self._zone_bounds = [
+            (left * self.width, top * self.height, right * self.width, bottom * self.height)
+            for left, top, right, bottom in zones.values()
+        ]
+        self.max_gap_frames = max(1, round(max_gap_seconds * self.fps))
+        self.step_frames = max(1, round(DISTANCE_STEP_SECONDS * self.fps))
+        self._players = {} # track id -> running totals, see _start
+
+    def _zone(self, x, y):
+        for index, (left, top, right, bottom) in enumerate(self._zone_bounds):
+            if left <= x < right and top <= y < bottom:
+                return index
+        return None
+
+    def _start(self, frame, x, y):
+        return {
+            "first_frame": frame,
+            "last_frame": frame,
+            "position": (x, y), # Smoothed, see POSITION_SMOOTHING
+            "step_start": (x, y, frame), # Smoothed position and frame the current step started at
+            "distance": 0.0,
+            "tracked_frames": 1,
+            "speed": None, # Smoothed, see SPEED_SMOOTHING
+            "max_speed": 0.0,
+            "zone_frames": [0] * len(self.zone_names),
+        }
+
+    def update(self, frame, track_ids, x, y):
+        """Adds one frame's tracked detections (track ids from PlayerTracker.update; -1 is skipped)."""
+        for track_id, px, py in zip(np.asarray(track_ids).tolist(), np.asarray(x).tolist(), np.asarray(y).tolist()):
+            if track_id < 0:
+                continue
+            player = self._players.get(track_id)
+            if player is None:
+                player = self._players[track_id] = self._start(frame, px, py)
+                frames = 1
+            else:
+                elapsed = frame - player["last_frame"]
+                if elapsed <= 0:
+                    continue # A second detection of the same track in one frame
+                frames = min(elapsed, self.max_gap_frames)
+                old_x, old_y = player["position"]
+                new_x = POSITION_SMOOTHING * px + (1 - POSITION_SMOOTHING) * old_x
+                new_y = POSITION_SMOOTHING * py + (1 - POSITION_SMOOTHING) * old_y
+                player["position"] = (new_x, new_y)
+                step_x, step_y, step_frame = player["step_start"]
+                if frame - step_frame >= self.step_frames:
+                    step = math.hypot(new_x - step_x, new_y - step_y)
+                    player["distance"] += step
+                    speed = step * self.fps / (frame - step_frame)
+                    if player["speed"] is not None:
+                        speed = SPEED_SMOOTHING * speed + (1 - SPEED_SMOOTHING) * player["speed"]
+                    player["speed"] = speed
+                    player["max_speed"] = max(player["max_speed"], speed)
+                    player["step_start"] = (new_x, new_y, frame)
+                player["tracked_frames"] += frames
+                player["last_frame"] = frame
+            zone = self._zone(px, py)
+            if zone is not None:
+                player["zone_frames"][zone] += frames
+
+    def span_frames(self, track_id):
+        """Frames from a track's first to its last detection."""
+        player = self._players[track_id]
+        return player["last_frame"] - player["first_frame"]
+
+    def track_ids(self):
+        return list(self._players)
+
+    def summary(self, track_ids=None, labels=None):
+        """
+        Per-player summaries.
+
+        Args:
+            track_ids (list, optional): Tracks to include, in order (default: all, by id).
+            labels (dict, optional): {track id: id to report}, e.g. after renumbering.
+
+        Returns:
+            list: Per player: track_id, first/last frame and time, tracked_seconds, distance_px,
+                  avg_speed_px_s, max_speed_px_s and zone_seconds ({zone: seconds}).
+        """
+        track_ids = sorted(self._players) if track_ids is None else track_ids
+        labels = labels or {}
+        players = []
+        for track_id in track_ids:
+            player = self._players[track_id]
+            tracked_seconds = player["tracked_frames"] / self.fps
+            players.append({
+                "track_id": labels.get(track_id, track_id),
+                "first_frame": player["first_frame"],
+                "last_frame": player["last_frame"],
+                "first_time": round((player["first_frame"] - 1) / self.fps, 3),
+                "last_time": round((player["last_frame"] - 1) / self.fps, 3),
+                "tracked_seconds": round(tracked_seconds, 3),
+                "distance_px": round(player["distance"], 1),
+                "avg_speed_px_s": round(player["distance"] / tracked_seconds, 1) if tracked_seconds else 0.0,
+                "max_speed_px_s": round(player["max_speed"], 1),
+                "zone_seconds": {
+                    name: round(frames / self.fps, 3) for name, frames in zip(self.zone_names, player["zone_frames"])
+                },
+            })
+        return players
+
+
+def frame_groups(frames):
+    """(start, end) row slices of each frame's rows in frame-sorted columns."""
+    if len(frames) == 0:
+        return []
+    boundaries = (np.flatnonzero(np.diff(frames)) + 1).tolist()
+    return list(zip([0] + boundaries, boundaries + [len(frames)]))
+
+
+def track_players(player_detections, fps, video_dimensions, min_track_seconds=MIN_TRACK_SECONDS):
+    """
+    Tracks the players of a whole video and summarizes each one's movement.
+
+    Args:
+        player_detections (dict): player_detections columns (see result_store.py), in frame order.
+        fps (float): Video frame rate.
+        video_dimensions (dict): {"width", "height"}.
+        min_track_seconds (float): See MIN_TRACK_SECONDS.
+
+    Returns:
+        tuple: (player_detections with track_id filled in, players). Kept tracks are numbered
+               0, 1, ... by first appearance and detections of dropped tracks get -1; players
+               is PlayerStats.summary for the kept tracks.
+    """
+    frames = player_detections["frame"]
+    tracker = PlayerTracker(fps)
+    stats = PlayerStats(fps, video_dimensions)
+    raw_ids = np.full(len(frames), -1, dtype=np.int32)
+    for start, end in frame_groups(frames):
+        frame = int(frames[start])
+        rows = slice(start, end)
+        ids = tracker.update(
+            frame, player_detections["x"][rows], player_detections["y"][rows],
+            player_detections["w"][rows], player_detections["h"][rows], player_detections["conf"][rows],
+        )
+        raw_ids[rows] = ids
+        stats.update(frame, ids, player_detections["x"][rows], player_detections["y"][rows])
+
+    # Tracker ids are handed out in order of first appearance, so keeping the long tracks in id
+    # order numbers them by first appearance too
+    min_span = min_track_seconds * (fps or 30)
+    kept = [track_id for track_id in sorted(stats.track_ids()) if stats.span_frames(track_id) >= min_span]
+    relabel = np.full(tracker.tracks_started + 1, -1, dtype=np.int32) # Index -1 (untracked) maps to -1
+    relabel[kept] = np.arange(len(kept), dtype=np.int32)
+    labels = {track_id: label for label, track_id in enumerate(kept)}
+    return {**player_detections, "track_id": relabel[raw_ids]}, stats.summary(kept, labels)
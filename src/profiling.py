@@ -0,0 +1,58 @@
+# Save this as profiling.py (next to analyze_video.py)
+"""
+Small profiling helpers for the analysis: named wall-clock timers and the
+process's peak resident set size (RSS).
+
+Timers accumulate into a plain {name: seconds} dict, so timings from several
+places (or several segments) can simply be added together. Peak RSS comes from
+/proc/self/status (VmHWM) on Linux, where it can also be reset between jobs of
+a long-lived process, and from getrusage() elsewhere.
+"""
+import contextlib
+import sys
+import time
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+_PROC_STATUS_PATH = "/proc/self/status"
+_PROC_CLEAR_REFS_PATH = "/proc/self/clear_refs"
+
+
+@contextlib.contextmanager
+def timed(timings, name):
+    """Adds the wall-clock time spent in the `with` block to timings[name]."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process in bytes, or None where it can't be read."""
+    try:
+        with open(_PROC_STATUS_PATH, "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024 # Reported in kB
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def reset_peak_rss():
+    """
+    Resets the peak RSS to the current RSS, so a long-lived process (a resident model server
+    or a pool process) reports the peak of its current job rather than of its whole life.
+    Only possible on Linux; elsewhere the peak keeps covering earlier jobs.
+    """
+    with contextlib.suppress(OSError):
+        with open(_PROC_CLEAR_REFS_PATH, "w") as f:
+            f.write("5")
@@ -0,0 +1,285 @@
+# Save this as remote_worker.py (next to analyze_video.py, on each extra worker host)
+"""
+Runs analysis jobs from another host's queue, so a backfill (see batch_scheduler.py)
+can be spread over several machines.
+
+The worker claims jobs from the server's /api/workers endpoints (see app.py), analyses
+them in resident model processes (see model_server.py) and uploads the results. Its
+progress reports renew its lease on each job. If the worker stops reporting, for
+example because it crashed or lost the network, the job goes back to the server's
+queue when the lease runs out. A worker never decodes more videos at once than its
+--max-decodes. Jobs with segment workers count once per segment.
+
+The recordings must be readable from the worker host. Use --path-map when they are
+mounted somewhere else than on the server.
+
+Usage:
+    ANALYSIS_WORKER_TOKEN=... python remote_worker.py --server http://analysis-host:5000 \\
+        --workers 2 --max-decodes 4 --path-map C:/Users/kashi/Downloads=/mnt/recordings
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from checkpoints import prune_checkpoints, recording_is_final
+from job_queue import LeaseLost
+from model_server import ResidentAnalyzer
+from result_store import result_paths, save_results
+
+TOKEN_ENV_VAR = "ANALYSIS_WORKER_TOKEN"
+DEFAULT_CHECKPOINTS_DIR = "worker_checkpoints"
+
+
+class ServerClient:
+    """
+    The worker side of the /api/workers endpoints.
+
+    Args:
+        server (str): Base URL of the server, e.g. http://analysis-host:5000.
+        token (str): The server's ANALYSIS_WORKER_TOKEN.
+        host (str): Name this worker reports as.
+        timeout (float): Seconds to wait for each request.
+    """
+
+    def __init__(self, server, token, host, timeout=30):
+        self.base_url = server.rstrip("/") + "/api/workers"
+        self.headers = {"Authorization": f"Bearer {token}", "X-Worker-Host": host}
+        self.timeout = timeout
+
+    def _request(self, method, path, body=None, upload_path=None):
+        headers = dict(self.headers)
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        upload = open(upload_path, "rb") if upload_path else None
+        if upload is not None:
+            data = upload
+            headers["Content-Type"] = "application/octet-stream"
+            headers["Content-Length"] = str(os.path.getsize(upload_path))
+        request = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                payload = response.read()
+        except urllib.error.HTTPError as e:
+            message = e.read().decode(errors="replace").strip()
+            if e.code == 409:
+                raise LeaseLost(message)
+            raise RuntimeError(f"{method} {path} failed with HTTP {e.code}: {message}")
+        finally:
+            if upload is not None:
+                upload.close()
+        return json.loads(payload) if payload else None
+
+    def claim(self, slots, max_decodes):
+        """The next job for this host, or None."""
+        return self._request("POST", "/claim", {"slots": slots, "max_decodes": max_decodes})
+
+    def report(self, job_id, frames_done=None, frames_total=None):
+        """Reports progress and renews the lease; returns True if the job was cancelled."""
+        response = self._request("POST", f"/jobs/{job_id}/progress",
+                                 {"frames_done": frames_done, "frames_total": frames_total})
+        return response["cancel_requested"]
+
+    def complete(self, job_id, results_base, summary):
+        """Uploads the results' columns, then completes the job with their summary."""
+        self._request("PUT", f"/jobs/{job_id}/columns", upload_path=result_paths(results_base)[1])
+        self._request("POST", f"/jobs/{job_id}/complete", summary)
+
+    def fail(self, job_id, error, cancelled=False):
+        self._request("POST", f"/jobs/{job_id}/fail", {"error": error, "cancelled": cancelled})
+
+
+class RemoteWorker:
+    """
+    A pool of worker threads, each with its own resident model process, claiming jobs from
+    the server until stopped.
+
+    Args:
+        client (ServerClient): Connection to the server.
+        workers (int): Jobs run at once.
+        max_decodes (int): Cap on videos decoded at once on this host.
+        path_map (list): (server prefix, local prefix) pairs applied to video paths.
+        checkpoints_dir (str): Where jobs keep their checkpoints (see checkpoints.py).
+        poll_interval (float): Seconds between claims while the server has no work.
+    """
+
+    def __init__(self, client, workers=1, max_decodes=1, path_map=(), checkpoints_dir=DEFAULT_CHECKPOINTS_DIR,
+                 poll_interval=5.0):
+        self.client = client
+        self.workers = max(1, int(workers))
+        self.max_decodes = max(1, int(max_decodes))
+        self.path_map = list(path_map)
+        self.checkpoints_dir = os.path.abspath(checkpoints_dir)
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    def local_path(self, video_path):
+        for server_prefix, local_prefix in self.path_map:
+            if video_path.startswith(server_prefix):
+                return local_prefix + video_path[len(server_prefix):]
+        return video_path
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"remote-worker-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Stops claiming and cancels running jobs; the server requeues them when their lease runs out."""
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _worker_loop(self):
+        analyzer = ResidentAnalyzer()
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    job = self.client.claim(self.workers, self.max_decodes)
+                except Exception as e:
+                    print(f"Claiming a job failed: {e}", file=sys.stderr)
+                    job = None
+                if job is None:
+                    self._stop_event.wait(self.poll_interval)
+                    continue
+                self._run_job(job, analyzer)
+        finally:
+            analyzer.close()
+
+    def _job_options(self, job):
+        """The job's analysis options, with a checkpoint directory on this host if it checkpoints."""
+        options = dict(job["options"])
+        if options.get("checkpoint_frames"):
+            options["checkpoint_dir"] = os.path.join(self.checkpoints_dir, os.path.basename(job["session_id"]))
+        else:
+            options.pop("checkpoint_frames", None)
+        return options
+
+    def _run_job(self, job, analyzer):
+        """Analyses one claimed job and hands its results (or its failure) back to the server."""
+        from analyze_video import AnalysisCancelled
+
+        job_id = job["job_id"]
+        report_interval = max(1.0, job["lease_seconds"] / 4)
+        progress = [None, None]
+        state = {"last_report": time.monotonic(), "lease_lost": False}
+
+        def update_progress(frames_done, frames_total):
+            progress[:] = [frames_done, frames_total]
+
+        def should_cancel():
+            if self._stop_event.is_set():
+                return True
+            if time.monotonic() - state["last_report"] < report_interval:
+                return False
+            state["last_report"] = time.monotonic()
+            try:
+                return self.client.report(job_id, *progress)
+            except LeaseLost:
+                state["lease_lost"] = True # Requeued by the server (or removed); drop it
+                return True
+            except Exception as e:
+                print(f"Progress report for job {job_id} failed: {e}", file=sys.stderr)
+                return False # Keep going; the lease covers a few missed reports
+
+        results_dir = tempfile.mkdtemp(prefix="pickleball_worker_")
+        try:
+            results = analyzer.analyze(
+                self.local_path(job["video_path"]), progress_callback=update_progress,
+                should_cancel=should_cancel, options=self._job_options(job),
+            )
+            results_base = os.path.join(results_dir, "results")
+            summary = save_results(results, results_base)
+            self.client.complete(job_id, results_base, summary)
+            self._retire_checkpoints(job)
+        except AnalysisCancelled:
+            if not state["lease_lost"] and not self._stop_event.is_set():
+                self._fail(job_id, "Cancelled", cancelled=True)
+        except LeaseLost:
+            print(f"Job {job_id} is no longer held by this worker; results dropped", file=sys.stderr)
+        except Exception as e:
+            print(f"Job {job_id} for {job['session_id']} failed: {e}", file=sys.stderr)
+            self._fail(job_id, str(e))
+        finally:
+            shutil.rmtree(results_dir, ignore_errors=True)
+
+    def _retire_checkpoints(self, job):
+        """Like AnalysisJobQueue._retire_checkpoints, for this host's checkpoints."""
+        try:
+            options = self._job_options(job)
+            if "checkpoint_dir" in options and recording_is_final(self.local_path(job["video_path"])):
+                shutil.rmtree(options["checkpoint_dir"], ignore_errors=True)
+            prune_checkpoints(self.checkpoints_dir)
+        except Exception as e:
+            print(f"Pruning checkpoints after {job['session_id']} failed: {e}", file=sys.stderr)
+
+    def _fail(self, job_id, error, cancelled=False):
+        try:
+            self.client.fail(job_id, error, cancelled=cancelled)
+        except Exception as e:
+            print(f"Reporting job {job_id} as failed did not work: {e}", file=sys.stderr)
+
+
+def parse_path_map(values):
+    """["C:/videos=/mnt/videos", ...] -> [("C:/videos", "/mnt/videos"), ...]"""
+    pairs = []
+    for value in values:
+        server_prefix, separator, local_prefix = value.partition("=")
+        if not separator:
+            raise argparse.ArgumentTypeError(f"--path-map expects SERVER_PREFIX=LOCAL_PREFIX, got {value!r}")
+        pairs.append((server_prefix, local_prefix))
+    return pairs
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Run analysis jobs from another host's queue.")
+    parser.add_argument("--server", required=True, help="Base URL of the analysis server, e.g. http://analysis-host:5000")
+    parser.add_argument("--token", default=os.environ.get(TOKEN_ENV_VAR),
+                        help=f"The server's worker token (default: ${TOKEN_ENV_VAR})")
+    parser.add_argument("--host", default=socket.gethostname(), help="Name to report as (default: the host name)")
+    parser.add_argument("--workers", type=int, default=1, help="Jobs to run at once (each loads its own models)")
+    parser.add_argument("--max-decodes", type=int, default=None,
+                        help="Cap on videos decoded at once (default: --workers)")
+    parser.add_argument("--path-map", action="append", default=[], metavar="SERVER_PREFIX=LOCAL_PREFIX",
+                        help="Rewrite video paths that start with SERVER_PREFIX (repeatable)")
+    parser.add_argument("--checkpoints-dir", default=DEFAULT_CHECKPOINTS_DIR,
+                        help="Where jobs keep their checkpoints on this host")
+    parser.add_argument("--poll-interval", type=float, default=5.0, help="Seconds between claims when idle")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    if not args.token:
+        print(json.dumps({"error": f"A worker token is required (--token or ${TOKEN_ENV_VAR})"}), file=sys.stderr)
+        sys.exit(1)
+    try:
+        path_map = parse_path_map(args.path_map)
+    except argparse.ArgumentTypeError as e:
+        print(json.dumps({"error": str(e)}), file=sys.stderr)
+        sys.exit(1)
+
+    worker = RemoteWorker(
+        ServerClient(args.server, args.token, args.host), workers=args.workers,
+        max_decodes=args.max_decodes or args.workers, path_map=path_map,
+        checkpoints_dir=args.checkpoints_dir, poll_interval=args.poll_interval,
+    )
+    worker.start()
+    print(f"Worker {args.host} running {worker.workers} job(s) at once for {args.server}", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        worker.stop()
@@ -0,0 +1,284 @@
+# Save this as result_cache.py (next to app.py)
+"""
+Content-addressed cache of analysis results, shared by all sessions.
+
+An entry's key hashes together:
+- a fingerprint of the video: its size plus SAMPLE_CHUNKS chunks read at evenly
+  spaced offsets, so even a multi-GB recording is fingerprinted with a few MB of
+  reads, while a re-uploaded copy of the same clip gets the same key;
+- the SHA-256 of both YOLO weight files, so updating a model invalidates its results;
+- the analysis options that change the output (not batch size, pipelining,
+  worker counts or profiling, which give identical results), and RESULTS_VERSION.
+
+Entries are result file pairs (see result_store.py) in the cache directory. A
+session is served from the cache by hard-linking (or copying, where links aren't
+supported) the entry's columns to analysis_results/<session_id>.*, so sessions
+pointing at the same footage share one analysis. The summary is copied without
+the run's own measurements (RUN_MEASUREMENTS). An SQLite index tracks entry
+sizes and last use; the least recently used entries are evicted once the cache
+is over max_bytes. Hit, miss, store and eviction counters are kept in the index.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from result_store import load_summary, result_paths
+
+# Bump when a change to the analysis code changes its results, to invalidate old entries
+RESULTS_VERSION = 3
+
+# Video fingerprint: number and size of the sampled chunks
+SAMPLE_CHUNKS = 16
+SAMPLE_CHUNK_BYTES = 64 * 1024
+
+# Options that only change how fast an analysis runs, not its results
+EXECUTION_OPTIONS = ("batch_size", "pipelined", "pipeline_queue_size", "workers", "checkpoint_dir", "profile")
+
+# Summary entries that measure the run that made the results (see analyze_video.build_profile),
+# not the results themselves; a session served from the cache doesn't get another job's timings
+RUN_MEASUREMENTS = ("profile", "stage_stats")
+
+COUNTERS = ("hits", "misses", "stores", "evictions")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    size_bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_cache_entries_lru ON cache_entries (last_used_at);
+CREATE TABLE IF NOT EXISTS cache_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# Weight digests by (path, size, mtime), so each weight file is hashed once per version
+_weight_digests = {}
+_weight_digests_lock = threading.Lock()
+
+
+def video_fingerprint(video_path, chunks=SAMPLE_CHUNKS, chunk_bytes=SAMPLE_CHUNK_BYTES):
+    """Hash of a video's size and evenly spaced sampled chunks (the whole file if it is small)."""
+    size = os.path.getsize(video_path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=20)
+    with open(video_path, "rb") as f:
+        if size <= chunks * chunk_bytes:
+            digest.update(f.read())
+        else:
+            # First and last chunks included: containers keep their headers/indexes there
+            for i in range(chunks):
+                f.seek((size - chunk_bytes) * i // (chunks - 1))
+                digest.update(f.read(chunk_bytes))
+    return digest.hexdigest()
+
+
+def weights_digest(path):
+    """SHA-256 of a model weight file, or None if it doesn't exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    version = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _weight_digests_lock:
+        if version in _weight_digests:
+            return _weight_digests[version]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    with _weight_digests_lock:
+        _weight_digests[version] = digest.hexdigest()
+    return _weight_digests[version]
+
+
+def default_model_paths():
+    """Absolute paths of the weight files analyze_video.py loads."""
+    # Imported here so importing this module doesn't pull in OpenCV
+    import analyze_video
+    script_dir = os.path.dirname(os.path.abspath(analyze_video.__file__))
+    return (
+        os.path.join(script_dir, analyze_video.PLAYER_MODEL_PATH),
+        os.path.join(script_dir, analyze_video.BALL_MODEL_PATH),
+    )
+
+
+def model_loader():
+    """The alternative model loader analyze_video.get_models uses instead of the weights, or None."""
+    import analyze_video
+    return os.environ.get(analyze_video.MODEL_LOADER_ENV) or None
+
+
+def _link_or_copy(source, destination):
+    """Puts a copy of `source` at `destination` (replacing it), as a hard link where possible."""
+    temp_path = f"{destination}.tmp"
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(temp_path)
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        shutil.copyfile(source, temp_path)
+    os.replace(temp_path, destination)
+
+
+def _write_summary_without_measurements(entry_base, results_base):
+    """Writes an entry's summary to <results_base>.json, minus RUN_MEASUREMENTS."""
+    summary = {key: value for key, value in load_summary(entry_base).items() if key not in RUN_MEASUREMENTS}
+    summary_path = result_paths(results_base)[0]
+    temp_path = f"{summary_path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(summary, f)
+    os.replace(temp_path, summary_path)
+
+
+class ResultCache:
+    """
+    Analysis results cache in a directory.
+
+    Args:
+        cache_dir (str): Directory holding the entries and the index database.
+        max_bytes (int): Total size of the entries above which the least recently used are evicted.
+        model_paths (tuple, optional): (player weights, ball weights). Defaults to the paths
+            analyze_video.py uses.
+    """
+
+    def __init__(self, cache_dir, max_bytes, model_paths=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_bytes)
+        self._model_paths = model_paths
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, "index.sqlite3")
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            conn.executemany("INSERT OR IGNORE INTO cache_counters (name) VALUES (?)", [(c,) for c in COUNTERS])
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # Same pattern as job_queue.py: a short-lived autocommit connection per operation
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def _increment(self, conn, counter, amount=1):
+        conn.execute("UPDATE cache_counters SET value = value + ? WHERE name = ?", (amount, counter))
+
+    def _entry_base(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def key_for(self, video_path, options=None):
+        """
+        Cache key of analysing `video_path` with `options` (analyze_pickleball_video keywords).
+        """
+        if self._model_paths is None:
+            self._model_paths = default_model_paths()
+        player_weights, ball_weights = self._model_paths
+        key_material = {
+            "version": RESULTS_VERSION,
+            "video": video_fingerprint(video_path),
+            "player_weights": weights_digest(player_weights),
+            "ball_weights": weights_digest(ball_weights),
+            "options": {
+                name: value for name, value in sorted((options or {}).items())
+                if name not in EXECUTION_OPTIONS and value is not None
+            },
+        }
+        loader = model_loader()
+        if loader is not None:
+            key_material["model_loader"] = loader # Only when set, so weight-based keys stay as they were
+        from model_backends import backend_config # Imported here: model_backends pulls in OpenCV
+        backend = backend_config()
+        if backend is not None:
+            key_material["model_backend"] = backend # ONNX/OpenVINO (and INT8) detections differ slightly
+        return hashlib.sha256(json.dumps(key_material, sort_keys=True).encode()).hexdigest()
+
+    def restore(self, key, results_base, count_miss=True):
+        """
+        Copies a cached entry to `results_base` (e.g. analysis_results/<session_id>).
+
+        Args:
+            count_miss (bool): Count a miss in the counters. Pass False for a check that a
+                later one (e.g. the job's own) will repeat.
+
+        Returns:
+            bool: True on a hit.
+        """
+        entry_base = self._entry_base(key)
+        with self._connect() as conn:
+            row = conn.execute("SELECT key FROM cache_entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                try:
+                    # Columns first, summary last: the summary marks the results as complete
+                    _link_or_copy(result_paths(entry_base)[1], result_paths(results_base)[1])
+                    _write_summary_without_measurements(entry_base, results_base)
+                except FileNotFoundError:
+                    row = None # Evicted or removed by hand since the lookup
+            if row is None:
+                if count_miss:
+                    self._increment(conn, "misses")
+                return False
+            conn.execute(
+                "UPDATE cache_entries SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (time.time(), key)
+            )
+            self._increment(conn, "hits")
+        return True
+
+    def store(self, key, results_base):
+        """Adds the results at `results_base` to the cache, then evicts down to max_bytes."""
+        entry_base = self._entry_base(key)
+        for source, destination in zip(result_paths(results_base)[::-1], result_paths(entry_base)[::-1]):
+            _link_or_copy(source, destination)
+        size = sum(os.path.getsize(path) for path in result_paths(entry_base))
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO cache_entries (key, size_bytes, created_at, last_used_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET size_bytes = excluded.size_bytes, last_used_at = excluded.last_used_at",
+                (key, size, now, now),
+            )
+            self._increment(conn, "stores")
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            total = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM cache_entries").fetchone()[0]
+            evicted = []
+            for row in conn.execute("SELECT key, size_bytes FROM cache_entries ORDER BY last_used_at ASC"):
+                if total <= self.max_bytes:
+                    break
+                evicted.append(row["key"])
+                total -= row["size_bytes"]
+            conn.executemany("DELETE FROM cache_entries WHERE key = ?", [(key,) for key in evicted])
+            self._increment(conn, "evictions", len(evicted))
+            conn.execute("COMMIT")
+        # Sessions served from an evicted entry keep their own links/copies of its files
+        for key in evicted:
+            for path in result_paths(self._entry_base(key)):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+
+    def stats(self):
+        """Counters plus the current number and total size of entries."""
+        with self._connect() as conn:
+            stats = {row["name"]: row["value"] for row in conn.execute("SELECT name, value FROM cache_counters")}
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM cache_entries").fetchone()
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+            "hit_rate": round(stats["hits"] / lookups, 4) if lookups else None,
+        })
+        return stats
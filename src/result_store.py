@@ -0,0 +1,215 @@
+# Save this as result_store.py (next to analyze_video.py)
+"""
+On-disk format of analysis results.
+
+Per-detection data (one row per player or ball detection) is kept as NumPy
+columns rather than a list of {"x", "y", "conf"} dicts, and is stored apart
+from the rest of the results:
+
+- <base>.npz  - the columns, one uncompressed .npy member per column, named
+                "<table>.<field>" (e.g. "player_detections.x"), and any grids
+                (GRID_TABLES) such as the pre-aggregated heatmaps.
+- <base>.json - everything else (shots, rallies, stats, ...), plus a
+                "columns" entry listing each table's row count and fields.
+
+The JSON summary stays small however long the video is, so the results
+endpoint can serve it without touching the detections. Because the .npz
+members are stored uncompressed, load_columns can memory-map them, so reading
+a few columns (or a frame range of them) doesn't load the whole file.
+"""
+import json
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+# Column tables and their field dtypes. Rows are in frame order.
+# Player rows keep their box size (w, h) for tracking; track_id is the player's identity
+# across frames (see player_tracking.py), -1 for detections that belong to no kept track.
+COLUMN_DTYPES = {
+    "player_detections": {
+        "frame": np.int32,
+        "x": np.int32,
+        "y": np.int32,
+        "w": np.int32,
+        "h": np.int32,
+        "conf": np.float32,
+        "interpolated": np.bool_,
+        "track_id": np.int32,
+    },
+    "ball_detections": {
+        "frame": np.int32,
+        "x": np.int32,
+        "y": np.int32,
+        "conf": np.float32,
+    },
+}
+
+# Tables of named N-d arrays (not row-aligned columns), stored in the .npz the same way.
+# "heatmap_grids" holds the pre-aggregated heatmaps, see heatmap.py.
+GRID_TABLES = ("heatmap_grids",)
+
+# Size of a zip local file header before the file name and extra field
+_ZIP_LOCAL_HEADER_SIZE = 30
+
+
+def columns_from_rows(table, rows):
+    """
+    Builds a table's columns from a list of dicts, e.g. [{"frame", "x", "y", "conf"}, ...].
+    Fields missing from a row get the column's default (False, or -1 for track_id).
+    """
+    columns = {}
+    for field, dtype in COLUMN_DTYPES[table].items():
+        default = -1 if field == "track_id" else 0
+        columns[field] = np.fromiter((row.get(field, default) for row in rows), dtype=dtype, count=len(rows))
+    return columns
+
+
+def rows_from_columns(columns, fields=None):
+    """The inverse of columns_from_rows: [{field: value, ...}, ...] with plain Python values."""
+    fields = list(columns) if fields is None else fields
+    return [dict(zip(fields, values)) for values in zip(*(columns[field].tolist() for field in fields))]
+
+
+def result_paths(base):
+    """(summary_path, columns_path) for a results base path such as analysis_results/<session_id>."""
+    return f"{base}.json", f"{base}.npz"
+
+
+def split_results(results):
+    """
+    Splits a results dict into (summary, columns).
+
+    Returns:
+        tuple: The JSON-serializable summary, with a "columns" entry describing the tables,
+               and {table: {field: array}}.
+    """
+    array_tables = (*COLUMN_DTYPES, *GRID_TABLES)
+    summary = {key: value for key, value in results.items() if key not in array_tables}
+    columns = {table: results[table] for table in array_tables if table in results}
+    summary["columns"] = {
+        table: {
+            "rows": len(next(iter(fields.values()))) if fields else 0,
+            "fields": {field: np.dtype(array.dtype).name for field, array in fields.items()},
+        }
+        for table, fields in columns.items() if table in COLUMN_DTYPES
+    }
+    return summary, columns
+
+
+def to_json_compatible(results):
+    """Results with every column turned into a plain list, for printing as JSON."""
+    summary, columns = split_results(results)
+    for table, fields in columns.items():
+        summary[table] = {field: array.tolist() for field, array in fields.items()}
+    return summary
+
+
+def save_results(results, base):
+    """
+    Writes <base>.npz and then <base>.json. Each file is written under a temporary name and
+    renamed into place, and the summary goes last, so a reader that finds the summary also
+    finds complete columns.
+
+    Returns:
+        dict: The summary that was written.
+    """
+    summary, columns = split_results(results)
+    summary_path, columns_path = result_paths(base)
+    arrays = {
+        f"{table}.{field}": np.ascontiguousarray(array)
+        for table, fields in columns.items() for field, array in fields.items()
+    }
+
+    temp_columns_path = f"{columns_path}.tmp"
+    with open(temp_columns_path, "wb") as f:
+        np.savez(f, **arrays) # Uncompressed (ZIP_STORED), so members can be memory-mapped
+    os.replace(temp_columns_path, columns_path)
+
+    temp_summary_path = f"{summary_path}.tmp"
+    with open(temp_summary_path, "w") as f:
+        json.dump(summary, f)
+    os.replace(temp_summary_path, summary_path)
+    return summary
+
+
+def install_results(summary, columns_file, base):
+    """
+    Like save_results, for results whose columns were already written to `columns_file` as an
+    .npz (e.g. uploaded by a remote worker host): moves the archive into place as
+    <base>.npz and then writes <base>.json.
+    """
+    summary_path, columns_path = result_paths(base)
+    if not zipfile.is_zipfile(columns_file):
+        raise ValueError("columns are not an .npz archive")
+    os.replace(columns_file, columns_path)
+
+    temp_summary_path = f"{summary_path}.tmp"
+    with open(temp_summary_path, "w") as f:
+        json.dump(summary, f)
+    os.replace(temp_summary_path, summary_path)
+    return summary
+
+
+def load_summary(base):
+    """Reads <base>.json."""
+    with open(result_paths(base)[0], "r") as f:
+        return json.load(f)
+
+
+def load_columns(base, table, fields=None, mmap=True):
+    """
+    Reads columns of one table from <base>.npz.
+
+    Args:
+        table (str): A key of COLUMN_DTYPES, e.g. "player_detections", or one of GRID_TABLES.
+        fields (list, optional): Fields to read (default: all fields in the file).
+        mmap (bool): Memory-map the columns instead of reading them into memory.
+
+    Returns:
+        dict: {field: array}. Memory-mapped arrays are read-only.
+    """
+    columns_path = result_paths(base)[1]
+    prefix = f"{table}."
+    with zipfile.ZipFile(columns_path) as archive:
+        members = {
+            info.filename[len(prefix):-len(".npy")]: info
+            for info in archive.infolist() if info.filename.startswith(prefix)
+        }
+        if fields is None:
+            fields = list(members)
+        missing = [field for field in fields if field not in members]
+        if missing:
+            raise KeyError(f"{columns_path} has no {table} fields {missing}")
+
+        if not mmap:
+            return {field: np.load(archive.open(members[field])) for field in fields}
+
+        with open(columns_path, "rb") as f:
+            return {field: _memmap_member(columns_path, f, archive, members[field]) for field in fields}
+
+
+def _memmap_member(columns_path, f, archive, info):
+    """Memory-maps one stored .npy member of an .npz file."""
+    if info.compress_type != zipfile.ZIP_STORED:
+        return np.load(archive.open(info)) # Compressed members can't be mapped
+
+    # The member's data follows its local header, whose name/extra lengths can differ from
+    # the central directory's, so read them from the local header itself.
+    f.seek(info.header_offset)
+    local_header = f.read(_ZIP_LOCAL_HEADER_SIZE)
+    name_length, extra_length = struct.unpack("<2H", local_header[26:30])
+    f.seek(info.header_offset + _ZIP_LOCAL_HEADER_SIZE + name_length + extra_length)
+
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=dtype) # mmap can't map zero bytes
+    return np.memmap(
+        columns_path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+        order="F" if fortran_order else "C",
+    )
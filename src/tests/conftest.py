@@ -0,0 +1,12 @@
+# Save this as tests/conftest.py (next to the test modules)
+"""
+Shared pytest setup: the analysis modules are plain scripts in src/, imported by
+name as app.py does, so src/ goes on the import path.
+
+    cd src
+    python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,60 @@
+# Save this as tests/test_ball_tracking.py (next to conftest.py)
+"""Tests of the ball tracker in ball_tracking.py."""
+import numpy as np
+import pytest
+
+import ball_tracking
+from ball_tracking import detect_rallies, track_ball
+
+FPS = 30.0
+
+
+def _columns(points):
+    """Ball detections columns from (frame, x, y) tuples, all confident."""
+    frames, xs, ys = zip(*points)
+    return {
+        "frame": np.array(frames, dtype=np.int32),
+        "x": np.array(xs, dtype=np.int32),
+        "y": np.array(ys, dtype=np.int32),
+        "conf": np.full(len(points), 0.9, dtype=np.float32),
+    }
+
+
+def _fast_flight(frames=range(1, 31)):
+    # A hard drive: 25 px/frame across, slowly dropping, with a pixel of detection jitter
+    return [(frame, 40 + 25 * frame + (frame % 3) - 1, 100 + frame + frame % 2) for frame in frames]
+
+
+@pytest.fixture
+def filter_calls(monkeypatch):
+    """Records the filter state every accepted detection is applied to."""
+    calls = []
+    update, reset_velocity = ball_tracking.BallKalmanFilter.update, ball_tracking.BallKalmanFilter.reset_velocity
+
+    def recording_update(self, x, y):
+        calls.append(("update", x, y, self.state.round(6).tolist(), self.covariance.round(6).tolist()))
+        update(self, x, y)
+
+    def recording_reset_velocity(self, x, y, vx, vy):
+        calls.append(("reset_velocity", x, y))
+        reset_velocity(self, x, y, vx, vy)
+
+    monkeypatch.setattr(ball_tracking.BallKalmanFilter, "update", recording_update)
+    monkeypatch.setattr(ball_tracking.BallKalmanFilter, "reset_velocity", recording_reset_velocity)
+    return calls
+
+
+def test_rejected_outlier_does_not_advance_the_filter(filter_calls):
+    clean = [point for point in _fast_flight() if point[0] != 15]
+    outlier = (15, 20, 400) # Far off, in a frame where the ball wasn't found: fails both gates
+
+    clean_tracks = track_ball(_columns(clean), FPS)
+    clean_calls = list(filter_calls)
+    filter_calls.clear()
+    tracks = track_ball(_columns(clean + [outlier]), FPS)
+
+    assert len(tracks) == 1 and np.array_equal(tracks[0], clean_tracks[0])
+    # The filter saw exactly the same predictions, so the outlier left no trace
+    assert filter_calls == clean_calls
+    assert not [call for call in filter_calls if call[0] == "reset_velocity"]
+    assert detect_rallies(_columns(clean + [outlier]), FPS) == detect_rallies(_columns(clean), FPS)
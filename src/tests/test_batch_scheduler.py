@@ -0,0 +1,95 @@
+# Save this as tests/test_batch_scheduler.py (next to conftest.py)
+"""Tests of the backfill planning functions in batch_scheduler.py."""
+import datetime
+
+import pytest
+
+from batch_scheduler import (DEFAULT_MODE_FPS, MIN_MEASURED_FRAMES, SAFETY_MARGIN, fair_order, plan_backfill,
+                             throughput_by_mode)
+
+MODE_FPS = {"full": 10.0, "sampled": 40.0}
+
+
+def _session(court_id, hour, frames=1000, day=1):
+    return {
+        "session_id": f"{court_id}-{day}-{hour}",
+        "court_id": court_id,
+        "start": datetime.datetime(2026, 5, day, hour),
+        "frames": frames,
+    }
+
+
+def _completed(mode_options, frames, seconds):
+    return {"options": mode_options, "frames_total": frames, "started_at": 1000.0, "finished_at": 1000.0 + seconds}
+
+
+def test_fair_order_round_robins_courts_oldest_first():
+    sessions = [_session("a", 9), _session("a", 8), _session("a", 10), _session("b", 11), _session("c", 7)]
+    ordered = [session["session_id"] for session in fair_order(sessions)]
+    # Courts take turns in the order of their oldest session; each court's sessions stay oldest first
+    assert ordered == ["c-1-7", "a-1-8", "b-1-11", "a-1-9", "a-1-10"]
+
+
+def test_fair_order_of_nothing():
+    assert fair_order([]) == []
+
+
+def test_throughput_by_mode_uses_defaults_until_enough_frames():
+    jobs = [_completed({}, MIN_MEASURED_FRAMES - 1, 10.0)]
+    assert throughput_by_mode(jobs) == DEFAULT_MODE_FPS
+
+
+def test_throughput_by_mode_measures_each_mode():
+    jobs = [
+        _completed({}, MIN_MEASURED_FRAMES, 500.0),
+        _completed({"sampling": None}, MIN_MEASURED_FRAMES, 1500.0), # Explicit full
+        _completed({"sampling": "adaptive"}, 2 * MIN_MEASURED_FRAMES, 100.0),
+    ]
+    fps = throughput_by_mode(jobs)
+    assert fps["full"] == pytest.approx(2 * MIN_MEASURED_FRAMES / 2000.0)
+    assert fps["sampled"] == pytest.approx(2 * MIN_MEASURED_FRAMES / 100.0)
+
+
+def test_throughput_by_mode_ignores_jobs_without_duration():
+    jobs = [
+        {"options": {}, "frames_total": 10 * MIN_MEASURED_FRAMES, "started_at": 1000.0, "finished_at": None},
+        _completed({}, 10 * MIN_MEASURED_FRAMES, 0.0),
+    ]
+    assert throughput_by_mode(jobs) == DEFAULT_MODE_FPS
+
+
+def test_plan_backfill_upgrades_everything_with_time_to_spare():
+    sessions = [_session("a", 8), _session("b", 8)]
+    plan = plan_backfill(sessions, seconds_left=10000, slots=1, mode_fps=MODE_FPS)
+    assert [job["mode"] for job in plan["jobs"]] == ["full", "full"]
+    assert plan["estimated_seconds"] == 200.0 # 2 x 1000 frames at 10 fps
+    assert plan["fits"]
+
+
+def test_plan_backfill_upgrades_in_court_fair_order():
+    # Budget 350 * 0.8 = 280 slot-seconds: all sampled costs 100, each upgrade adds 75
+    sessions = [_session("a", 8), _session("a", 9), _session("b", 10), _session("b", 11)]
+    plan = plan_backfill(sessions, seconds_left=350, slots=1, mode_fps=MODE_FPS)
+    modes = {job["session_id"]: job["mode"] for job in plan["jobs"]}
+    # Each court gets one upgrade (its oldest session) before any court gets a second
+    assert modes == {"a-1-8": "full", "b-1-10": "full", "a-1-9": "sampled", "b-1-11": "sampled"}
+    assert plan["estimated_seconds"] == 250.0
+    assert plan["estimated_seconds"] <= 350 * SAFETY_MARGIN
+    assert plan["fits"]
+
+
+def test_plan_backfill_counts_slots_and_backlog():
+    sessions = [_session("a", 8), _session("b", 8)]
+    # Budget 150 * 2 slots * 0.8 - 60 backlog = 180 slot-seconds: room for one upgrade (50 -> 125)
+    plan = plan_backfill(sessions, seconds_left=150, slots=2, mode_fps=MODE_FPS, backlog=60.0)
+    assert [job["mode"] for job in plan["jobs"]] == ["full", "sampled"]
+    # The backlog is ahead of the batch, so it counts in the wall-clock estimate
+    assert plan["estimated_seconds"] == pytest.approx((125 + 60) / 2, abs=0.1)
+
+
+def test_plan_backfill_reports_a_batch_that_cannot_fit():
+    sessions = [_session("a", 8, frames=40000)]
+    plan = plan_backfill(sessions, seconds_left=100, slots=1, mode_fps=MODE_FPS)
+    assert plan["jobs"][0]["mode"] == "sampled" # Already the fastest mode
+    assert plan["estimated_seconds"] == 1000.0
+    assert not plan["fits"]
@@ -0,0 +1,145 @@
+# Save this as tests/test_job_queue.py (next to conftest.py)
+"""Tests of job picking and remote worker leases in job_queue.py."""
+import time
+
+import numpy as np
+import pytest
+
+import job_queue
+from job_queue import JOB_COMPLETED, JOB_RUNNING, AnalysisJobQueue, LeaseLost, _pick_job
+from result_store import load_summary
+
+
+def _job(job_id, court_id="a", priority=0, created_at=0.0, deadline=None, options=None):
+    return {"id": job_id, "court_id": court_id, "priority": priority, "created_at": created_at,
+            "deadline": deadline, "options": options or {}}
+
+
+def _pick(queued, running=(), last_started=None, free_decodes=1, max_decodes=1, analysis_options=None):
+    job = _pick_job(queued, list(running), last_started or {}, free_decodes, max_decodes, analysis_options or {})
+    return job["id"] if job else None
+
+
+def test_pick_job_higher_priority_first():
+    queued = [_job("low", created_at=1.0), _job("high", priority=5, created_at=2.0)]
+    assert _pick(queued) == "high"
+
+
+def test_pick_job_court_with_fewest_running_jobs_first():
+    queued = [_job("busy-court", court_id="a", created_at=1.0), _job("idle-court", court_id="b", created_at=2.0)]
+    assert _pick(queued, running=[_job("running", court_id="a")]) == "idle-court"
+
+
+def test_pick_job_court_that_started_longest_ago_first():
+    queued = [_job("recent", court_id="a", created_at=1.0), _job("waiting", court_id="b", created_at=2.0)]
+    assert _pick(queued, last_started={"a": 200.0, "b": 100.0}) == "waiting"
+    # A court that never started a job goes before both
+    queued.append(_job("new-court", court_id="c", created_at=3.0))
+    assert _pick(queued, last_started={"a": 200.0, "b": 100.0}) == "new-court"
+
+
+def test_pick_job_earliest_deadline_then_oldest_within_a_court():
+    queued = [_job("old", created_at=1.0), _job("due-late", created_at=2.0, deadline=500.0),
+              _job("due-soon", created_at=3.0, deadline=100.0)]
+    assert _pick(queued) == "due-soon"
+    assert _pick([queued[0], _job("newer", created_at=2.0)]) == "old"
+
+
+def test_pick_job_skips_jobs_needing_more_decodes_than_free():
+    queued = [_job("parallel", priority=1, options={"workers": 4}), _job("serial", created_at=1.0)]
+    assert _pick(queued, free_decodes=2, max_decodes=8) == "serial"
+    # Segment workers are capped at max_decodes, so the job fits once that many are free
+    assert _pick(queued, free_decodes=2, max_decodes=2) == "parallel"
+    # Queue-wide options count too, under the job's own
+    assert _pick([_job("inherits")], free_decodes=1, max_decodes=4, analysis_options={"workers": 2}) is None
+
+
+def test_pick_job_nothing_queued():
+    assert _pick([]) is None
+
+
+@pytest.fixture
+def queue(tmp_path):
+    results_dir = tmp_path / "results"
+    results_dir.mkdir()
+    return AnalysisJobQueue(str(tmp_path / "jobs.sqlite3"), str(results_dir), remote_lease_seconds=60)
+
+
+def _expire_lease(queue, job_id):
+    queue._update_job(job_id, heartbeat_at=time.time() - 2 * queue.remote_lease_seconds)
+
+
+def test_expired_remote_lease_is_requeued(queue, tmp_path):
+    queue.submit("session-1", str(tmp_path / "session-1.mp4"), court_id="a")
+    job = queue.claim_remote("host-a")
+    assert job["session_id"] == "session-1"
+    queue.report_remote(job["id"], "host-a", frames_done=50, frames_total=100)
+    assert queue.get_job("session-1")["host"] == "host-a"
+    # Held under a live lease: another host gets nothing
+    assert queue.claim_remote("host-b") is None
+
+    _expire_lease(queue, job["id"])
+    reclaimed = queue.claim_remote("host-b")
+    assert reclaimed["id"] == job["id"]
+    stored = queue.get_job("session-1")
+    assert (stored["status"], stored["host"]) == (JOB_RUNNING, "host-b")
+    assert stored["frames_done"] == 0 # Restarted from scratch on the new host
+
+
+def test_late_host_loses_its_lease(queue, tmp_path):
+    queue.submit("session-1", str(tmp_path / "session-1.mp4"))
+    job = queue.claim_remote("host-a")
+    _expire_lease(queue, job["id"])
+    assert queue.claim_remote("host-b")["id"] == job["id"]
+
+    summary = {"total_shots": 0, "sampling": {"frames_total": 100}}
+    with pytest.raises(LeaseLost):
+        queue.complete_remote(job["id"], "host-a", summary)
+    with pytest.raises(LeaseLost):
+        queue.report_remote(job["id"], "host-a", frames_done=100, frames_total=100)
+    with pytest.raises(LeaseLost):
+        queue.fail_remote(job["id"], "host-a", "too late")
+    # The new holder is unaffected
+    assert queue.report_remote(job["id"], "host-b", frames_done=10, frames_total=100) is False
+    assert queue.get_job("session-1")["status"] == JOB_RUNNING
+
+
+def _upload_columns(queue, job_id, host):
+    with open(queue.uploaded_columns_path(job_id, host), "wb") as f:
+        np.savez(f, **{"ball_detections.frame": np.arange(3, dtype=np.int32)})
+
+
+def test_lease_running_out_while_completing_does_not_requeue(queue, tmp_path, monkeypatch):
+    queue.submit("session-1", str(tmp_path / "session-1.mp4"))
+    job = queue.claim_remote("host-a")
+    _upload_columns(queue, job["id"], "host-a")
+
+    install_results = job_queue.install_results
+    claims_while_installing = []
+
+    def slow_install(summary, columns_file, base):
+        # The lease runs out after the check, while the results are being moved into place
+        monkeypatch.setattr(queue, "remote_lease_seconds", -1)
+        claims_while_installing.append(queue.claim_remote("host-b"))
+        return install_results(summary, columns_file, base)
+
+    monkeypatch.setattr(job_queue, "install_results", slow_install)
+    queue.complete_remote(job["id"], "host-a", {"total_shots": 3, "sampling": {"frames_total": 100}})
+
+    assert claims_while_installing == [None]
+    stored = queue.get_job("session-1")
+    assert (stored["status"], stored["host"]) == (JOB_COMPLETED, "host-a")
+    assert load_summary(str(tmp_path / "results" / "session-1"))["total_shots"] == 3
+
+
+def test_failed_install_keeps_the_lease_running(queue, tmp_path):
+    queue.submit("session-1", str(tmp_path / "session-1.mp4"))
+    job = queue.claim_remote("host-a")
+    with open(queue.uploaded_columns_path(job["id"], "host-a"), "wb") as f:
+        f.write(b"not an archive")
+    with pytest.raises(ValueError):
+        queue.complete_remote(job["id"], "host-a", {"total_shots": 3})
+    # Still held, and requeued as usual once the lease runs out
+    assert queue.get_job("session-1")["status"] == JOB_RUNNING
+    _expire_lease(queue, job["id"])
+    assert queue.claim_remote("host-b")["id"] == job["id"]
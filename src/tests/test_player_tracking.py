@@ -0,0 +1,60 @@
+# Save this as tests/test_player_tracking.py (next to conftest.py)
+"""Tests of player tracking over sampled frames in player_tracking.py."""
+import numpy as np
+import pytest
+
+from benchmark import SYNTHETIC_FPS, _court_to_pixels, _scene_at
+from frame_sampling import IDLE_STRIDE
+from player_tracking import track_players
+
+WIDTH, HEIGHT = 640, 360
+FRAMES = 300 # One rally plus its idle stretch, see benchmark._scene_at
+# Box size the stub player model finds at 640x360 (benchmark.synthesize_video's rectangles)
+BOX_W, BOX_H = WIDTH // 40, HEIGHT // 10
+
+
+def _detections(frames, jitter=2, seed=0):
+    """player_detections columns of the benchmark's four players on `frames`, with box jitter."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for frame in frames:
+        players, _ = _scene_at(frame - 1, SYNTHETIC_FPS) # Frame numbers start at 1
+        for x, y in players:
+            cx, cy = _court_to_pixels(x, y, WIDTH, HEIGHT)
+            rows.append((frame, cx, cy - BOX_H // 2, BOX_W, BOX_H))
+    columns = dict(zip(("frame", "x", "y", "w", "h"), np.array(rows, dtype=np.int32).T))
+    columns["x"] += rng.integers(-jitter, jitter + 1, len(rows)).astype(np.int32)
+    columns["y"] += rng.integers(-jitter, jitter + 1, len(rows)).astype(np.int32)
+    columns["conf"] = np.full(len(rows), 0.9, dtype=np.float32)
+    return columns
+
+
+def _idle_throughout():
+    return list(range(1, FRAMES + 1, IDLE_STRIDE))
+
+
+def _rallies_and_idle_stretches():
+    # Like the adaptive sampler's output: every frame while there is motion, every
+    # IDLE_STRIDE-th frame for a while in between
+    frames = []
+    for start in range(1, FRAMES + 1, 75):
+        frames.extend(range(start, min(start + 45, FRAMES + 1)))
+        frames.extend(range(start + 45 + IDLE_STRIDE - 1, min(start + 75, FRAMES + 1), IDLE_STRIDE))
+    return frames
+
+
+@pytest.mark.parametrize("thinning", [_idle_throughout, _rallies_and_idle_stretches])
+@pytest.mark.parametrize("seed", range(3))
+def test_sampled_frames_keep_one_track_per_player(thinning, seed):
+    frames = thinning()
+    detections = _detections(frames, seed=seed)
+    columns, players = track_players(detections, SYNTHETIC_FPS, {"width": WIDTH, "height": HEIGHT})
+    assert len(players) == 4
+    assert all((player["first_frame"], player["last_frame"]) == (frames[0], frames[-1]) for player in players)
+    assert (columns["track_id"] >= 0).all()
+
+
+def test_every_frame_keeps_one_track_per_player():
+    detections = _detections(range(1, FRAMES + 1))
+    _, players = track_players(detections, SYNTHETIC_FPS, {"width": WIDTH, "height": HEIGHT})
+    assert len(players) == 4
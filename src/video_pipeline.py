@@ -0,0 +1,285 @@
+# Save this as video_pipeline.py (next to analyze_video.py)
+"""
+Frame decoding and the decode -> inference -> aggregation loop used by
+analyze_pickleball_video, in two flavours:
+
+- run_serial: all three stages one after the other on the calling thread.
+- run_pipelined: a decoder thread, an inference thread and aggregation on the
+  calling thread, joined by bounded queues. A full queue blocks the stage
+  feeding it (backpressure), so at most `queue_size` batches are in flight.
+
+Both feed the aggregation callback the same batches in the same order, so
+their results are identical. Each stage records its own timings in a
+StageStats so the slowest stage can be identified.
+"""
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class StageStats:
+    """
+    Timings of one pipeline stage.
+
+    busy_seconds is time spent doing the stage's own work; blocked_seconds is time
+    spent waiting on its input or output queue. The bottleneck stage is the one with
+    the lowest fps (highest busy time) and the least blocked time.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.max_queue_depth = 0 # Deepest its input queue got (pipelined mode only)
+
+    def merge(self, other):
+        """Adds another StageStats of the same stage (e.g. from another segment) into this one."""
+        self.frames += other.frames
+        self.batches += other.batches
+        self.busy_seconds += other.busy_seconds
+        self.blocked_seconds += other.blocked_seconds
+        self.max_queue_depth = max(self.max_queue_depth, other.max_queue_depth)
+
+    def as_dict(self):
+        return {
+            "frames": self.frames,
+            "batches": self.batches,
+            "busy_seconds": round(self.busy_seconds, 4),
+            "blocked_seconds": round(self.blocked_seconds, 4),
+            "fps": round(self.frames / self.busy_seconds, 2) if self.busy_seconds > 0 else None,
+            "max_queue_depth": self.max_queue_depth,
+        }
+
+
+# Pipeline stages, timed by run_serial/run_pipelined
+PIPELINE_STAGES = ("decode", "inference", "aggregation")
+# Parts of those stages, timed by the infer/aggregate callbacks: each model's predict() calls
+# (inference) and turning the models' boxes into detections (aggregation). Their busy time is
+# included in the enclosing stage's; they never block.
+SUB_STAGES = ("player_model", "ball_model", "box_conversion")
+
+
+def new_stage_stats():
+    """Returns the {stage name: StageStats} dict filled in by run_serial/run_pipelined and the callbacks."""
+    return {name: StageStats(name) for name in (*PIPELINE_STAGES, *SUB_STAGES)}
+
+
+class FrameBatchReader:
+    """
+    Decodes consecutive frames of an opened cv2.VideoCapture into (batch_size, H, W, 3) buffers.
+
+    The frame shape is taken from the first decoded frame, since container metadata can be wrong.
+    Frame numbers are 1-based from the start of the video, like the rest of the analysis code.
+
+    Args:
+        cap (cv2.VideoCapture): Capture positioned at frame `start_frame` (0-based).
+        batch_size (int): Rows per buffer.
+        start_frame (int): Index of the next frame `cap` will return, for frame numbering.
+        max_frames (int, optional): Stop after this many frames instead of at the end of the video.
+    """
+
+    def __init__(self, cap, batch_size, start_frame=0, max_frames=None):
+        self.cap = cap
+        self.batch_size = max(1, int(batch_size))
+        self.start_frame = start_frame
+        self.max_frames = max_frames
+        self.frames_read = 0
+        ret, first_frame = cap.read() if max_frames != 0 else (False, None)
+        self._pending_frame = first_frame if ret else None
+        self.frame_shape = first_frame.shape if ret else None
+        self.frame_dtype = first_frame.dtype if ret else np.uint8
+
+    def new_buffer(self):
+        """Allocates one batch buffer, or None if the video has no frames."""
+        if self.frame_shape is None:
+            return None
+        return np.empty((self.batch_size,) + self.frame_shape, dtype=self.frame_dtype)
+
+    def read_into(self, buffer):
+        """
+        Fills `buffer` with the next frames.
+
+        Returns:
+            tuple: (batch_start, count) - the frame number of buffer[0] and how many rows
+                   were filled (less than the buffer length only at the end of the video).
+        """
+        batch_start = self.start_frame + self.frames_read + 1
+        limit = len(buffer)
+        if self.max_frames is not None:
+            limit = min(limit, self.max_frames - self.frames_read)
+        count = 0
+        if self._pending_frame is not None and limit > 0:
+            buffer[0] = self._pending_frame
+            self._pending_frame = None
+            count = 1
+        while count < limit:
+            row = buffer[count]
+            ret, frame = self.cap.read(row)
+            if not ret:
+                break
+            if not np.shares_memory(frame, row):
+                # OpenCV allocated a new array (e.g. resolution change mid-stream); copy it in
+                row[...] = frame
+            count += 1
+        self.frames_read += count
+        return batch_start, count
+
+
+def run_serial(reader, infer_batch, aggregate_batch, stats):
+    """
+    Runs decode, inference and aggregation one after the other on this thread.
+
+    Args:
+        reader (FrameBatchReader): Source of frame batches.
+        infer_batch (callable): infer_batch(batch_start, frames) -> inference output for the batch.
+        aggregate_batch (callable): aggregate_batch(batch_start, count, inference_output).
+        stats (dict): From new_stage_stats(), updated in place.
+    """
+    buffer = reader.new_buffer()
+    if buffer is None:
+        return
+    while True:
+        started = time.perf_counter()
+        batch_start, count = reader.read_into(buffer)
+        record_stage(stats["decode"], count, started)
+        if count == 0:
+            return
+
+        started = time.perf_counter()
+        output = infer_batch(batch_start, buffer[:count])
+        record_stage(stats["inference"], count, started)
+
+        started = time.perf_counter()
+        aggregate_batch(batch_start, count, output)
+        record_stage(stats["aggregation"], count, started)
+
+
+# Queue sentinel marking the end of the stream
+_END = object()
+
+
+class _StageFailed:
+    """Carries an exception from a worker stage to the aggregating thread."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def run_pipelined(reader, infer_batch, aggregate_batch, stats, queue_size=4):
+    """
+    Runs decode and inference on their own threads and aggregation on this one.
+
+    Same arguments as run_serial, plus `queue_size`: the capacity of each queue between
+    stages. Frame buffers are recycled through a pool of queue_size + 2 buffers, so memory
+    stays bounded whichever stage is slow. If aggregate_batch raises (e.g. a cancelled
+    analysis), the worker threads are stopped before the exception propagates.
+    """
+    first_buffer = reader.new_buffer()
+    if first_buffer is None:
+        return
+    queue_size = max(1, int(queue_size))
+
+    stop_event = threading.Event()
+    free_buffers = queue.Queue()
+    decoded = queue.Queue(maxsize=queue_size)
+    inferred = queue.Queue(maxsize=queue_size)
+    free_buffers.put(first_buffer)
+    for _ in range(queue_size + 1):
+        free_buffers.put(reader.new_buffer())
+
+    def decode_stage():
+        try:
+            while True:
+                buffer = _get(free_buffers, stop_event, stats["decode"])
+                if buffer is _END:
+                    return
+                started = time.perf_counter()
+                batch_start, count = reader.read_into(buffer)
+                record_stage(stats["decode"], count, started)
+                if count == 0:
+                    _put(decoded, _END, stop_event, stats["decode"])
+                    return
+                _put(decoded, (batch_start, count, buffer), stop_event, stats["decode"])
+        except Exception as e:
+            _put(decoded, _StageFailed(e), stop_event, stats["decode"])
+
+    def inference_stage():
+        try:
+            while True:
+                stats["inference"].max_queue_depth = max(stats["inference"].max_queue_depth, decoded.qsize())
+                item = _get(decoded, stop_event, stats["inference"])
+                if item is _END or isinstance(item, _StageFailed):
+                    _put(inferred, item, stop_event, stats["inference"])
+                    return
+                batch_start, count, buffer = item
+                started = time.perf_counter()
+                output = infer_batch(batch_start, buffer[:count])
+                record_stage(stats["inference"], count, started)
+                free_buffers.put(buffer) # Detections don't need the pixels any more
+                _put(inferred, (batch_start, count, output), stop_event, stats["inference"])
+        except Exception as e:
+            _put(inferred, _StageFailed(e), stop_event, stats["inference"])
+
+    workers = [
+        threading.Thread(target=decode_stage, name="analysis-decode", daemon=True),
+        threading.Thread(target=inference_stage, name="analysis-inference", daemon=True),
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        while True:
+            stats["aggregation"].max_queue_depth = max(stats["aggregation"].max_queue_depth, inferred.qsize())
+            item = _get(inferred, stop_event, stats["aggregation"])
+            if item is _END:
+                break
+            if isinstance(item, _StageFailed):
+                raise item.error
+            batch_start, count, output = item
+            started = time.perf_counter()
+            aggregate_batch(batch_start, count, output)
+            record_stage(stats["aggregation"], count, started)
+    finally:
+        stop_event.set()
+        for worker in workers:
+            worker.join()
+
+
+def record_stage(stage_stats, count, started):
+    """Adds the time since `started` (a perf_counter() value) and `count` frames to a StageStats."""
+    stage_stats.busy_seconds += time.perf_counter() - started
+    if count:
+        stage_stats.frames += count
+        stage_stats.batches += 1
+
+
+def _get(q, stop_event, stage_stats, poll_interval=0.1):
+    """Blocking get that gives up (returning _END) once stop_event is set."""
+    started = time.perf_counter()
+    try:
+        while not stop_event.is_set():
+            try:
+                return q.get(timeout=poll_interval)
+            except queue.Empty:
+                continue
+        return _END
+    finally:
+        stage_stats.blocked_seconds += time.perf_counter() - started
+
+
+def _put(q, item, stop_event, stage_stats, poll_interval=0.1):
+    """Blocking put that gives up once stop_event is set."""
+    started = time.perf_counter()
+    try:
+        while not stop_event.is_set():
+            try:
+                q.put(item, timeout=poll_interval)
+                return
+            except queue.Full:
+                continue
+    finally:
+        stage_stats.blocked_seconds += time.perf_counter() - started